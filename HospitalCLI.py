@@ -1,18 +1,41 @@
+import argparse
+import sys
 import uuid
-import json
-from main import AppointmentScheduler, Doctor, Patient, Appointment, DataManager
+from datetime import date
+from archive import AppointmentArchive
+from main import (AppointmentScheduler, AvailabilityRule, Doctor, Patient, Appointment, DataManager,
+                  canonical_date, canonical_time, Waitlist)
+from storage import JSONStorage, SQLiteStorage
+import metrics
 
 def generate_short_id():
     """Generate a short ID (11 characters)."""
     return str(uuid.uuid4())[:11]
 
+def read_date(prompt: str, blank_ok: bool = False) -> str:
+    """Ask for a date and return it canonical (YYYY-MM-DD). Raises ValueError if it is invalid."""
+    value = input(prompt).strip()
+    if not value and blank_ok:
+        return ""
+    return canonical_date(value)
+
+def read_time(prompt: str) -> str:
+    """Ask for a time and return it canonical ("9:00 AM"). Raises ValueError if it is invalid."""
+    return canonical_time(input(prompt).strip())
+
 class HospitalCLI:
     """A class to handle the command-line interface for the Hospital Appointment System."""
+
+    SLOTS_PER_PAGE = 10  # How many of the soonest slots to offer when booking
+    PAGE_SIZE = 20  # Rows per page in the listings
+    SEARCH_RESULTS = 10  # How many of the best matches a search shows
     
-    def __init__(self, scheduler):
+    def __init__(self, scheduler, storage=None):
         # Initialize the scheduler and data manager
         self.scheduler = scheduler
         self.data_manager = DataManager()
+        # Where data is loaded from and every change is written to (JSON files + journal by default)
+        self.storage = storage if storage is not None else JSONStorage()
         # Load data from JSON files when the program starts
         self.load_data()
 
@@ -35,7 +58,12 @@ class HospitalCLI:
         print("4. Add Doctor Availability Slot")
         print("5. List registered Patients")
         print("6. List registered Doctors")
-        print("7. Back to Main Menu")
+        print("7. Archive Past Appointments")
+        print("8. View Archived Appointments")
+        print("9. Add Recurring Doctor Availability")
+        print("10. Search Patients")
+        print("11. Search Doctors")
+        print("12. Back to Main Menu")
 
     def display_user_menu(self):
         """Display the user menu options."""
@@ -50,7 +78,7 @@ class HospitalCLI:
     # Core Functionality
     # --------------------------
     def add_patient(self):
-        """Add a new patient to the system and save to JSON."""
+        """Add a new patient to the system; the scheduler's storage backend persists it."""
         print("\n--- Add Patient ---")
         # Collect patient details from user input
         name = input("Name: ").strip()
@@ -58,41 +86,28 @@ class HospitalCLI:
         age = int(input("Age: ").strip())
         gender = input("Gender: ").strip()
         card_no = input("Card Number: ").strip()
-        dob = input("Date of Birth (YYYY-MM-DD): ").strip()
+        # Card numbers must be unique (O(1) check against the scheduler's index)
+        if self.scheduler.get_patient_by_card_no(card_no):
+            print("Error: Card number already exists!")
+            return
+        try:
+            dob = read_date("Date of Birth (YYYY-MM-DD): ")
+        except ValueError as error:
+            print(error)
+            return
         specialization = input("Specialization of Doctor Needed: ").strip()
 
         # Create a new Patient object
         patient = Patient(name, contact_info, age, gender, card_no, dob, specialization)
         
-        # Save patient data to JSON
-        patient_data = {
-            "name": name,
-            "contact_info": contact_info,
-            "age": age,
-            "gender": gender,
-            "card_no": card_no,
-            "date_of_birth": dob,
-            "Specialization of Doctor Needed": specialization,
-            "patient_id": patient.person_id
-        }
-        
+        # Add the patient to the scheduler; this appends a single record to the
+        # journal (or database) instead of rewriting the whole of patients.json.
+        # It raises ValueError if another process (or the service) registered the card meanwhile
         try:
-            # Append the new patient to the JSON file
-            with open('patients.json', 'r+') as f:
-                data = json.load(f)
-                if any(p['patient_id'] == patient.person_id for p in data):
-                    print("Error: Card number already exists!")
-                    return
-                data.append(patient_data)
-                f.seek(0)
-                json.dump(data, f, indent=4)
-        except FileNotFoundError:
-            # Create a new JSON file if it doesn't exist
-            with open('patients.json', 'w') as f:
-                json.dump([patient_data], f, indent=4)
-        
-        # Add the patient to the scheduler
-        self.scheduler.add_patient(patient)
+            self.scheduler.add_patient(patient)
+        except ValueError:
+            print("Error: Card number already exists!")
+            return
         print(f"Patient added! ID: {patient.person_id}")
     
     def add_doctor(self):
@@ -114,74 +129,228 @@ class HospitalCLI:
     def add_doctor_slot(self):
         """Add an availability slot for a doctor."""
         print("\n--- Add Doctor Availability ---")
-        # Get the doctor ID from user input
-        doctor_id = input("Doctor ID: ").strip()
-        # Find the doctor in the scheduler
-        doctor = next((d for d in self.scheduler.doctors if d.person_id == doctor_id), None)
+        # Find the doctor by ID, or by searching for what was typed
+        doctor = self.choose_person("doctor", input("Doctor ID or name: ").strip())
         
         if not doctor:
             print("Doctor not found!")
             return
         
         # Collect slot details from user input
-        date = input("Date (YYYY-MM-DD): ").strip()
-        time = input("Time (HH:MM AM/PM): ").strip()
+        try:
+            date = read_date("Date (YYYY-MM-DD): ")
+            time = read_time("Time (HH:MM AM/PM): ")
+        except ValueError as error:
+            print(error)
+            return
         # Add the slot to the doctor's schedule
-        doctor.add_available_slot(date, time)
+        self.scheduler.add_doctor_slot(doctor, date, time)
         print("Slot added!")
 
+    def add_doctor_rule(self):
+        """Add recurring availability for a doctor, e.g. Mon-Fri 9:00 AM to 5:00 PM every 20 minutes."""
+        print("\n--- Add Recurring Doctor Availability ---")
+        doctor = self.choose_person("doctor", input("Doctor ID or name: ").strip())
+        if not doctor:
+            print("Doctor not found!")
+            return
+
+        # Collect the rule from user input
+        first_date = input("From date (YYYY-MM-DD): ").strip()
+        last_date = input("Until date (YYYY-MM-DD): ").strip()
+        weekdays = input("Days (e.g. Mon-Fri or Mon,Wed,Fri): ").strip()
+        start_time = input("Start time (HH:MM AM/PM): ").strip()
+        end_time = input("End time (HH:MM AM/PM): ").strip()
+        every = input("Minutes between slots: ").strip()
+        except_dates = input("Except dates (YYYY-MM-DD, comma-separated, blank for none): ").strip()
+        try:
+            rule = AvailabilityRule(first_date, last_date, weekdays, start_time, end_time, int(every),
+                                    [d.strip() for d in except_dates.split(",") if d.strip()])
+        except ValueError as error:
+            print(f"Invalid rule: {error}")
+            return
+        if self.scheduler.add_availability_rule(doctor, rule):
+            print(f"Availability added: {rule}")
+        else:
+            print("The doctor already has this availability.")
+
+    @staticmethod
+    def person_row(person) -> str:
+        """One line describing a patient or doctor, as search results show them."""
+        if isinstance(person, Doctor):
+            return (f"ID: {person.person_id} | Name: Dr. {person.name} | Specialization: {person.specialization} | "
+                    f"Contact: {person.contact_info}")
+        return f"ID: {person.person_id} | Name: {person.name} | Contact: {person.contact_info} | Card No: {person.card_no}"
+
+    def search_people(self, kind: str):
+        """Search patients or doctors by part of a name, phone number, card number or specialization."""
+        print(f"\n--- Search {kind.title()}s ---")
+        query = input("Name, phone or card number: " if kind == "patient" else "Name, phone or specialization: ")
+        search = self.scheduler.search_patients if kind == "patient" else self.scheduler.search_doctors
+        # Ranked: exact words first, then the closest partial matches and misspellings
+        people = search(query, self.SEARCH_RESULTS)
+        if not people:
+            print(f"No matching {kind}s.")
+            return
+        sys.stdout.write("".join(self.person_row(person) + "\n" for person in people))
+
+    def choose_person(self, kind: str, answer: str):
+        """
+        The patient or doctor an answer refers to: the one with that exact ID, or else one the user
+        picks from the search results for it. Returns None if nothing matches or nothing is picked.
+        """
+        if kind == "patient":
+            person, search = self.find_patient(answer), self.scheduler.search_patients
+        else:
+            person, search = self.scheduler.get_doctor(answer), self.scheduler.search_doctors
+        if person is not None or not answer:
+            return person
+        matches = search(answer, self.SEARCH_RESULTS)
+        if not matches:
+            return None
+        print(f"\nMatching {kind}s:")
+        for number, match in enumerate(matches, 1):
+            print(f"{number}. {self.person_row(match)}")
+        choice = input("Choose a number (blank to cancel): ").strip()
+        if not choice:
+            return None
+        try:
+            number = int(choice)
+        except ValueError:
+            number = 0
+        if not 1 <= number <= len(matches):
+            print("Invalid Selection")
+            return None
+        return matches[number - 1]
+
+    def show_pages(self, fetch, format_row, empty_message: str):
+        """
+        Print a listing a page at a time, each page with a single write. fetch(cursor) returns
+        (rows, cursor of the next page or None); a page is only fetched when the user asks for it.
+        """
+        cursor, first = None, True
+        while True:
+            rows, cursor = fetch(cursor)
+            if rows:
+                sys.stdout.write("\n".join(map(format_row, rows)) + "\n")
+            elif first:
+                print(empty_message)
+            first = False
+            if cursor is None:
+                return
+            if input("Press Enter for more, or q to stop: ").strip().lower() == "q":
+                return
+
     def list_patients(self):
         """List all patients in the system."""
         print("\n--- Patients List ---")
-        # Print each patient's ID and name
-        for patient in self.scheduler.patients:
-            print(f"ID: {patient.person_id} | Name: {patient.name} | Specialization of doctor needed: {patient.required_specialization}")
+        # Print each patient's ID and name, a page at a time
+        self.show_pages(
+            lambda cursor: self.scheduler.page_patients(self.PAGE_SIZE, cursor),
+            lambda patient: (f"ID: {patient.person_id} | Name: {patient.name} | "
+                             f"Specialization of doctor needed: {patient.required_specialization}"),
+            "No patients registered."
+        )
 
     def list_doctors(self):
         """List all doctors in the system."""
         print("\n --- Doctors List ---")
-        # Print each doctor's ID, name, and specialization
-        for doctor in self.scheduler.doctors:
-            print(f" ID: {doctor.person_id} | Name: Dr. {doctor.name} | Specialization: {doctor.specialization}")
+        # Print each doctor's ID, name, and specialization, a page at a time
+        self.show_pages(
+            lambda cursor: self.scheduler.page_doctors(self.PAGE_SIZE, cursor),
+            lambda doctor: f" ID: {doctor.person_id} | Name: Dr. {doctor.name} | Specialization: {doctor.specialization}",
+            "No doctors registered."
+        )
+
     def view_appointments(self):
-        """View all appointments in the system."""
+        """View all appointments in the system, optionally of one doctor or date range."""
         print("\n--- All Appointments ---")
-        # Display all appointments using the scheduler
-        self.scheduler.view_appointments()
+        try:
+            start_date = read_date("From (YYYY-MM-DD, blank for the beginning): ", blank_ok=True)
+            end_date = read_date("To (YYYY-MM-DD, blank for no limit): ", blank_ok=True)
+        except ValueError as error:
+            print(error)
+            return
+        doctor_id = input("Doctor ID (blank for all doctors): ").strip() or None
+        # Served from the scheduler's indexes, in date order, a page at a time
+        self.show_pages(
+            lambda cursor: self.scheduler.page_appointments(self.PAGE_SIZE, cursor, start_date=start_date,
+                                                            end_date=end_date, doctor_id=doctor_id),
+            Appointment.summary,
+            "No appointments found."
+        )
+
+    def archive_appointments(self):
+        """Move past appointments out of the active set into the monthly archive."""
+        print("\n--- Archive Past Appointments ---")
+        before = input("Archive appointments before (YYYY-MM-DD, blank for today): ").strip()
+        try:
+            archived = self.storage.archive(self.scheduler, before or date.today().isoformat())
+        except ValueError as error:
+            print(error)
+            return
+        except NotImplementedError:
+            print("This storage backend can't archive appointments.")
+            return
+        print(f"Archived {archived} appointment(s).")
+
+    def view_archived_appointments(self):
+        """View archived appointments; only the archive files of the requested months are read."""
+        print("\n--- Archived Appointments ---")
+        try:
+            start_date = read_date("From (YYYY-MM-DD, blank for the beginning): ", blank_ok=True)
+            end_date = read_date("To (YYYY-MM-DD, blank for no limit): ", blank_ok=True)
+        except ValueError as error:
+            print(error)
+            return
+        patient_id = input("Patient ID (blank for all patients): ").strip() or None
+        records = AppointmentArchive().query(start_date, end_date, patient_id=patient_id)
+        for record in records:
+            print(f"{record['date']} {record['time']} | Patient ID: {record['patient_id']} | "
+                  f"Doctor ID: {record['doctor_id']} | {record['status']} [ID: {record['appointment_id']}]")
+        if not records:
+            print("No archived appointments found.")
 
     def view_my_appointments(self, patient_id):
         """View appointments for a specific patient."""
         print("\n--- Your Appointments ---")
-        # Filter appointments for the given patient ID
-        appointments = [a for a in self.scheduler.appointments 
-                        if a.patient.person_id == patient_id]
-        # Print each appointment
-        for appt in appointments:
-            print(appt)
+        # Look up appointments for the given patient ID and print them, soonest first
+        self.show_pages(
+            lambda cursor: self.scheduler.page_appointments(self.PAGE_SIZE, cursor, patient_id=patient_id),
+            Appointment.summary,
+            "You have no appointments."
+        )
+        entry = self.scheduler.get_waitlist_entry(patient_id)
+        if entry:
+            print(f"You are on the {entry['specialization']} waitlist (priority {entry['priority']}) "
+                  f"since {entry['since']}.")
 
     def book_appointment(self, patient_id):
         """Book an appointment for a patient."""
         print("\n--- Book Appointment ---")
         
         # Find the patient by ID
-        patient = next((p for p in self.scheduler.patients if p.person_id == patient_id), None)
+        patient = self.scheduler.get_patient(patient_id)
         
         if not patient:
             print("Patient not found! Please check the patient ID.")
             return
         
-        # Get available slots for the required specialization
-        doctors = self.scheduler.find_doctors_by_specialization(patient.required_specialization)
-        available_slots = []
-        
-        # Collect all available slots from matching doctors
-        for doctor in doctors:
-            for slot in doctor.get_schedule():
-                available_slots.append((doctor, slot))
-                print(f"{len(available_slots)}. Dr. {doctor.name} | {slot['date']} {slot['time']}")
+        # Get the soonest available slots for the required specialization
+        try:
+            earliest_date = read_date("Earliest date (YYYY-MM-DD, blank for any): ", blank_ok=True)
+        except ValueError as error:
+            print(error)
+            return
+        available_slots = self.scheduler.find_next_available(
+            patient.required_specialization, after_date=earliest_date, limit=self.SLOTS_PER_PAGE
+        )
+        for idx, (doctor, slot) in enumerate(available_slots):
+            print(f"{idx+1}. Dr. {doctor.name} | {slot['date']} {slot['time']}")
 
         if not available_slots:
             print("No available slots!")
+            self.join_waitlist(patient)
             return
 
         try:
@@ -190,25 +359,35 @@ class HospitalCLI:
             doctor, slot = available_slots[choice]
             
             # Create and book the appointment
-            appointment = Appointment(patient, doctor, slot['date'], slot['time'])
-            self.scheduler.appointments.append(appointment)
-            doctor.remove_slot(slot['date'], slot['time'])
-            patient.appointments.append({
-                'date': slot['date'],
-                'time': slot['time'],
-                'doctor': doctor.name
-            })
-            print("Appointment booked!")
+            if self.scheduler.book_appointment(patient, doctor, slot['date'], slot['time']):
+                print("Appointment booked!")
+            else:
+                print("Sorry, that slot was just taken. Please choose another one.")
         except (ValueError, IndexError):
             print("Invalid selection!")
 
+    def join_waitlist(self, patient):
+        """Offer a patient who found no free slot a place on their specialization's waitlist."""
+        if input("Join the waitlist for the next free slot? (y/N): ").strip().lower() != "y":
+            return
+        answer = input(f"Priority (1 urgent - 5 routine, blank for {Waitlist.DEFAULT_PRIORITY}): ").strip()
+        try:
+            priority = int(answer) if answer else Waitlist.DEFAULT_PRIORITY
+            if not 1 <= priority <= 5:
+                raise ValueError
+        except ValueError:
+            print("Invalid priority!")
+            return
+        self.scheduler.join_waitlist(patient, priority)
+        print(f"You are on the {patient.required_specialization} waitlist. "
+              "The next slot that frees up will be booked for you.")
+
     def cancel_appointment(self, patient_id):
         """Cancel an appointment for a patient."""
         print("\n--- Cancel Appointment ---")
         # Find cancellable appointments for the patient
-        appointments = [a for a in self.scheduler.appointments 
-                        if a.patient.person_id == patient_id 
-                        and a.status == "Scheduled"]
+        appointments = [a for a in self.scheduler.get_patient_appointments(patient_id)
+                        if a.status == "Scheduled"]
         
         if not appointments:
             print("No cancellable appointments!")
@@ -232,9 +411,8 @@ class HospitalCLI:
         """Reschedule an appointment for a patient."""
         print("\n--- Reschedule Appointment ---")
         # Find reschedulable appointments for the patient
-        appointments = [a for a in self.scheduler.appointments 
-                        if a.patient.person_id == patient_id 
-                        and a.status == "Scheduled"]
+        appointments = [a for a in self.scheduler.get_patient_appointments(patient_id)
+                        if a.status == "Scheduled"]
         
         if not appointments:
             print("No reschedulable appointments!")
@@ -250,15 +428,18 @@ class HospitalCLI:
             appt = appointments[choice]
             
             # Collect new date and time from user input
-            new_date = input("New date (YYYY-MM-DD): ").strip()
-            new_time = input("New time (HH:MM AM/PM): ").strip()
+            try:
+                new_date = read_date("New date (YYYY-MM-DD): ")
+                new_time = read_time("New time (HH:MM AM/PM): ")
+            except ValueError as error:
+                print(error)
+                return
 
             # Get the doctor's available slots 
             doctor  = appt.doctor
-            available_slots = doctor.get_schedule()
 
             # Check if the new slot is available
-            if {"date": new_date, "time": new_time} in available_slots:
+            if doctor.has_slot(new_date, new_time):
                 success = self.scheduler.reschedule_appointment(appt.appointment_id, new_date, new_time)
 
                 if success:
@@ -268,7 +449,7 @@ class HospitalCLI:
             else:
                 print(f"\nDoctor declines: Dr. {doctor.name} is not availabe at {new_date} {new_time}")
                 print("Please choose from available slots:")
-                for slot in available_slots:
+                for slot in doctor.get_schedule():
                     print(f" - {slot['date']} {slot['time']}")
         
         except (ValueError, IndexError):
@@ -289,43 +470,26 @@ class HospitalCLI:
             elif choice == "4": self.add_doctor_slot()
             elif choice == "5": self.list_patients()
             elif choice == "6": self.list_doctors()
-            elif choice == "7": break
+            elif choice == "7": self.archive_appointments()
+            elif choice == "8": self.view_archived_appointments()
+            elif choice == "9": self.add_doctor_rule()
+            elif choice == "10": self.search_people("patient")
+            elif choice == "11": self.search_people("doctor")
+            elif choice == "12": break
             else: print("Invalid choice!")
 
     def user_area(self):
         """Handle the user area menu."""
         while True:
-            patient_id = input("\nEnter Patient ID: ").strip()
-            
-            # Load patient data from JSON file
-            try:
-                with open('patients.json', 'r') as f:
-                    patients_data = json.load(f)
-            except FileNotFoundError:
-                print("Patient database not found! Please contact the administrator.")
-                return
-            except json.JSONDecodeError:
-                print("Patient database is corrupted! Please contact the administrator.")
-                return
+            answer = input("\nEnter Patient ID (or name, phone or card number): ").strip()
 
-            # Find the patient in the JSON data
-            patient_data = next((p for p in patients_data if p['patient_id'] == patient_id), None)
+            # Find the patient the scheduler already holds, by ID or by searching for what was typed
+            patient = self.choose_person("patient", answer)
             
-            if not patient_data:
+            if not patient:
                 print("Patient not found! Please try again.")
                 continue  # Allow the user to retry
             else:
-                # Create a Patient object from the JSON data
-                patient = Patient(
-                    name=patient_data['name'],
-                    contact_info=patient_data['contact_info'],
-                    age=patient_data['age'],
-                    gender=patient_data['gender'],
-                    card_no=patient_data['card_no'],
-                    date_of_birth=patient_data['date_of_birth'],
-                    required_specialization=patient_data['Specialization of Doctor Needed']
-                )
-                patient.person_id = patient_data['patient_id']  # Set the patient ID
                 break  # Exit the loop if patient is found
 
         while True:
@@ -347,23 +511,29 @@ class HospitalCLI:
             else:
                 print("Invalid choice! Please enter a number between 1 and 5.")
     
+    def find_patient(self, patient_id):
+        """
+        Look a patient up in the scheduler's in-memory store.
+        On a miss the storage backend is asked, e.g. because another process registered
+        the patient: it reads the journal's tail, queries SQLite or checks the patient store.
+        """
+        patient = self.scheduler.get_patient(patient_id)
+        if patient is None and patient_id:
+            patient = self.storage.find_patient(self.scheduler, patient_id=patient_id)
+        return patient
+
     def load_data(self):
         """
-        Load data (patients, doctors, appointments) from JSON files.
+        Load data (patients, doctors, appointments) from the storage backend.
         """
-        self.scheduler.patients = DataManager.load_patients_from_json()
-        self.scheduler.doctors = DataManager.load_doctors_from_json()
-        self.scheduler.appointments = DataManager.load_appointments_from_json(
-            self.scheduler.patients, self.scheduler.doctors
-        )
+        self.storage.load(self.scheduler)
 
     def save_data(self):
         """
-        Save data (patients, doctors, appointments) to JSON files.
+        Save data (patients, doctors, appointments) through the storage backend.
         """
-        DataManager.save_patients_to_json(self.scheduler.patients)
-        DataManager.save_doctors_to_json(self.scheduler.doctors)
-        DataManager.save_appointments_to_json(self.scheduler.appointments)
+        self.storage.save(self.scheduler)
+        self.storage.close()
 
     def run(self):
         """Run the hospital appointment system."""
@@ -380,7 +550,40 @@ class HospitalCLI:
             self.save_data()  # Save data when the program exits
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Hospital Appointment System")
+    # Use "--db hospital.db" to run against SQLite instead of the JSON files
+    parser.add_argument("--db", help="SQLite database to use instead of the JSON files")
+    # Use "--connect localhost:8765" to run as a thin client of service.py
+    parser.add_argument("--connect", metavar="HOST:PORT", help="use a running service.py instead of local data")
+    # Use "--lazy-patients" to keep patients in patients.jsonl and only parse the ones that are used
+    parser.add_argument("--lazy-patients", action="store_true", help="load patients lazily from the patients.jsonl store")
+    parser.add_argument("--metrics", metavar="PATH", help="record metrics and write them to PATH (Prometheus text) on exit")
+    parser.add_argument("--profile", metavar="ACTION", help="run cProfile around the first call of a CLI action, e.g. book_appointment")
+    parser.add_argument("--profile-output", metavar="PATH", help="also save the raw profile stats to PATH")
+    args = parser.parse_args()
+
+    if args.metrics:
+        metrics.enable(HospitalCLI)
+
     # Initialize the scheduler and CLI
     scheduler = AppointmentScheduler()
-    cli = HospitalCLI(scheduler)
-    cli.run()
\ No newline at end of file
+    storage = None
+    if args.db:
+        storage = SQLiteStorage(args.db)
+    elif args.connect:
+        from service import ServiceClient, RemoteScheduler, RemoteStorage
+        host, port = args.connect.rsplit(":", 1)
+        client = ServiceClient(host, int(port))
+        scheduler, storage = RemoteScheduler(client), RemoteStorage(client)
+    elif args.lazy_patients:
+        storage = JSONStorage(lazy_patients=True)
+    cli = HospitalCLI(scheduler, storage)
+    if args.profile:
+        if not callable(getattr(cli, args.profile, None)):
+            parser.error(f"unknown CLI action: {args.profile}")
+        metrics.profile_action(cli, args.profile, args.profile_output)
+    try:
+        cli.run()
+    finally:
+        if args.metrics:
+            metrics.write_prometheus(args.metrics)
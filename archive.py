@@ -0,0 +1,150 @@
+"""
+    Cold archive of past appointments for the Hospital Appointment System.
+
+    appointments.json and AppointmentScheduler.appointments only need the
+    appointments that are still to come. Archiving moves every appointment
+    dated before a cutoff (and any that is no longer "Scheduled") into
+    archive/appointments-YYYY-MM.json, one file per month, so startup time
+    and memory follow the upcoming appointments instead of the whole history.
+
+    JSONStorage archives as part of a journal compaction and SQLiteStorage in
+    one transaction, so what is moved is what is on disk, including other
+    processes' bookings. Each month's file is rewritten atomically and merged
+    by appointment_id, so after a crash half way through, archiving again
+    simply writes the same records again.
+
+    Queries only read the months they ask for. Appointments whose date is not
+    YYYY-MM-DD are kept in archive/appointments-undated.json.
+
+    Usage: python archive.py [--before YYYY-MM-DD] [--db hospital.db]
+"""
+import argparse
+import json
+import os
+import sys
+from datetime import date
+from typing import Dict, Iterable, List, Optional
+
+from main import AppointmentScheduler, DataLock, canonical_date, date_to_day, parse_date, time_to_minutes
+
+UNDATED = "undated"
+
+
+def cutoff_day(before: str) -> int:
+    """Day number of an archive cutoff date; raises ValueError unless it is YYYY-MM-DD."""
+    return parse_date(before)
+
+
+def is_archivable(appointment_date: str, status: str, before_day: int) -> bool:
+    """Whether an appointment belongs in the archive: it is no longer scheduled, or dated before the cutoff."""
+    if status != "Scheduled":
+        return True
+    day = date_to_day(appointment_date)
+    return day != -1 and day < before_day
+
+
+class AppointmentArchive:
+    def __init__(self, directory: str = 'archive'):
+        self.directory = directory
+
+    @staticmethod
+    def partition_of(appointment_date: str) -> str:
+        """The month ("2025-03") an appointment is archived under."""
+        return appointment_date[:7] if date_to_day(appointment_date) != -1 else UNDATED
+
+    def path(self, partition: str) -> str:
+        return os.path.join(self.directory, f"appointments-{partition}.json")
+
+    def partitions(self) -> List[str]:
+        """Every archived month, oldest first (then "undated")."""
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return []
+        partitions = [name[len("appointments-"):-len(".json")] for name in names
+                      if name.startswith("appointments-") and name.endswith(".json")]
+        return sorted(partitions, key=lambda partition: (partition == UNDATED, partition))
+
+    def _read(self, partition: str) -> List[Dict]:
+        try:
+            with open(self.path(partition), 'r') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return []
+
+    def _write(self, partition: str, records: List[Dict]):
+        # Same atomic temp file + fsync + os.replace as DataManager.write_json
+        path = self.path(partition)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(records, f, indent=4)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+    def store(self, records: Iterable[Dict]) -> int:
+        """Add appointment records (as DataManager.appointment_to_dict writes them) to their months."""
+        by_partition = {}
+        for record in records:
+            by_partition.setdefault(self.partition_of(record["date"]), []).append(record)
+        if not by_partition:
+            return 0
+        os.makedirs(self.directory, exist_ok=True)
+        with DataLock(exclusive=True):
+            for partition, new_records in by_partition.items():
+                merged = {record["appointment_id"]: record for record in self._read(partition)}
+                merged.update((record["appointment_id"], record) for record in new_records)
+                self._write(partition, sorted(merged.values(),
+                                              key=lambda record: (record["date"], time_to_minutes(record["time"]))))
+        return sum(len(new_records) for new_records in by_partition.values())
+
+    def query(self, start_date: str = "", end_date: str = "",
+              patient_id: Optional[str] = None, doctor_id: Optional[str] = None) -> List[Dict]:
+        """
+        Archived appointments from start_date to end_date (inclusive, YYYY-MM-DD, blank for no limit),
+        optionally only a patient's or a doctor's. Only the files of the months in range are read;
+        undated appointments are only included when there is no date range.
+        Raises ValueError if either date is invalid.
+        """
+        start_date = canonical_date(start_date) if start_date else ""
+        end_date = canonical_date(end_date) if end_date else ""
+        start_day = date_to_day(start_date) if start_date else -1
+        end_day = date_to_day(end_date) if end_date else sys.maxsize
+        results = []
+        with DataLock():
+            for partition in self.partitions():
+                if partition == UNDATED:
+                    if start_date or end_date:
+                        continue
+                elif (start_date and partition < start_date[:7]) or (end_date and partition > end_date[:7]):
+                    continue
+                for record in self._read(partition):
+                    if not start_day <= date_to_day(record["date"]) <= end_day:
+                        continue
+                    if patient_id is not None and record["patient_id"] != patient_id:
+                        continue
+                    if doctor_id is not None and record["doctor_id"] != doctor_id:
+                        continue
+                    results.append(record)
+        return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Move past appointments into the monthly archive.")
+    parser.add_argument("--before", default=date.today().isoformat(),
+                        help="archive appointments dated before this day (default: today)")
+    parser.add_argument("--db", help="SQLite database to use instead of the JSON files")
+    args = parser.parse_args(argv)
+    from storage import JSONStorage, SQLiteStorage  # storage.py imports this module
+    storage = SQLiteStorage(args.db) if args.db else JSONStorage()
+    scheduler = AppointmentScheduler()
+    try:
+        storage.load(scheduler)
+        archived = storage.archive(scheduler, args.before)
+        print(f"Archived {archived} appointment(s) dated before {args.before}.")
+    finally:
+        storage.close()
+
+
+if __name__ == "__main__":
+    main()
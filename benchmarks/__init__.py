@@ -0,0 +1,8 @@
+"""
+    Benchmarks for the Hospital Appointment System.
+
+    generate.py writes seeded, synthetic patients.json, doctors.json and
+    appointments.json at any scale, and harness.py times the DataManager,
+    AppointmentScheduler and HospitalCLI operations against them and writes
+    the results as JSON so runs can be compared.
+"""
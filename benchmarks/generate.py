@@ -0,0 +1,198 @@
+"""
+    Seeded generator of synthetic hospital data for the benchmarks.
+
+    Writes patients.json, doctors.json and appointments.json in the format
+    DataManager reads. Records are streamed to disk one at a time, so even
+    10M-record data sets never have to fit in memory, and the same seed and
+    sizes always produce the same files.
+
+    Every appointment uses one of its doctor's slots (which is then no longer
+    in the doctor's schedule), and its patient needs the doctor's
+    specialization, as they would in data written by the scheduler.
+
+    Usage: python -m benchmarks.generate --patients 100000 [--doctors N]
+               [--appointments N] [--slots-per-doctor N] [--seed 0] [--out bench_data]
+"""
+import argparse
+import json
+import os
+import random
+import uuid
+from datetime import date, timedelta
+
+# (specialization, relative share of patients and doctors)
+SPECIALIZATIONS = [
+    ("General Practice", 30), ("Dentist", 15), ("Pediatrics", 12), ("Cardiology", 10),
+    ("Orthopedics", 10), ("Eye Doctor", 9), ("Dermatology", 8), ("Neurology", 6),
+]
+FIRST_NAMES = ["Ada", "Ahmed", "Amara", "Chen", "Chidi", "David", "Emeka", "Fatima", "Grace", "Hannah",
+               "Ibrahim", "James", "Kemi", "Liam", "Maria", "Mohammed", "Ngozi", "Olivia", "Priya", "Samuel",
+               "Sofia", "Tunde", "Yusuf", "Zainab"]
+LAST_NAMES = ["Adeyemi", "Brown", "Chukwu", "Garcia", "Hassan", "Ibrahim", "Johnson", "Kim", "Lee", "Musa",
+              "Nwosu", "Okafor", "Patel", "Smith", "Taylor", "Williams", "Wang", "Yusuf"]
+GENDERS = ["Male", "Female"]
+FIRST_DAY = date(2025, 1, 6)  # A Monday; schedules run over the following weekdays
+# One slot every 20 minutes from 9:00 AM to 4:40 PM, written the way the CLI asks for times
+TIMES = [f"{(hour - 1) % 12 + 1}:{minute:02d} {'AM' if hour < 12 else 'PM'}"
+         for hour in range(9, 17) for minute in (0, 20, 40)]
+PATTERN_SIZE = 100  # Specializations repeat every PATTERN_SIZE patients
+
+
+def short_id(index: int, salt: int) -> str:
+    """
+    Return an ID shaped like Person.person_id ("0415760e-79") for the index-th record.
+    Multiplying by an odd constant and XORing a salt are both one-to-one on 40 bits,
+    so IDs never collide and can be recomputed from the index without storing them.
+    """
+    mixed = ((index * 0x9E3779B97F) ^ salt) & 0xFFFFFFFFFF
+    digits = f"{mixed:010x}"
+    return f"{digits[:8]}-{digits[8:]}"
+
+
+class JSONArrayWriter:
+    """Write a JSON array one record at a time, indented like DataManager.write_json."""
+
+    def __init__(self, path: str):
+        self.file = open(path, 'w')
+        self.count = 0
+
+    def write(self, record):
+        text = json.dumps(record, indent=4).replace("\n", "\n    ")
+        self.file.write(("[\n    " if self.count == 0 else ",\n    ") + text)
+        self.count += 1
+
+    def close(self):
+        self.file.write("\n]\n" if self.count else "[]\n")
+        self.file.close()
+
+
+class HospitalDataGenerator:
+    def __init__(self, patients: int, doctors: int = None, appointments: int = None,
+                 slots_per_doctor: int = None, seed: int = 0):
+        self.patients = patients
+        self.doctors = doctors if doctors is not None else max(1, patients // 200)
+        self.appointments = appointments if appointments is not None else patients
+        if self.appointments and not (self.patients and self.doctors):
+            raise ValueError("Appointments need at least one patient and one doctor.")
+        # By default half of every doctor's slots are booked
+        self.slots_per_doctor = slots_per_doctor or max(len(TIMES), -(-2 * self.appointments // self.doctors))
+        if self.slots_per_doctor * self.doctors < self.appointments:
+            raise ValueError("Not enough slots for the requested number of appointments.")
+        self.seed = seed
+
+        # Specialization of patient i is pattern[i % PATTERN_SIZE]; doctors use the same shares
+        pattern = [name for name, share in SPECIALIZATIONS for _ in range(share)]
+        random.Random(seed).shuffle(pattern)
+        self.pattern = pattern
+        self.positions = {}  # specialization -> offsets in the pattern
+        for offset, name in enumerate(pattern):
+            self.positions.setdefault(name, []).append(offset)
+
+    def patient_id(self, index: int) -> str:
+        return short_id(index, self.seed * 2 + 1)
+
+    def doctor_id(self, index: int) -> str:
+        return short_id(index, self.seed * 2 + 2)
+
+    def generate(self, out_dir: str):
+        os.makedirs(out_dir, exist_ok=True)
+        self.write_patients(os.path.join(out_dir, 'patients.json'))
+        self.write_doctors_and_appointments(os.path.join(out_dir, 'doctors.json'),
+                                            os.path.join(out_dir, 'appointments.json'))
+        with open(os.path.join(out_dir, 'dataset.json'), 'w') as f:
+            json.dump({"patients": self.patients, "doctors": self.doctors, "appointments": self.appointments,
+                       "slots_per_doctor": self.slots_per_doctor, "seed": self.seed}, f, indent=4)
+
+    def write_patients(self, path: str):
+        rng = random.Random(self.seed)
+        writer = JSONArrayWriter(path)
+        try:
+            for index in range(self.patients):
+                age = rng.randint(0, 95)
+                writer.write({
+                    "name": f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}",
+                    "contact_info": f"0{rng.randrange(10 ** 9, 10 ** 10)}",
+                    "age": age,
+                    "gender": rng.choice(GENDERS),
+                    "card_no": str(100000 + index),
+                    "date_of_birth": (date(2025 - age, 1, 1) + timedelta(days=rng.randrange(365))).isoformat(),
+                    "Specialization of Doctor Needed": self.pattern[index % PATTERN_SIZE],
+                    "patient_id": self.patient_id(index)
+                })
+        finally:
+            writer.close()
+
+    def pick_patient(self, rng: random.Random, specialization: str) -> int:
+        """Pick a random patient who needs the specialization (any patient if nobody does)."""
+        index = rng.randrange(self.patients)
+        base = index - index % PATTERN_SIZE
+        for offset in rng.sample(self.positions[specialization], len(self.positions[specialization])):
+            for candidate in (base + offset, base + offset - PATTERN_SIZE):
+                if 0 <= candidate < self.patients:
+                    return candidate
+        return index
+
+    def write_doctors_and_appointments(self, doctors_path: str, appointments_path: str):
+        rng = random.Random(self.seed + 1)
+        doctors = JSONArrayWriter(doctors_path)
+        appointments = JSONArrayWriter(appointments_path)
+        try:
+            for index in range(self.doctors):
+                # Spread the appointments evenly over the doctors
+                booked_count = self.appointments // self.doctors + (index < self.appointments % self.doctors)
+                specialization = self.pattern[rng.randrange(PATTERN_SIZE)]
+                doctor_id = self.doctor_id(index)
+
+                # Consecutive weekdays from a random start, full days of slots
+                slots = []
+                day = FIRST_DAY + timedelta(days=rng.randrange(14))
+                while len(slots) < self.slots_per_doctor:
+                    if day.weekday() < 5:
+                        slots.extend((day.isoformat(), time) for time in TIMES)
+                    day += timedelta(days=1)
+                del slots[self.slots_per_doctor:]
+                booked = set(rng.sample(range(len(slots)), booked_count))
+
+                for position in sorted(booked):
+                    slot_date, slot_time = slots[position]
+                    appointments.write({
+                        "appointment_id": str(uuid.UUID(int=rng.getrandbits(128), version=4)),
+                        "patient_id": self.patient_id(self.pick_patient(rng, specialization)),
+                        "doctor_id": doctor_id,
+                        "date": slot_date,
+                        "time": slot_time,
+                        "status": "Scheduled"
+                    })
+                doctors.write({
+                    "name": f"Dr {rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}",
+                    "contact_info": f"0{rng.randrange(10 ** 9, 10 ** 10)}",
+                    "age": rng.randint(28, 70),
+                    "gender": rng.choice(GENDERS),
+                    "specialization": specialization,
+                    "schedule": [{"date": slot_date, "time": slot_time}
+                                 for position, (slot_date, slot_time) in enumerate(slots) if position not in booked],
+                    "doctor_id": doctor_id
+                })
+        finally:
+            doctors.close()
+            appointments.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate synthetic hospital data for the benchmarks.")
+    parser.add_argument("--patients", type=int, default=1000)
+    parser.add_argument("--doctors", type=int, help="default: one per 200 patients")
+    parser.add_argument("--appointments", type=int, help="default: one per patient")
+    parser.add_argument("--slots-per-doctor", type=int, help="default: twice the booked slots")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", default="bench_data")
+    args = parser.parse_args(argv)
+    generator = HospitalDataGenerator(args.patients, args.doctors, args.appointments,
+                                      args.slots_per_doctor, args.seed)
+    generator.generate(args.out)
+    print(f"Wrote {generator.patients} patients, {generator.doctors} doctors and "
+          f"{generator.appointments} appointments to {args.out}.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,523 @@
+"""
+    Timing harness for the Hospital Appointment System.
+
+    Every run works on a private copy of a generated data set (DataManager
+    reads and writes the JSON files in the working directory), times each
+    benchmark and writes the results as JSON. Passing --compare with an
+    earlier result file prints how every benchmark changed:
+
+        python -m benchmarks.generate --patients 100000 --out bench_data
+        python -m benchmarks.harness --data bench_data --output before.json
+        ... change the code ...
+        python -m benchmarks.harness --data bench_data --output after.json --compare before.json
+"""
+import argparse
+import builtins
+import contextlib
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+# The benchmarks import the application modules from the repository root
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from main import AppointmentScheduler, DataManager, Doctor, Patient
+from patient_store import PatientStore
+from storage import JSONStorage
+from HospitalCLI import HospitalCLI
+from benchmarks.generate import FIRST_DAY, TIMES
+
+DATA_FILES = ['patients.json', 'doctors.json', 'appointments.json']
+
+
+def summarize(samples_ns):
+    """Turn per-call timings (nanoseconds) into the numbers written to the results file."""
+    samples = sorted(samples_ns)
+    count = len(samples)
+    total = sum(samples)
+    def percentile(p):
+        return samples[min(count - 1, int(p * count))] / 1000
+    return {
+        "count": count,
+        "total_s": total / 1e9,
+        "mean_us": total / count / 1000,
+        "p50_us": percentile(0.50),
+        "p95_us": percentile(0.95),
+        "p99_us": percentile(0.99),
+        "max_us": samples[-1] / 1000,
+        "ops_per_s": count / (total / 1e9) if total else None,
+    }
+
+
+def time_calls(calls):
+    """Call each zero-argument function in turn and return how long each one took (ns)."""
+    samples = []
+    for call in calls:
+        start = time.perf_counter_ns()
+        call()
+        samples.append(time.perf_counter_ns() - start)
+    return samples
+
+
+@contextlib.contextmanager
+def scripted_input(answers):
+    """Feed the given answers to input() (the CLI's prompts) and silence print()."""
+    answers = iter(answers)
+    original = builtins.input
+    builtins.input = lambda prompt="": next(answers)
+    try:
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            yield
+    finally:
+        builtins.input = original
+
+
+@contextlib.contextmanager
+def quiet():
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        yield
+
+
+def load_scheduler() -> AppointmentScheduler:
+    with quiet():
+        scheduler = AppointmentScheduler()
+        scheduler.patients = DataManager.load_patients_from_json()
+        scheduler.doctors = DataManager.load_doctors_from_json()
+        scheduler.appointments = DataManager.load_appointments_from_json(scheduler.patients, scheduler.doctors)
+        scheduler.rebuild_indexes()
+    return scheduler
+
+
+def free_slots(scheduler, rng, count):
+    """Pick `count` distinct open (doctor, date, time) slots at random."""
+    doctors = [doctor for doctor in scheduler.doctors if len(doctor.schedule)]
+    picked = set()
+    for _ in range(count * 10):
+        if len(picked) >= count or not doctors:
+            break
+        doctor = rng.choice(doctors)
+        slot = rng.choice(doctor.get_schedule())
+        picked.add((doctor, slot["date"], slot["time"]))
+    return list(picked)
+
+
+# --------------------------
+# Benchmarks
+# --------------------------
+def bench_load_save(results, repeat, memory):
+    for name, load, save in [
+        ("patients", DataManager.load_patients_from_json, DataManager.save_patients_to_json),
+        ("doctors", DataManager.load_doctors_from_json, DataManager.save_doctors_to_json),
+    ]:
+        loaded = []
+        with quiet():
+            results[f"load_{name}"] = summarize(time_calls([lambda: loaded.append(load())] * repeat))
+            results[f"save_{name}"] = summarize(time_calls([lambda: save(loaded[-1])] * repeat))
+
+    with quiet():
+        patients = DataManager.load_patients_from_json()
+        doctors = DataManager.load_doctors_from_json()
+        loaded = []
+        results["load_appointments"] = summarize(time_calls(
+            [lambda: loaded.append(DataManager.load_appointments_from_json(patients, doctors))] * repeat))
+        results["save_appointments"] = summarize(time_calls(
+            [lambda: DataManager.save_appointments_to_json(loaded[-1])] * repeat))
+        # The binary snapshot of the same data (written on compaction, read at startup)
+        results["save_snapshot"] = summarize(time_calls(
+            [lambda: DataManager.save_snapshot(patients, doctors, loaded[-1])] * repeat))
+        results["load_snapshot"] = summarize(time_calls([DataManager.load_snapshot] * repeat))
+
+    if memory:
+        del patients, doctors, loaded
+        tracemalloc.start()
+        scheduler = load_scheduler()
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        results["load_memory"] = {"current_mb": current / 1e6, "peak_mb": peak / 1e6,
+                                  "slots": sum(len(doctor.schedule) for doctor in scheduler.doctors)}
+
+
+def bench_scheduler(results, ops, rng):
+    scheduler = load_scheduler()
+    specializations = sorted(scheduler.doctors_by_specialization) or ["Dentist"]
+
+    results["find_doctors_by_specialization"] = summarize(time_calls(
+        [lambda spec=rng.choice(specializations): scheduler.find_doctors_by_specialization(spec)
+         for _ in range(ops)]))
+
+    # Patients are booked into open slots of doctors with the specialization they need
+    calls = []
+    for doctor, slot_date, slot_time in free_slots(scheduler, rng, ops):
+        candidates = [patient for patient in rng.sample(scheduler.patients, min(50, len(scheduler.patients)))
+                      if patient.required_specialization == doctor.specialization]
+        if candidates:
+            calls.append(lambda p=candidates[0], d=slot_date, t=slot_time: scheduler.schedule_appointment(p, d, t))
+    with quiet():
+        results["schedule_appointment"] = summarize(time_calls(calls) or [0])
+
+    appointments = rng.sample(list(scheduler.appointments), min(ops, len(scheduler.appointments)))
+    calls = []
+    for appointment in appointments[:len(appointments) // 2]:
+        # Reschedule within the same doctor's schedule when it has a free slot
+        slots = appointment.doctor.get_schedule()
+        if slots:
+            slot = rng.choice(slots)
+            calls.append(lambda a=appointment.appointment_id, d=slot["date"], t=slot["time"]:
+                         scheduler.reschedule_appointment(a, d, t))
+    with quiet():
+        results["reschedule_appointment"] = summarize(time_calls(calls) or [0])
+        results["cancel_appointment"] = summarize(time_calls(
+            [lambda a=appointment.appointment_id: scheduler.cancel_appointment(a)
+             for appointment in appointments[len(appointments) // 2:]]) or [0])
+
+
+def bench_journal(results, ops, rng, threads=8):
+    """Bookings written through the journal (one fsync per commit), from one thread and from several."""
+    scheduler = AppointmentScheduler()
+    storage = JSONStorage(compact_every=0)
+    with quiet():
+        storage.load(scheduler)
+    slots = free_slots(scheduler, rng, 2 * ops)
+    patients = rng.sample(scheduler.patients, min(len(slots), len(scheduler.patients)))
+    bookings = [(patient, doctor, date, time) for patient, (doctor, date, time) in zip(patients, slots)]
+    single, concurrent = bookings[:len(bookings) // 2], bookings[len(bookings) // 2:]
+
+    results["journal_book"] = summarize(time_calls(
+        [lambda booking=booking: scheduler.book_appointment(*booking) for booking in single]) or [0])
+
+    # Concurrent appointments are grouped into shared fsyncs; ops_per_s is measured on the wall clock
+    samples = []
+    def worker(chunk):
+        samples.extend(time_calls([lambda booking=booking: scheduler.book_appointment(*booking) for booking in chunk]))
+    workers = [threading.Thread(target=worker, args=(concurrent[index::threads],)) for index in range(threads)]
+    start = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    results[f"journal_book_{threads}_threads"] = dict(summarize(samples or [0]),
+                                                     ops_per_s=len(samples) / elapsed if samples else None)
+    storage.close()
+
+
+def batch_workload(rng, patients, doctors, slots_per_doctor, specializations=10, days=10):
+    """
+    A scheduler with `doctors` doctors holding `slots_per_doctor` open slots each over `days` weekdays,
+    and `patients` patients to place with schedule_batch: a third accept any slot, a third one range
+    of 1-3 days, and a third two separate days. Returns (scheduler, patients, windows).
+    """
+    names = [f"Specialty {index}" for index in range(specializations)]
+    weekdays = [day for day in (FIRST_DAY + timedelta(days=offset) for offset in range(days * 7 // 5 + 7))
+                if day.weekday() < 5][:days]
+    scheduler = AppointmentScheduler()
+    for index in range(doctors):
+        doctor = Doctor(f"Batch Doctor {index}", "08000000000", 45, "Female", names[index % specializations])
+        for slot_day, slot_time in rng.sample([(day, time) for day in weekdays for time in TIMES], slots_per_doctor):
+            doctor.add_available_slot(slot_day.isoformat(), slot_time)
+        scheduler.add_doctor(doctor)
+    waiting, windows = [], {}
+    for index in range(patients):
+        patient = Patient(f"Batch Patient {index}", "08000000000", 30, "Male", f"batch-{index}", "1990-01-01",
+                          names[index % specializations])
+        scheduler.add_patient(patient)
+        waiting.append(patient)
+        kind = index % 3
+        if kind == 1:
+            start = rng.randrange(days)
+            end = min(days - 1, start + rng.randrange(3))
+            windows[patient.person_id] = [(weekdays[start].isoformat(), weekdays[end].isoformat())]
+        elif kind == 2:
+            windows[patient.person_id] = [(day.isoformat(), day.isoformat()) for day in rng.sample(weekdays, 2)]
+    return scheduler, waiting, windows
+
+
+def bench_batch(results, rng, repeat, patients=10000, doctors=1000, slots_per_doctor=15):
+    """schedule_batch placing 10k patients in the slots of 1k doctors (a maximum matching per specialization)."""
+    samples, assigned = [], []
+    for _ in range(repeat):
+        scheduler, waiting, windows = batch_workload(rng, patients, doctors, slots_per_doctor)
+        with quiet():
+            start = time.perf_counter_ns()
+            appointments, unassigned = scheduler.schedule_batch(waiting, windows)
+            samples.append(time.perf_counter_ns() - start)
+        assigned.append(len(appointments))
+    summary = summarize(samples)
+    results["schedule_batch"] = dict(summary, patients=patients, doctors=doctors,
+                                     slots=doctors * slots_per_doctor, assigned=assigned[-1],
+                                     patients_per_s=patients / (summary["p50_us"] / 1e6))
+
+
+def double_bookings(scheduler):
+    """Slots held by more than one scheduled appointment, or scheduled yet still offered as free."""
+    holders = {}
+    for appointment in scheduler.appointments:
+        if appointment.status == "Scheduled":
+            holders.setdefault((appointment.doctor.person_id, appointment.date, appointment.time), []).append(appointment)
+    problems = [f"{doctor_id} {slot_date} {slot_time} is held by {len(held)} appointments"
+                for (doctor_id, slot_date, slot_time), held in holders.items() if len(held) > 1]
+    problems += [f"{appointment.doctor.person_id} {appointment.date} {appointment.time} is booked and still free"
+                 for held in holders.values() for appointment in held
+                 if appointment.doctor.has_slot(appointment.date, appointment.time)]
+    return problems
+
+
+def bench_contention(results, ops, rng, threads=8, doctors=4, slots_per_doctor=5):
+    """
+    Stress test: threads book, reschedule and cancel a handful of hot slots all at once. Afterwards
+    every slot must be held by at most one appointment (double bookings) and either held or free,
+    and every appointment a thread booked and didn't cancel must still be there, and no other
+    (lost writes). The counts are recorded, and main() exits non-zero unless both are 0.
+    """
+    scheduler = AppointmentScheduler()
+    slots = []
+    for index in range(doctors):
+        doctor = Doctor(f"Contended {index}", "08000000000", 45, "Female", "Dentist")
+        for minute in range(slots_per_doctor):
+            slot_time = f"9:{minute * 10:02d} AM"
+            doctor.add_available_slot("2030-01-07", slot_time)
+            slots.append((doctor, "2030-01-07", slot_time))
+        scheduler.add_doctor(doctor)
+    patients = []
+    for index in range(threads * 4):
+        patient = Patient(f"Contender {index}", "08000000000", 30, "Male", f"contend-{index}", "1990-01-01", "Dentist")
+        scheduler.add_patient(patient)
+        patients.append(patient)
+
+    samples, errors, kept = [], [], []
+    def worker(seed):
+        local = random.Random(seed)
+        mine = []  # Appointment IDs this thread booked and hasn't cancelled
+        kept.append(mine)
+        def step():
+            action = local.random()
+            if mine and action < 0.3:
+                scheduler.cancel_appointment(mine.pop(local.randrange(len(mine))))
+            elif mine and action < 0.5:
+                doctor, slot_date, slot_time = local.choice(slots)
+                appointment = scheduler.get_appointment(local.choice(mine))
+                if appointment is not None and appointment.doctor is doctor:
+                    scheduler.reschedule_appointment(appointment.appointment_id, slot_date, slot_time)
+            else:
+                doctor, slot_date, slot_time = local.choice(slots)
+                appointment = scheduler.book_appointment(local.choice(patients), doctor, slot_date, slot_time)
+                if appointment is not None:
+                    mine.append(appointment.appointment_id)
+        try:
+            samples.extend(time_calls([step] * ops))
+        except Exception as error:
+            errors.append(error)
+
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)  # Switch threads as often as possible, to make races likely
+    try:
+        with quiet():
+            workers = [threading.Thread(target=worker, args=(rng.random(),)) for _ in range(threads)]
+            for thread in workers:
+                thread.start()
+            for thread in workers:
+                thread.join()
+    finally:
+        sys.setswitchinterval(interval)
+    if errors:
+        raise errors[0]
+    problems = double_bookings(scheduler)
+    lost = lost_writes(scheduler, slots, [appointment_id for mine in kept for appointment_id in mine])
+    results[f"contention_{threads}_threads"] = dict(summarize(samples), double_bookings=len(problems),
+                                                    lost_writes=len(lost), problems=(problems + lost)[:10])
+
+
+def lost_writes(scheduler, slots, kept_ids):
+    """Booked appointments that went missing or were cancelled, unknown ones, and slots neither held nor free."""
+    problems = []
+    for appointment_id in kept_ids:
+        appointment = scheduler.get_appointment(appointment_id)
+        if appointment is None or appointment.status != "Scheduled":
+            problems.append(f"appointment {appointment_id} was booked but is gone")
+    expected = set(kept_ids)
+    problems += [f"appointment {appointment.appointment_id} was never kept by a booking thread"
+                 for appointment in scheduler.appointments
+                 if appointment.status == "Scheduled" and appointment.appointment_id not in expected]
+    held = {(appointment.doctor.person_id, appointment.date, appointment.time)
+            for appointment in scheduler.appointments if appointment.status == "Scheduled"}
+    problems += [f"{doctor.person_id} {slot_date} {slot_time} is neither booked nor free"
+                 for doctor, slot_date, slot_time in slots
+                 if (doctor.person_id, slot_date, slot_time) not in held and not doctor.has_slot(slot_date, slot_time)]
+    return problems
+
+
+def consistency_failures(results):
+    """Result groups that found double bookings or lost writes, as messages."""
+    return [f"{name}: {result['double_bookings']} double booking(s), {result['lost_writes']} lost write(s): "
+            + "; ".join(result["problems"])
+            for name, result in results.items() if result.get("double_bookings") or result.get("lost_writes")]
+
+
+def bench_cli(results, ops, rng, repeat):
+    # Startup: HospitalCLI loads everything through the default JSON storage, from the JSON files first
+    clis = []
+    with quiet():
+        results["cli_startup"] = summarize(time_calls(
+            [lambda: clis.append(HospitalCLI(AppointmentScheduler(), JSONStorage(compact_every=0)))] * repeat))
+    # Startup again once a snapshot exists (written here the way compaction writes it)
+    with quiet():
+        DataManager.save_snapshot(clis[-1].scheduler.patients, clis[-1].scheduler.doctors,
+                                  clis[-1].scheduler.appointments)
+        results["cli_startup_snapshot"] = summarize(time_calls(
+            [lambda: clis.append(HospitalCLI(AppointmentScheduler(), JSONStorage(compact_every=0)))] * repeat))
+    # Startup with the lazy patient store, once patients.json has been converted into it
+    with quiet():
+        PatientStore().open().write_index()
+        lazy_clis = []
+        results["cli_startup_lazy_patients"] = summarize(time_calls(
+            [lambda: lazy_clis.append(HospitalCLI(AppointmentScheduler(), JSONStorage(compact_every=0, lazy_patients=True)))]
+            * repeat))
+    for cli in clis[:-1] + lazy_clis:
+        cli.storage.close()
+    cli = clis[-1]
+    scheduler = cli.scheduler
+    patients = rng.sample(scheduler.patients, min(ops, len(scheduler.patients)))
+
+    def run_flow(method, answers, *args):
+        with scripted_input(answers):
+            method(*args)
+
+    results["cli_register_patient"] = summarize(time_calls(
+        [lambda n=n: run_flow(cli.add_patient, ["Bench Patient", "08000000000", "40", "Female",
+                                                f"bench-{n}", "1985-01-01", "Dentist"])
+         for n in range(ops)]))
+    results["cli_book_appointment"] = summarize(time_calls(
+        [lambda p=patient: run_flow(cli.book_appointment, ["", "1"], p.person_id) for patient in patients]))
+    results["cli_view_my_appointments"] = summarize(time_calls(
+        [lambda p=patient: run_flow(cli.view_my_appointments, [], p.person_id) for patient in patients]))
+    # Exit folds the journal into the JSON files, like a real session ending
+    results["cli_save_on_exit"] = summarize(time_calls([lambda: run_flow(cli.run, ["3"])]))
+
+    # A whole session: start, look up a patient, book, view, exit
+    patient_id = patients[0].person_id if patients else ""
+    def session():
+        with quiet():
+            session_cli = HospitalCLI(AppointmentScheduler(), JSONStorage(compact_every=0))
+        run_flow(session_cli.run, ["2", patient_id, "2", "", "1", "1", "5", "3"])
+    results["cli_session"] = summarize(time_calls([session] * repeat))
+
+
+BENCHMARKS = {
+    "load_save": lambda results, args, rng: bench_load_save(results, args.repeat, args.memory),
+    "scheduler": lambda results, args, rng: bench_scheduler(results, args.ops, rng),
+    "journal": lambda results, args, rng: bench_journal(results, args.ops, rng),
+    "contention": lambda results, args, rng: bench_contention(results, args.ops, rng),
+    "batch": lambda results, args, rng: bench_batch(results, rng, args.repeat),
+    "cli": lambda results, args, rng: bench_cli(results, args.ops, rng, args.repeat),
+}
+# Groups that build their own data instead of loading the generated data set
+NEEDS_DATA = set(BENCHMARKS) - {"contention", "batch"}
+
+
+# --------------------------
+# Running and comparing
+# --------------------------
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(data_dir, selected, args):
+    """Run the selected benchmarks on a scratch copy of data_dir and return the results document."""
+    data_dir = os.path.abspath(data_dir)
+    dataset = {}
+    if os.path.exists(os.path.join(data_dir, 'dataset.json')):
+        with open(os.path.join(data_dir, 'dataset.json')) as f:
+            dataset = json.load(f)
+    results = {}
+    original_cwd = os.getcwd()
+    with tempfile.TemporaryDirectory(prefix="hospital-bench-") as work_dir:
+        for name in selected:
+            # Every group starts from the untouched data set
+            for file_name in DATA_FILES:
+                if os.path.exists(os.path.join(data_dir, file_name)):
+                    shutil.copy(os.path.join(data_dir, file_name), work_dir)
+            for leftover in os.listdir(work_dir):
+                if leftover not in DATA_FILES:
+                    os.remove(os.path.join(work_dir, leftover))
+            DataManager.loaded_versions.clear()
+            os.chdir(work_dir)
+            try:
+                print(f"Running {name} benchmarks...", file=sys.stderr)
+                BENCHMARKS[name](results, args, random.Random(args.seed))
+            finally:
+                os.chdir(original_cwd)
+    return {
+        "meta": {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "dataset": dataset,
+            "ops": args.ops,
+            "repeat": args.repeat,
+            "seed": args.seed,
+        },
+        "results": results,
+    }
+
+
+def compare(current, baseline, threshold=0.10):
+    """Print the p50 of every benchmark against a baseline run, flagging changes beyond the threshold."""
+    print(f"{'benchmark':34} {'baseline p50':>14} {'current p50':>14} {'change':>8}")
+    for name, result in current["results"].items():
+        before = baseline.get("results", {}).get(name)
+        if "p50_us" not in result or not before or not before.get("p50_us"):
+            continue
+        change = result["p50_us"] / before["p50_us"] - 1
+        flag = "  REGRESSION" if change > threshold else ("  faster" if change < -threshold else "")
+        print(f"{name:34} {before['p50_us']:>12.1f}us {result['p50_us']:>12.1f}us {change:>+7.1%}{flag}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Time the Hospital Appointment System on a generated data set.")
+    parser.add_argument("--data", default="bench_data", help="directory written by benchmarks.generate")
+    parser.add_argument("--output", default="bench_results.json")
+    parser.add_argument("--only", help=f"comma-separated subset of: {', '.join(BENCHMARKS)}")
+    parser.add_argument("--ops", type=int, default=1000, help="calls per operation benchmark")
+    parser.add_argument("--repeat", type=int, default=3, help="runs of the load/save and startup benchmarks")
+    parser.add_argument("--memory", action="store_true", help="also measure the loaded data with tracemalloc")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--compare", help="earlier results file to compare against")
+    args = parser.parse_args(argv)
+
+    selected = args.only.split(",") if args.only else list(BENCHMARKS)
+    unknown = [name for name in selected if name not in BENCHMARKS]
+    if unknown:
+        parser.error(f"unknown benchmark(s): {', '.join(unknown)}")
+    if any(name in NEEDS_DATA for name in selected) and not os.path.exists(os.path.join(args.data, 'patients.json')):
+        parser.error(f"no data set in {args.data}; create one with python -m benchmarks.generate")
+
+    document = run(args.data, selected, args)
+    with open(args.output, 'w') as f:
+        json.dump(document, f, indent=4)
+    print(f"Wrote {len(document['results'])} results to {args.output}.")
+    if args.compare:
+        with open(args.compare) as f:
+            compare(document, json.load(f))
+    failures = consistency_failures(document["results"])
+    for failure in failures:
+        print(f"FAILED {failure}", file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,364 @@
+"""
+    Bulk import and export for the Hospital Appointment System.
+
+    Patients, doctors and slots are read from CSV (with a header row) or JSON
+    Lines (one JSON object per line) and written back out the same way, one
+    row at a time, so the files are never held in memory. Every row is
+    validated and normalized as it comes in (text trimmed, ages checked,
+    dates and times made canonical); rejected rows are reported with their
+    line number and skipped. A patient whose card number is already
+    registered, or appears earlier in the file, is skipped as a duplicate, as
+    is a doctor whose doctor_id exists and a slot the doctor already has.
+
+    Rows are added through the scheduler in batches, one scheduler transaction
+    per batch, so a batch costs one journal write and fsync (or one SQLite
+    transaction) instead of one per row, and the journal is compacted once at
+    the end instead of every compact_every records.
+
+    With workers > 1, rows are parsed and validated in a pool of worker
+    processes, a chunk at a time and only a few chunks ahead of the main
+    process, which builds the objects and adds them in file order.
+
+    Columns (CSV header or JSON keys):
+        patients: patient_id, name, contact_info, age, gender, card_no, date_of_birth, required_specialization
+        doctors:  doctor_id, name, contact_info, age, gender, specialization
+        slots:    doctor_id, date, time
+    The IDs may be left out and are then generated. Recurring availability
+    (availability rules) is not part of the slots and stays in doctors.json.
+
+    Usage: python bulk.py import FILE --kind patients [--workers 4] [--db hospital.db] [--lazy-patients]
+           python bulk.py export FILE --kind patients [--db hospital.db] [--lazy-patients]
+"""
+import argparse
+import csv
+import json
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+from itertools import islice
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from main import AppointmentScheduler, DataManager, canonical_date, canonical_slot, new_person_id
+
+FIELDS = {
+    "patients": ("patient_id", "name", "contact_info", "age", "gender", "card_no", "date_of_birth",
+                 "required_specialization"),
+    "doctors": ("doctor_id", "name", "contact_info", "age", "gender", "specialization"),
+    "slots": ("doctor_id", "date", "time"),
+}
+# Columns a CSV file must have; the others may be left out (IDs are then generated)
+REQUIRED = {
+    "patients": ("name", "age", "card_no", "date_of_birth", "required_specialization"),
+    "doctors": ("name", "age", "specialization"),
+    "slots": ("doctor_id", "date", "time"),
+}
+# Keys of the JSON data files accepted in place of the column names above
+ALIASES = {"Specialization of Doctor Needed": "required_specialization"}
+MAX_REPORTED = 20  # Rejected rows printed one by one; the rest are only counted
+
+
+# --------------------------
+# Validation (runs in the worker processes, so it only deals in plain data)
+# --------------------------
+def text(row: Dict, field: str, required: bool = True) -> str:
+    value = row.get(field)
+    value = "" if value is None else str(value).strip()
+    if required and not value:
+        raise ValueError(f"'{field}' is missing.")
+    return value
+
+
+def age(row: Dict) -> int:
+    try:
+        value = int(text(row, "age"))
+    except ValueError:
+        raise ValueError(f"Invalid age '{row.get('age')}'.") from None
+    if not 0 <= value <= 150:
+        raise ValueError(f"Invalid age {value}.")
+    return value
+
+
+def normalize_patient(row: Dict) -> Dict:
+    """A patient row in the form DataManager.patient_from_dict takes."""
+    return {
+        "name": text(row, "name"),
+        "contact_info": text(row, "contact_info", required=False),
+        "age": age(row),
+        "gender": text(row, "gender", required=False),
+        "card_no": text(row, "card_no"),
+        "date_of_birth": canonical_date(text(row, "date_of_birth")),
+        "Specialization of Doctor Needed": text(row, "required_specialization"),
+        "patient_id": text(row, "patient_id", required=False) or new_person_id(),
+    }
+
+
+def normalize_doctor(row: Dict) -> Dict:
+    """A doctor row in the form DataManager.doctor_from_dict takes."""
+    return {
+        "name": text(row, "name"),
+        "contact_info": text(row, "contact_info", required=False),
+        "age": age(row),
+        "gender": text(row, "gender", required=False),
+        "specialization": text(row, "specialization"),
+        "schedule": [],
+        "doctor_id": text(row, "doctor_id", required=False) or new_person_id(),
+    }
+
+
+def normalize_slot(row: Dict) -> Dict:
+    date, time = canonical_slot(text(row, "date"), text(row, "time"))
+    return {"doctor_id": text(row, "doctor_id"), "date": date, "time": time}
+
+
+NORMALIZE = {"patients": normalize_patient, "doctors": normalize_doctor, "slots": normalize_slot}
+
+
+def parse_chunk(kind: str, header: Optional[List[str]], chunk: List[Tuple[int, object]]) \
+        -> List[Tuple[int, Optional[Dict], Optional[str]]]:
+    """
+    (line, record, error) for each (line, text) of a chunk, the text being a CSV record (header given)
+    or a JSON Lines line (header None). Exactly one of record and error is set.
+    """
+    normalize = NORMALIZE[kind]
+    parsed = []
+    for line, raw in chunk:
+        try:
+            if header is None:
+                row = json.loads(raw)
+                if not isinstance(row, dict):
+                    raise ValueError("Expected a JSON object.")
+                for alias, field in ALIASES.items():
+                    if alias in row:
+                        row.setdefault(field, row[alias])
+            else:
+                values = next(csv.reader([raw]))
+                if len(values) != len(header):
+                    raise ValueError(f"Expected {len(header)} values, found {len(values)}.")
+                row = dict(zip(header, values))
+            parsed.append((line, normalize(row), None))
+        except (ValueError, csv.Error) as error:  # json.JSONDecodeError is a ValueError too
+            parsed.append((line, None, str(error)))
+    return parsed
+
+
+# --------------------------
+# Reading
+# --------------------------
+def file_format(path: str, fmt: Optional[str] = None) -> str:
+    fmt = (fmt or os.path.splitext(path)[1].lstrip(".")).lower()
+    if fmt == "ndjson":
+        fmt = "jsonl"
+    if fmt not in ("csv", "jsonl"):
+        raise ValueError(f"Unknown format '{fmt}'. Use csv or jsonl.")
+    return fmt
+
+
+def csv_records(f) -> Iterator[Tuple[int, str]]:
+    """
+    (first line number, text) of each record of a CSV file. Splitting is left to csv.reader, in
+    parse_chunk, so workers get plain text; a record only continues on the next line while it has
+    an unbalanced quote (a quoted field holding a line break).
+    """
+    record, start = "", 0
+    for number, line in enumerate(f, 1):
+        if not record:
+            start = number
+        record += line
+        if record.count('"') % 2 == 0:
+            yield start, record
+            record = ""
+    if record:
+        yield start, record
+
+
+def parsed_rows(kind: str, f, fmt: str, workers: int = 0, chunk_rows: int = 10000) \
+        -> Iterator[Tuple[int, Optional[Dict], Optional[str]]]:
+    """Stream (line, record, error) for every row of an open file, in file order."""
+    if fmt == "csv":
+        records = csv_records(f)
+        first = next(records, None)
+        if first is None:
+            return
+        header = [ALIASES.get(name.strip(), name.strip().lower()) for name in next(csv.reader([first[1]]), [])]
+        missing = [field for field in REQUIRED[kind] if field not in header]
+        if missing:
+            raise ValueError(f"The CSV header has no {', '.join(missing)} column.")
+    else:
+        header = None
+        records = enumerate(f, 1)
+    raw_rows = ((line, raw) for line, raw in records if raw.strip())
+    chunks = iter(lambda: list(islice(raw_rows, chunk_rows)), [])
+    if workers <= 1:
+        for chunk in chunks:
+            yield from parse_chunk(kind, header, chunk)
+        return
+    with ProcessPoolExecutor(workers) as pool:
+        # A few chunks in flight per worker: enough to keep them busy, and memory stays bounded
+        pending = deque()
+        for chunk in chunks:
+            pending.append(pool.submit(parse_chunk, kind, header, chunk))
+            if len(pending) >= 2 * workers:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+
+
+# --------------------------
+# Importing
+# --------------------------
+def add_patient(scheduler: AppointmentScheduler, data: Dict) -> bool:
+    if scheduler.get_patient_by_card_no(data["card_no"]) or scheduler.get_patient(data["patient_id"]):
+        return False
+    scheduler.add_patient(DataManager.patient_from_dict(data))
+    return True
+
+
+def add_doctor(scheduler: AppointmentScheduler, data: Dict) -> bool:
+    if scheduler.get_doctor(data["doctor_id"]):
+        return False
+    scheduler.add_doctor(DataManager.doctor_from_dict(data))
+    return True
+
+
+def add_slot(scheduler: AppointmentScheduler, data: Dict) -> bool:
+    doctor = scheduler.get_doctor(data["doctor_id"])
+    if doctor is None:
+        raise ValueError(f"Unknown doctor '{data['doctor_id']}'.")
+    if doctor.has_slot(data["date"], data["time"]):
+        return False
+    scheduler.add_doctor_slot(doctor, data["date"], data["time"])
+    return True
+
+
+ADD = {"patients": add_patient, "doctors": add_doctor, "slots": add_slot}
+
+
+def import_records(scheduler: AppointmentScheduler, path: str, kind: str, fmt: Optional[str] = None,
+                   workers: int = 0, batch_size: int = 5000, chunk_rows: int = 10000) -> Dict[str, int]:
+    """
+    Stream patients, doctors or slots from a CSV or JSON Lines file into the scheduler, committing
+    batch_size rows per transaction. Returns how many rows were imported, skipped as duplicates and rejected.
+    If writing a batch fails, the import stops with that error; the batches before it stay imported.
+    """
+    if kind not in ADD:
+        raise ValueError(f"Unknown kind '{kind}'. Use patients, doctors or slots.")
+    fmt = file_format(path, fmt)
+    add = ADD[kind]
+    counts = {"imported": 0, "duplicates": 0, "rejected": 0}
+
+    def reject(line: int, error: str):
+        counts["rejected"] += 1
+        if counts["rejected"] <= MAX_REPORTED:
+            print(f"Rejected line {line} of {path}: {error}")
+
+    # The journal would otherwise compact (rewrite the data files) every compact_every records
+    defer = getattr(scheduler.journal, "deferred_compaction", None)
+    with open(path, 'r', newline='' if fmt == "csv" else None, encoding='utf-8') as f, \
+            (defer() if defer is not None else nullcontext()):
+        rows = parsed_rows(kind, f, fmt, workers, chunk_rows)
+        for batch in iter(lambda: list(islice(rows, batch_size)), []):
+            # Patients' card numbers are checked and their batch written under one hold of the
+            # registration lock, which catches up on other processes' registrations once; every
+            # row is then checked against the scheduler's card index alone
+            with (scheduler.registration() if kind == "patients" else nullcontext()), scheduler.transaction():
+                for line, record, error in batch:
+                    if error is not None:
+                        reject(line, error)
+                        continue
+                    try:
+                        counts["imported" if add(scheduler, record) else "duplicates"] += 1
+                    except ValueError as add_error:
+                        reject(line, str(add_error))
+    if counts["rejected"] > MAX_REPORTED:
+        print(f"... and {counts['rejected'] - MAX_REPORTED} more rejected line(s).")
+    return counts
+
+
+# --------------------------
+# Exporting
+# --------------------------
+def export_rows(scheduler: AppointmentScheduler, kind: str) -> Iterator[Dict]:
+    if kind == "patients":
+        for patient in scheduler.patients:
+            yield {
+                "patient_id": patient.person_id, "name": patient.name, "contact_info": patient.contact_info,
+                "age": patient.age, "gender": patient.gender, "card_no": patient.card_no,
+                "date_of_birth": patient.date_of_birth, "required_specialization": patient.required_specialization,
+            }
+    elif kind == "doctors":
+        for doctor in scheduler.doctors:
+            yield {
+                "doctor_id": doctor.person_id, "name": doctor.name, "contact_info": doctor.contact_info,
+                "age": doctor.age, "gender": doctor.gender, "specialization": doctor.specialization,
+            }
+    elif kind == "slots":
+        for doctor in scheduler.doctors:
+            for slot in doctor.schedule.single_slots():
+                yield {"doctor_id": doctor.person_id, "date": slot["date"], "time": slot["time"]}
+    else:
+        raise ValueError(f"Unknown kind '{kind}'. Use patients, doctors or slots.")
+
+
+def write_rows(f, rows: Iterable[Dict], kind: str, fmt: str) -> int:
+    written = 0
+    if fmt == "csv":
+        writer = csv.writer(f)
+        writer.writerow(FIELDS[kind])
+        fields = FIELDS[kind]
+        for row in rows:
+            writer.writerow([row[field] for field in fields])
+            written += 1
+    else:
+        for row in rows:
+            f.write(json.dumps(row, separators=(',', ':')) + "\n")
+            written += 1
+    return written
+
+
+def export_records(scheduler: AppointmentScheduler, path: str, kind: str, fmt: Optional[str] = None) -> int:
+    """
+    Stream the scheduler's patients, doctors or (single) slots to a CSV or JSON Lines file that
+    import_records reads back. The file is replaced atomically. Returns the number of rows written.
+    """
+    fmt = file_format(path, fmt)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', newline='' if fmt == "csv" else None, encoding='utf-8') as f:
+        written = write_rows(f, export_rows(scheduler, kind), kind, fmt)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    return written
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Import or export patients, doctors and slots as CSV or JSON Lines.")
+    parser.add_argument("action", choices=("import", "export"))
+    parser.add_argument("path", help="the .csv or .jsonl file to read or write")
+    parser.add_argument("--kind", choices=tuple(FIELDS), default="patients")
+    parser.add_argument("--format", choices=("csv", "jsonl"), help="default: from the file extension")
+    parser.add_argument("--workers", type=int, default=0, help="processes that parse and validate rows (import)")
+    parser.add_argument("--batch-size", type=int, default=5000, help="rows committed together (import)")
+    parser.add_argument("--db", help="SQLite database to use instead of the JSON files")
+    parser.add_argument("--lazy-patients", action="store_true", help="keep patients in the patients.jsonl store")
+    args = parser.parse_args(argv)
+    from storage import JSONStorage, SQLiteStorage  # storage.py imports main, like this module
+    storage = SQLiteStorage(args.db) if args.db else JSONStorage(lazy_patients=args.lazy_patients)
+    scheduler = AppointmentScheduler()
+    try:
+        storage.load(scheduler)
+        if args.action == "import":
+            counts = DataManager.import_records(scheduler, args.path, args.kind, args.format,
+                                                workers=args.workers, batch_size=args.batch_size)
+            storage.save(scheduler)
+            print(f"Imported {counts['imported']} {args.kind}, skipped {counts['duplicates']} duplicate(s) "
+                  f"and rejected {counts['rejected']} row(s).")
+        else:
+            written = DataManager.export_records(scheduler, args.path, args.kind, args.format)
+            print(f"Exported {written} {args.kind} to {args.path}.")
+    finally:
+        storage.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,347 @@
+"""
+    Write-ahead journal for the Hospital Appointment System.
+
+    Every mutation (register, add slot or rule, book, cancel, reschedule, join or
+    leave the waitlist) is appended to journal.jsonl as one small JSON line, so
+    a crash never loses more than the operation that was being written. The
+    JSON files written by DataManager act as the snapshot: compaction folds
+    the journal into them
+    and truncates it, and startup loads the snapshot then replays the journal.
+    Compaction can also move past appointments into the archive (archive.py).
+
+    Appends that arrive together from several threads are written with one
+    write and one fsync (group commit), and a scheduler transaction's records
+    are always appended together.
+
+    Several processes may share one data directory and journal. Appends hold
+    the shared DataLock, and compaction holds it exclusively while it rebuilds
+    the snapshot from disk (snapshot + every process's journal records), so one
+    process never overwrites changes made by another.
+"""
+import json
+import os
+import threading
+from contextlib import contextmanager
+from typing import Tuple
+
+from archive import cutoff_day, is_archivable
+from main import AppointmentScheduler, AvailabilityRule, DataManager, DataLock, canonical_slot
+from patient_store import PatientStore
+
+
+class Journal:
+    def __init__(self, path: str = 'journal.jsonl', compact_every: int = 500, patient_store=None):
+        self.path = path
+        self.patient_store = patient_store  # PatientStore holding the patients instead of patients.json, if any
+        self.compact_every = compact_every  # Number of records before the journal is folded into the snapshot
+        self.scheduler = None
+        self.pending = 0  # Records written since the last compaction
+        # How far catch_up() has read the journal: bytes read, the (size, mtime) it had then,
+        # and the compaction generation (appointments.json's version) they belong to
+        self._scanned = 0
+        self._scanned_stat = None
+        self._generation = None
+        self._file = None
+        self._lock = threading.Lock()  # Held while writing to or compacting the journal
+        # Group commit: appends queue up under _queued, and one thread at a time writes out
+        # everything queued so far with a single fsync while the others wait for it
+        self._queued = threading.Condition()
+        self._queue = []       # [(ticket, data, record count)] not written yet
+        self._last_ticket = 0  # Ticket of the latest append
+        self._written = 0      # Every append up to this ticket is on disk (or failed)
+        self._failed = {}      # ticket -> the exception its write raised
+        self._flushing = False
+        self._deferred = 0     # Open deferred_compaction() blocks
+
+    def attach(self, scheduler):
+        """Start journaling every mutation made through the scheduler."""
+        self.scheduler = scheduler
+        scheduler.journal = self
+
+    def append(self, op: str, **fields):
+        """Append one record and fsync it so it survives a crash."""
+        record = {"op": op}
+        record.update(fields)
+        self.append_many([record])
+
+    def append_many(self, records):
+        """
+        Append several records with a single write and a single fsync, and return once they are on disk.
+        Appends from other threads that arrive meanwhile are written together with them (group commit),
+        so many concurrent bookings cost a few fsyncs instead of one each.
+        """
+        data = "".join(json.dumps(record, separators=(',', ':')) + "\n" for record in records)
+        with self._queued:
+            self._last_ticket += 1
+            ticket = self._last_ticket
+            self._queue.append((ticket, data, len(records)))
+            while self._written < ticket:
+                if self._flushing:
+                    self._queued.wait()  # Another thread is writing; ours may be in its batch
+                    continue
+                self._flushing = True
+                batch, self._queue = self._queue, []
+                error = None
+                self._queued.release()
+                try:
+                    error = self._write(batch)
+                finally:
+                    self._queued.acquire()
+                    self._flushing = False
+                    if error is not None:
+                        self._failed.update((queued_ticket, error) for queued_ticket, _, _ in batch)
+                    self._written = batch[-1][0]
+                    self._queued.notify_all()
+            error = self._failed.pop(ticket, None)
+        if error is not None:
+            raise error
+
+    def _write(self, batch):
+        """
+        Write a batch of queued appends; returns the exception if that failed. Once the batch is
+        on disk its changes are committed, so a failed compaction afterwards is only reported:
+        the journal still holds them, and compaction is retried after another compact_every records.
+        """
+        with self._lock:
+            try:
+                with DataLock():
+                    if self._file is None:
+                        self._file = open(self.path, 'a')
+                    data = "".join(data for _, data, _ in batch)
+                    before = os.fstat(self._file.fileno()).st_size
+                    self._file.write(data)
+                    self._fsync()
+                    if before == self._scanned:
+                        # Unless another process appended meanwhile, catch_up() needn't read our own records
+                        stat = os.fstat(self._file.fileno())
+                        if stat.st_size == before + len(data.encode('utf-8')):
+                            self._scanned, self._scanned_stat = stat.st_size, (stat.st_size, stat.st_mtime_ns)
+            except Exception as error:
+                return error
+            self.pending += sum(count for _, _, count in batch)
+            if self.compact_every and not self._deferred and self.pending >= self.compact_every:
+                try:
+                    self._compact()
+                except Exception as error:
+                    self.pending = 0  # Back off instead of failing again on every write
+                    print(f"Could not compact the journal: {error}. Its changes are kept in {self.path}.")
+        return None
+
+    def _fsync(self):
+        # A method of its own so metrics.py can time the fsyncs
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    @contextmanager
+    def deferred_compaction(self):
+        """
+        Hold automatic compaction off, e.g. during a bulk import that would otherwise rewrite the
+        data files every compact_every records. The next write or save after the block compacts.
+        """
+        with self._lock:
+            self._deferred += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._deferred -= 1
+
+    def replay(self, scheduler) -> int:
+        """
+        Re-apply the journal on top of the loaded snapshot. Returns the number of records applied.
+        Replay is idempotent, so records already folded into the snapshot are harmless.
+        """
+        applied, self._scanned = self._replay(scheduler)
+        self._generation = DataManager.read_version('appointments.json')
+        self.pending = applied
+        return applied
+
+    def _replay(self, scheduler) -> Tuple[int, int]:
+        """Apply the journal's records to the scheduler. Returns how many, and the bytes read."""
+        applied = read = 0
+        try:
+            with open(self.path, 'rb') as f:
+                for line in f:
+                    if not line.strip():
+                        read += len(line)
+                        continue
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # A torn last line means we crashed mid-write; everything before it is intact
+                        print("Journal ends with an incomplete record. Ignoring it.")
+                        break
+                    self.apply(scheduler, record)
+                    applied += 1
+                    read += len(line)
+        except FileNotFoundError:
+            pass
+        return applied, read
+
+    def apply(self, scheduler, record):
+        """Apply a single journal record to the scheduler without journaling it again."""
+        # Bookings that filled released slots from the waitlist have records of their own
+        journal, scheduler.journal = scheduler.journal, None
+        backfill, scheduler.backfill = scheduler.backfill, False
+        try:
+            op = record["op"]
+            if op == "add_patient":
+                if not scheduler.get_patient(record["patient"]["patient_id"]):
+                    self._add_patient(scheduler, DataManager.patient_from_dict(record["patient"]))
+            elif op == "add_doctor":
+                if not scheduler.get_doctor(record["doctor"]["doctor_id"]):
+                    scheduler.add_doctor(DataManager.doctor_from_dict(record["doctor"]))
+            elif op == "add_slot":
+                doctor = scheduler.get_doctor(record["doctor_id"])
+                if doctor:
+                    scheduler.add_doctor_slot(doctor, record["date"], record["time"])
+            elif op == "add_rule":
+                doctor = scheduler.get_doctor(record["doctor_id"])
+                if doctor:
+                    scheduler.add_availability_rule(doctor, AvailabilityRule.from_dict(record["rule"]))
+            elif op == "book":
+                data = record["appointment"]
+                patient = scheduler.get_patient(data["patient_id"])
+                doctor = scheduler.get_doctor(data["doctor_id"])
+                if patient and doctor and not scheduler.get_appointment(data["appointment_id"]):
+                    appointment = DataManager.appointment_from_dict(data, patient, doctor)
+                    scheduler.add_appointment(appointment)
+                    patient.add_appointment(appointment.date, appointment.time)
+                    doctor.remove_slot(appointment.date, appointment.time)
+            elif op == "cancel":
+                if scheduler.get_appointment(record["appointment_id"]):
+                    scheduler.cancel_appointment(record["appointment_id"])
+            elif op == "reschedule":
+                appointment = scheduler.get_appointment(record["appointment_id"])
+                if appointment and (appointment.date, appointment.time) != canonical_slot(record["date"], record["time"]):
+                    scheduler.reschedule_appointment(record["appointment_id"], record["date"], record["time"])
+            elif op == "wait":
+                scheduler.waitlist.add(DataManager.waitlist_entry_from_dict(record["entry"]))
+            elif op == "unwait":
+                scheduler.waitlist.remove(record["patient_id"])
+            else:
+                print(f"Unknown journal operation '{op}'. Skipping it.")
+        finally:
+            scheduler.journal = journal
+            scheduler.backfill = backfill
+
+    @staticmethod
+    def _add_patient(scheduler, patient):
+        """
+        Add a journaled registration without the card number check: a registration written
+        inside another process's transaction may share a card with one of ours. Both patients
+        are kept, and the card number stays with the one registered first.
+        """
+        owner = scheduler.get_patient_by_card_no(patient.card_no)
+        if owner is not None:
+            print(f"Patient {patient.person_id} was registered with card number {patient.card_no}, "
+                  f"which patient {owner.person_id} already has. Keeping both.")
+        scheduler.merge_patients([patient])
+
+    def catch_up(self, scheduler) -> int:
+        """
+        Add the patients other processes registered since we loaded (or last caught up) to the
+        scheduler: the add_patient records they appended to the journal, and after a compaction by
+        one of them, the patients it folded into the snapshot. Returns how many patients were added.
+        """
+        with self._lock:
+            try:
+                stat = os.stat(self.path)
+            except FileNotFoundError:
+                return 0
+            if (stat.st_size, stat.st_mtime_ns) == self._scanned_stat:
+                return 0  # Nothing appended since
+            added = 0
+            with DataLock():
+                generation = DataManager.read_version('appointments.json')  # Bumped by every compaction
+                if generation != self._generation:
+                    # The journal was emptied, and what it held is in the snapshot now
+                    if self.patient_store is None:
+                        added += scheduler.merge_patients(DataManager.load_patients_from_json())
+                    self._generation, self._scanned = generation, 0
+                with open(self.path, 'rb') as f:
+                    f.seek(self._scanned)
+                    for line in f:
+                        if not line.endswith(b"\n"):
+                            break  # Still being written
+                        self._scanned += len(line)
+                        if b'"add_patient"' not in line:
+                            continue
+                        try:
+                            record = json.loads(line)
+                            patient = DataManager.patient_from_dict(record["patient"])
+                        except (ValueError, KeyError, TypeError):
+                            continue  # Reported when the journal is replayed
+                        if scheduler.get_patient(patient.person_id) is None:
+                            self._add_patient(scheduler, patient)
+                            added += 1
+                    stat = os.fstat(f.fileno())
+                self._scanned_stat = (stat.st_size, stat.st_mtime_ns)
+            return added
+
+    def compact(self, archive=None, archive_before: str = None):
+        """
+        Fold the journal into the JSON snapshot, then start a fresh, empty journal.
+        With an archive (an archive.AppointmentArchive), appointments dated before archive_before
+        are moved into it on the way. Returns the IDs of the appointments archived.
+        """
+        with self._lock:
+            return self._compact(archive, archive_before)
+
+    def _compact(self, archive=None, archive_before: str = None):
+        before_day = cutoff_day(archive_before) if archive is not None else None
+        archived = []
+        with DataLock(exclusive=True):
+            # Rebuild from disk rather than from memory: the snapshot plus the journal hold
+            # every process's changes, while our in-memory scheduler only has our own
+            merged = AppointmentScheduler()
+            patient_store = None
+            snapshot = DataManager.load_snapshot() if self.patient_store is None else None
+            if snapshot is not None:
+                merged.patients, merged.doctors, merged.appointments = snapshot
+            else:
+                if self.patient_store is not None:
+                    # A store of its own, so replaying bookings never touches the live scheduler's patients
+                    patient_store = PatientStore(self.patient_store.path).open()
+                    merged.patients = patient_store.patients()
+                else:
+                    merged.patients = DataManager.load_patients_from_json()
+                merged.doctors = DataManager.load_doctors_from_json()
+                merged.appointments = DataManager.load_appointments_from_json(merged.patients, merged.doctors)
+            merged.waitlist = DataManager.load_waitlist_from_json()  # Not part of the binary snapshot
+            merged.rebuild_indexes()
+            self._replay(merged)
+            if archive is not None:
+                moving = [appointment for appointment in merged.appointments
+                          if is_archivable(appointment.date, appointment.status, before_day)]
+                # Archived before the JSON files are saved: after a crash in between, archiving
+                # again merely rewrites the same records
+                archive.store(DataManager.appointment_to_dict(appointment) for appointment in moving)
+                archived = [appointment.appointment_id for appointment in moving]
+                merged.drop_appointments(archived)
+            if patient_store is not None:
+                # Patients were appended to patients.jsonl as they registered; indexing them also syncs it
+                patient_store.write_index()
+                patient_store.close()
+            else:
+                DataManager.save_patients_to_json(merged.patients)
+            DataManager.save_doctors_to_json(merged.doctors)
+            DataManager.save_appointments_to_json(merged.appointments)
+            DataManager.save_waitlist_to_json(merged.waitlist)
+            if patient_store is None:
+                # Written last, so it records the stamps of the JSON files it matches
+                DataManager.save_snapshot(merged.patients, merged.doctors, merged.appointments)
+            # The snapshot is safely on disk, so the journal can be emptied
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            with open(self.path, 'w'):
+                pass
+            self._generation, self._scanned, self._scanned_stat = DataManager.read_version('appointments.json'), 0, None
+        self.pending = 0
+        return archived
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
@@ -3,8 +3,20 @@
     such as Patient, Doctor in our 
     Hospital Appointment system.
 """
+import gc
 import json
+import os
+import sys
+import threading # For per-doctor locks
 import uuid # For generating unique IDs
+from bisect import bisect_left, bisect_right # For keeping slots in sorted order
+from heapq import heappop, heappush, merge # For merging several doctors' sorted slots, and the waitlist heaps
+from itertools import dropwhile, groupby, islice
+from datetime import datetime
+from array import array # Compact sorted slot storage
+from functools import lru_cache
+from contextlib import contextmanager, nullcontext # For AppointmentScheduler.transaction()
+from search import SearchIndex # Fuzzy patient and doctor search
 
 """
     Import type hints for better code readability 
@@ -12,9 +24,22 @@ import uuid # For generating unique IDs
     Optional: For indicating that a value can either be a specific type or none
     Dict: For specifying dictionaries with key and value types
 """
-from typing import List, Optional, Dict
+from typing import List, Optional, Dict, Iterable, Iterator, Tuple
+
+try:
+    import fcntl # Advisory file locks shared between processes (POSIX only)
+except ImportError:
+    fcntl = None
+
+def new_person_id() -> str:
+    """A random 11-character ID, "xxxxxxxx-xx" in hex: the first 11 characters of a uuid4, without building one."""
+    digits = os.urandom(5).hex()
+    return f"{digits[:8]}-{digits[8:]}"
 
 class Person:
+    # __slots__ instead of a per-instance __dict__ keeps large populations small
+    __slots__ = ("name", "contact_info", "age", "gender", "person_id")
+
     # Constructor method initaializing  the new person instance 
     def __init__(self, name: str, contact_info: str, age :int, gender: str):
         self.name = name
@@ -23,7 +48,7 @@ class Person:
         self.gender = gender
 
         # This generates a unique identifier for each person
-        self.person_id = str(uuid.uuid4())[:11]
+        self.person_id = new_person_id()
 
     def get_name(self) -> str:
         return self.name # Returns the name of the person
@@ -73,62 +98,621 @@ class Person:
 
 
 
+@lru_cache(maxsize=4096)
+def time_to_minutes(time: str) -> int:
+    """
+    Convert a time such as "10:00 AM" or "14:30" to minutes after midnight.
+    Returns -1 when the time cannot be parsed so it still sorts consistently.
+    """
+    for fmt in ("%I:%M %p", "%I:%M%p", "%H:%M", "%I %p", "%I%p"):
+        try:
+            parsed = datetime.strptime(time.strip(), fmt)
+            return parsed.hour * 60 + parsed.minute
+        except ValueError:
+            continue
+    return -1
+
+
+@lru_cache(maxsize=None)
+def minutes_to_time(minutes: int) -> str:
+    """Format minutes after midnight the way the data files write times, e.g. "9:00 AM"."""
+    hour, minute = divmod(minutes, 60)
+    return sys.intern(f"{hour % 12 or 12}:{minute:02d} {'AM' if hour < 12 else 'PM'}")
+
+
+@lru_cache(maxsize=65536)
+def date_to_day(date: str) -> int:
+    """
+    Convert an ISO date such as "2025-03-10" to its day number (date.toordinal()).
+    Returns -1 when the date is not a valid, zero-padded ISO date (e.g. "2025-15-02").
+    """
+    # fromisoformat is much faster than strptime; the shape check keeps out the other ISO
+    # forms it accepts ("20250310") and unpadded dates, which wouldn't sort correctly as strings
+    if type(date) is not str or len(date) != 10 or date[4] != "-" or date[7] != "-":
+        return -1
+    try:
+        return datetime.fromisoformat(date).toordinal()
+    except ValueError:
+        return -1
+
+
+@lru_cache(maxsize=65536)
+def day_to_date(day: int) -> str:
+    """Inverse of date_to_day()."""
+    return sys.intern(datetime.fromordinal(day).date().isoformat())
+
+
+# --------------------------
+# Ingest: every date and time entering the system (data files, journal, database, CLI, RPC)
+# goes through these, so stored values are canonical and compare, sort and range-scan as
+# integers (a timestamp is day number * 1440 + minutes, the packing SlotSchedule uses)
+# --------------------------
+def parse_date(date: str) -> int:
+    """
+    Day number of a date written YYYY-MM-DD ("2025-3-1" is accepted too).
+    Raises ValueError if it isn't a real date, e.g. "2025-15-02".
+    """
+    day = date_to_day(date)
+    if day != -1:
+        return day
+    try:
+        return datetime.strptime(date.strip(), "%Y-%m-%d").toordinal()
+    except (AttributeError, ValueError):
+        raise ValueError(f"Invalid date '{date}'. Use YYYY-MM-DD.") from None
+
+
+def parse_time(time: str) -> int:
+    """Minutes after midnight of a time such as "10:00 AM", "10:00am" or "14:30". Raises ValueError."""
+    minutes = time_to_minutes(time) if isinstance(time, str) else -1
+    if minutes == -1:
+        raise ValueError(f"Invalid time '{time}'. Use HH:MM AM/PM or HH:MM (24-hour).")
+    return minutes
+
+
+def parse_timestamp(date: str, time: str) -> int:
+    """The integer timestamp of a date and time. Raises ValueError if either is invalid."""
+    return parse_date(date) * 1440 + parse_time(time)
+
+
+def format_timestamp(timestamp: int) -> Tuple[str, str]:
+    """(date, time) of a timestamp, in the display format the data files use: ("2025-03-10", "9:00 AM")."""
+    day, minutes = divmod(timestamp, 1440)
+    return day_to_date(day), minutes_to_time(minutes)
+
+
+@lru_cache(maxsize=65536)
+def canonical_date(date: str) -> str:
+    """The date as stored: "2025-3-1" becomes "2025-03-01". Raises ValueError if it is invalid."""
+    if date_to_day(date) != -1:
+        return sys.intern(date)  # Already canonical
+    return day_to_date(parse_date(date))
+
+
+@lru_cache(maxsize=4096)
+def canonical_time(time: str) -> str:
+    """The time as stored and displayed: "10:00am" and "10:00" both become "10:00 AM". Raises ValueError."""
+    return minutes_to_time(parse_time(time))
+
+
+def canonical_slot(date: str, time: str) -> Tuple[str, str]:
+    return canonical_date(date), canonical_time(time)
+
+
+WEEKDAYS = ("Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun")
+
+
+class AvailabilityRule:
+    """
+    Recurring availability, such as "Mon-Fri from 9:00 AM to 5:00 PM every 20 minutes,
+    2025-01-06 to 2025-12-31, except 2025-04-18". Its slots are generated when they are
+    needed instead of being stored one by one, so a rule costs the same however many
+    slots it publishes. Slots start at `start` and every `every` minutes after it while
+    they start before `end` (9:00 AM to 5:00 PM every 20 minutes ends with 4:40 PM).
+    """
+    __slots__ = ("first_day", "last_day", "weekdays", "start", "end", "every", "except_days")
+
+    def __init__(self, first_date: str, last_date: str, weekdays, start_time: str, end_time: str,
+                 every: int, except_dates=()):
+        self.first_day, self.last_day = parse_date(first_date), parse_date(last_date)
+        if self.last_day < self.first_day:
+            raise ValueError("The rule ends before it starts.")
+        self.weekdays = self.parse_weekdays(weekdays)
+        self.start, self.end = parse_time(start_time), parse_time(end_time)
+        if self.end <= self.start:
+            raise ValueError("The rule's end time must be after its start time.")
+        self.every = int(every)
+        if self.every <= 0:
+            raise ValueError("The time between slots must be a positive number of minutes.")
+        self.except_days = frozenset(parse_date(except_date) for except_date in except_dates)
+
+    @staticmethod
+    def parse_weekdays(weekdays) -> frozenset:
+        """Accept "Mon-Fri", "Mon,Wed,Fri" (or a mix of both) or day numbers (0 is Monday)."""
+        days = set()
+        if isinstance(weekdays, str):
+            for part in weekdays.split(","):
+                if not part.strip():
+                    continue
+                first, _, last = part.partition("-")
+                try:
+                    first_day = WEEKDAYS.index(first.strip()[:3].title())
+                    last_day = WEEKDAYS.index(last.strip()[:3].title()) if last else first_day
+                except ValueError:
+                    raise ValueError(f"Unknown weekday in '{part.strip()}'. Use Mon, Tue, ... Sun.")
+                days.update((first_day + offset) % 7 for offset in range((last_day - first_day) % 7 + 1))
+        else:
+            days.update(int(day) for day in weekdays)
+            if not days <= set(range(7)):
+                raise ValueError("Weekday numbers run from 0 (Monday) to 6 (Sunday).")
+        if not days:
+            raise ValueError("The rule needs at least one weekday.")
+        return frozenset(days)
+
+    def _open_on(self, day: int) -> bool:
+        # Day 1 (0001-01-01) was a Monday
+        return (day - 1) % 7 in self.weekdays and day not in self.except_days
+
+    def covers(self, code: int) -> bool:
+        """Whether the rule publishes the slot packed as code (see SlotSchedule)."""
+        day, minutes = divmod(code, 1440)
+        return (self.first_day <= day <= self.last_day and self.start <= minutes < self.end
+                and (minutes - self.start) % self.every == 0 and self._open_on(day))
+
+    def codes_from(self, code: int = 0):
+        """Yield the rule's slots, packed like SlotSchedule's, in order from code onwards."""
+        times = range(self.start, self.end, self.every)
+        day, minutes = divmod(code, 1440)
+        first = bisect_left(times, minutes)
+        if day < self.first_day:
+            day, first = self.first_day, 0
+        while day <= self.last_day:
+            if self._open_on(day):
+                base = day * 1440
+                for minutes in times[first:]:
+                    yield base + minutes
+            day += 1
+            first = 0
+
+    def to_dict(self) -> Dict:
+        return {
+            "first_date": day_to_date(self.first_day),
+            "last_date": day_to_date(self.last_day),
+            "weekdays": ",".join(WEEKDAYS[day] for day in sorted(self.weekdays)),
+            "start": minutes_to_time(self.start),
+            "end": minutes_to_time(self.end),
+            "every": self.every,
+            "except": [day_to_date(day) for day in sorted(self.except_days)],
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "AvailabilityRule":
+        return cls(data["first_date"], data["last_date"], data["weekdays"], data["start"], data["end"],
+                   data["every"], data.get("except", []))
+
+    def _identity(self):
+        return (self.first_day, self.last_day, self.weekdays, self.start, self.end, self.every, self.except_days)
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, AvailabilityRule) and self._identity() == other._identity()
+
+    def __hash__(self) -> int:
+        return hash(self._identity())
+
+    def __str__(self) -> str:
+        data = self.to_dict()
+        text = (f"{data['weekdays']} {data['start']} to {data['end']} every {self.every} min, "
+                f"{data['first_date']} to {data['last_date']}")
+        return text + (f", except {', '.join(data['except'])}" if data["except"] else "")
+
+
+class SlotSchedule:
+    """
+    Stores a doctor's available slots.
+    Each slot is packed into one integer, day number * 1440 + minutes after midnight,
+    and the integers are kept sorted in an array('q'): 8 bytes per slot, already in
+    chronological order for iteration, bisect lookups and range ("slots between X
+    and Y") queries. Times not written in the usual "9:00 AM" form keep their
+    original spelling in `_times`. Slots whose date or time can't be parsed
+    (e.g. "2025-15-02") are kept as (date, minutes, time) keys in a small sorted list;
+    the loaders and the scheduler reject such slots, so only a schedule filled directly has any.
+
+    Recurring availability is kept as AvailabilityRules in `_rules`. Their slots are
+    generated on demand and merged with the single slots, and the ones that are booked
+    or removed are remembered in the `_taken` set, so memory follows the number of
+    rules and bookings rather than the number of slots. A single slot that a rule
+    also publishes is only kept by the rule.
+
+    Removing (or reserving) a single slot doesn't touch the array: the code goes into
+    the `_removed` set, and readers skip it. Once removed codes make up a quarter of
+    the array it is rebuilt without them, so a booking costs O(1) amortized instead
+    of a copy of every slot. Adding a removed slot back only forgets the tombstone.
+
+    Writers hold `lock` (one per doctor). Adding a slot after the last one appends
+    in place; inserting a new slot anywhere else, or a rebuild, replaces the array
+    (copy-on-write). Readers take `_removed` and then `_codes`, and only look at the
+    part of the array that existed when they started, so they iterate a consistent
+    snapshot without ever taking the lock.
+    """
+    __slots__ = ("lock", "_codes", "_removed", "_times", "_irregular", "_rules", "_taken")
+
+    # A rebuild drops the tombstones once there are this many, and they are a quarter of the array
+    MIN_REBUILD = 64
+
+    def __init__(self, slots: Optional[List[Dict[str, str]]] = None,
+                 rules: Optional[List[AvailabilityRule]] = None,
+                 unavailable: Optional[List[Dict[str, str]]] = None):
+        self.lock = threading.RLock()
+        self._times: Dict[int, str] = {}  # code -> time, only where it isn't minutes_to_time(code)
+        codes = set()
+        irregular = set()
+        for slot in slots or []:
+            code = self._encode(slot["date"], slot["time"])
+            if code is None:
+                irregular.add(self._sort_key(slot["date"], slot["time"]))
+            elif code not in codes:
+                codes.add(code)
+                self._remember_time(code, slot["time"])
+        self._codes = array('q', sorted(codes))
+        self._removed = set()  # Codes still in _codes that were removed or reserved
+        # [(date, minutes, time)] for the slots that couldn't be packed, kept in order
+        self._irregular = sorted(irregular)
+        self._rules: Tuple[AvailabilityRule, ...] = ()
+        self._taken = set()  # Codes the rules publish that are booked or were removed
+        for rule in rules or []:
+            self.add_rule(rule, [(slot["date"], slot["time"]) for slot in unavailable or []])
+
+    @staticmethod
+    def _sort_key(date: str, time: str):
+        # ISO dates (YYYY-MM-DD) sort correctly as strings
+        return (date, time_to_minutes(time), time)
+
+    @staticmethod
+    def _encode(date: str, time: str) -> Optional[int]:
+        """Pack a slot into one integer, or None if its date or time can't be parsed."""
+        day, minutes = date_to_day(date), time_to_minutes(time)
+        if day < 0 or minutes < 0:
+            return None
+        return day * 1440 + minutes
+
+    def _key(self, code: int):
+        """Unpack a slot into the same (date, minutes, time) sort key the irregular slots use."""
+        day, minutes = divmod(code, 1440)
+        return (day_to_date(day), minutes, self._times.get(code) or minutes_to_time(minutes))
+
+    def _covered(self, code: int) -> bool:
+        """Whether one of the rules publishes the slot."""
+        return any(rule.covers(code) for rule in self._rules)
+
+    def _remember_time(self, code: int, time: str):
+        if time == minutes_to_time(code % 1440):
+            self._times.pop(code, None)
+        else:
+            self._times[code] = sys.intern(time)
+
+    def add(self, date: str, time: str) -> bool:
+        code = self._encode(date, time)
+        with self.lock:
+            if code is None:
+                key = self._sort_key(date, time)
+                irregular = self._irregular
+                index = bisect_left(irregular, key)
+                if index < len(irregular) and irregular[index] == key:
+                    return False
+                self._irregular = irregular[:index] + [key] + irregular[index:]
+                return True
+            if self._rules and self._covered(code):
+                if code not in self._taken:
+                    return False
+                self._taken.discard(code)  # Open again, e.g. the appointment moved elsewhere
+                return True
+            codes = self._codes
+            index = bisect_left(codes, code)
+            if index < len(codes) and codes[index] == code:
+                if code not in self._removed:
+                    return False
+                self._remember_time(code, time)
+                self._removed.discard(code)  # Open again, e.g. the appointment was cancelled
+                return True
+            self._remember_time(code, time)
+            if index == len(codes):
+                codes.append(code)  # Readers never look past the length they started with
+            else:
+                self._codes = codes[:index] + array('q', (code,)) + codes[index:]
+            return True
+
+    def remove(self, date: str, time: str) -> bool:
+        """Take the slot off the schedule. Check and removal are atomic, so only one caller gets True."""
+        code = self._encode(date, time)
+        with self.lock:
+            if code is None:
+                key = self._sort_key(date, time)
+                irregular = self._irregular
+                index = bisect_left(irregular, key)
+                if index == len(irregular) or irregular[index] != key:
+                    return False
+                self._irregular = irregular[:index] + irregular[index + 1:]
+                return True
+            if self._rules and self._covered(code):
+                if code in self._taken:
+                    return False
+                self._taken.add(code)
+                return True
+            codes, removed = self._codes, self._removed
+            index = bisect_left(codes, code)
+            if index == len(codes) or codes[index] != code or code in removed:
+                return False
+            removed.add(code)
+            self._times.pop(code, None)
+            if len(removed) >= self.MIN_REBUILD and len(removed) * 4 >= len(codes):
+                self._rebuild()
+            return True
+
+    def _rebuild(self):
+        """Replace the array with one without the removed codes. Callers hold the lock."""
+        removed = self._removed
+        self._codes = array('q', (code for code in self._codes if code not in removed))
+        self._removed = set()  # After _codes, so a reader never pairs the old array with no tombstones
+
+    def _live_codes(self) -> Iterator[int]:
+        removed = self._removed
+        codes = self._codes
+        return (code for code in codes if code not in removed) if removed else iter(codes)
+
+    reserve = remove  # Atomic check-and-reserve used when booking
+
+    def __contains__(self, slot) -> bool:
+        # Accepts either a (date, time) tuple or a {"date": ..., "time": ...} dict
+        if isinstance(slot, dict):
+            slot = (slot.get("date"), slot.get("time"))
+        date, time = slot
+        if not isinstance(date, str) or not isinstance(time, str):
+            return False
+        code = self._encode(date, time)
+        if code is None:
+            sorted_slots, code = self._irregular, self._sort_key(date, time)
+        elif self._rules and self._covered(code):
+            return code not in self._taken
+        else:
+            if code in self._removed:
+                return False
+            sorted_slots = self._codes
+        index = bisect_left(sorted_slots, code)
+        return index < len(sorted_slots) and sorted_slots[index] == code
+
+    def __len__(self) -> int:
+        # Counting the rules' slots means generating them, but never storing them
+        removed = self._removed
+        return (len(self._codes) - len(removed) + len(self._irregular)
+                + sum(1 for _ in self._rule_codes()))
+
+    def __bool__(self) -> bool:
+        removed = self._removed
+        return (len(self._codes) > len(removed) or bool(self._irregular)
+                or next(self._rule_codes(), None) is not None)
+
+    def __iter__(self):
+        for date, _, time in self.iter_from():
+            yield {"date": date, "time": time}
+
+    def between(self, start_date: str, start_time: str, end_date: str, end_time: str) -> List[Dict[str, str]]:
+        """Return the slots from (start_date, start_time) up to and including (end_date, end_time)."""
+        low_key, high_key = self._sort_key(start_date, start_time), self._sort_key(end_date, end_time)
+        slots = []
+        for key in self.iter_from(start_date, start_time):
+            if key > high_key:
+                break
+            if key < low_key:  # Only possible for an empty start_date, which iter_from starts at the beginning
+                continue
+            slots.append({"date": key[0], "time": key[2]})
+        return slots
+
+    def _rule_codes(self, start_code: int = 0):
+        """The rules' open slots as codes, in order from start_code; overlapping rules yield a slot once."""
+        rules, taken = self._rules, self._taken
+        if not rules:
+            return iter(())
+        if len(rules) == 1:
+            codes = rules[0].codes_from(start_code)
+        else:
+            codes = (code for code, _ in groupby(merge(*(rule.codes_from(start_code) for rule in rules))))
+        return (code for code in codes if code not in taken)
+
+    def iter_from(self, date: str = "", time: str = ""):
+        """Yield sort keys (date, minutes, time) in order, starting at (date, time)."""
+        removed = self._removed
+        codes, irregular = self._codes, self._irregular  # Snapshot; see the class docstring
+        count = len(codes)
+        start = irregular_start = 0
+        start_code = 0
+        if date:
+            low_key = self._sort_key(date, time)
+            day = date_to_day(date)
+            if day != -1:
+                # A canonical date bisects the integer codes directly, without unpacking any
+                start_code = day * 1440 + max(0, time_to_minutes(time))
+                start = bisect_left(codes, start_code, 0, count)
+            else:
+                start = bisect_left(codes, low_key, 0, count, key=self._key)
+            irregular_start = bisect_left(irregular, low_key)
+        regular = map(self._key, (codes[index] for index in range(start, count)
+                                  if not removed or codes[index] not in removed))
+        if self._rules:
+            generated = map(self._key, self._rule_codes(start_code))
+            if date:
+                generated = dropwhile(lambda key: key < low_key, generated)
+            regular = merge(regular, generated)
+        if irregular_start < len(irregular):
+            yield from merge(regular, islice(irregular, irregular_start, None))
+        else:
+            yield from regular
+
+    def to_list(self) -> List[Dict[str, str]]:
+        return list(self)
+
+    @property
+    def rules(self) -> List[AvailabilityRule]:
+        return list(self._rules)
+
+    def add_rule(self, rule: AvailabilityRule, booked=()) -> bool:
+        """
+        Publish a recurring rule. `booked` lists (date, time) slots that are already taken, so the
+        rule doesn't open them again. Returns False if the schedule already has the rule.
+        """
+        with self.lock:
+            if rule in self._rules:
+                return False
+            if self._removed:
+                self._rebuild()
+            for date, time in booked:
+                code = self._encode(date, time)
+                if code is not None and rule.covers(code):
+                    self._taken.add(code)
+            # Single slots the rule also publishes are kept by the rule from now on
+            if any(rule.covers(code) for code in self._codes):
+                folded = [code for code in self._codes if rule.covers(code)]
+                self._codes = array('q', (code for code in self._codes if not rule.covers(code)))
+                for code in folded:
+                    self._times.pop(code, None)
+            self._rules = self._rules + (rule,)
+            return True
+
+    def single_slots(self) -> List[Dict[str, str]]:
+        """The slots added one at a time, without the ones the rules publish (what doctors.json stores)."""
+        keys = merge(map(self._key, self._live_codes()), self._irregular)
+        return [{"date": date, "time": time} for date, _, time in keys]
+
+    def unavailable_slots(self) -> List[Dict[str, str]]:
+        """The rules' slots that are booked or were removed."""
+        return [{"date": date, "time": time} for date, _, time in map(self._key, sorted(self._taken))]
+
+    def packed(self):
+        """
+        Return (codes, times, irregular, rules, taken), the schedule's internal form,
+        e.g. for the binary snapshot.
+        """
+        with self.lock:
+            return (array('q', self._live_codes()), dict(self._times), list(self._irregular),
+                    list(self._rules), sorted(self._taken))
+
+    def restore(self, packed):
+        """Put the schedule back the way packed() found it, e.g. to undo a change."""
+        restored = SlotSchedule.from_packed(*packed)  # Not type(self): a subclass may load its state differently
+        with self.lock:
+            for name in ("_codes", "_removed", "_times", "_irregular", "_rules", "_taken"):
+                setattr(self, name, getattr(restored, name))
+
+    @classmethod
+    def from_packed(cls, codes, times: Optional[Dict[int, str]] = None, irregular=None,
+                    rules=None, taken=None) -> "SlotSchedule":
+        """Build a schedule straight from packed() output, without parsing any dates or times."""
+        schedule = cls()
+        schedule._codes = array('q', codes)
+        schedule._times = dict(times or {})
+        schedule._irregular = sorted(tuple(key) for key in irregular or [])
+        schedule._rules = tuple(rules or ())
+        schedule._taken = set(taken or ())
+        return schedule
+
+
 class Doctor(Person):
+    __slots__ = ("specialization", "schedule")
+
     def __init__(self, name: str, contact_info: str, age: int, gender: str, specialization: str):
         super().__init__(name, contact_info, age, gender)
-        self.specialization = specialization
-        self.schedule: List[Dict[str, str]]= []  # List that stores the available time slots
+        self.specialization = sys.intern(specialization)  # Shared by every doctor of the specialization
+        self.schedule = SlotSchedule()  # Stores the available time slots
 
     def add_available_slot(self, date: str, time: str):
-        slot = {"date" : date, "time": time}
-        if slot not in self.schedule:  # Check if slot already exists
-                self.schedule.append(slot)
-        
+        self.schedule.add(date, time)  # Ignored if the slot already exists
+
     def remove_slot(self, date: str, time: str):
-        slot = {"date": date, "time": time}
-        if slot in self.schedule:
-            self.schedule.remove(slot)
-        
+        self.schedule.remove(date, time)
+
+    def has_slot(self, date: str, time: str) -> bool:
+        return (date, time) in self.schedule # O(log n) bisect of the sorted slots
+
+    def reserve_slot(self, date: str, time: str) -> bool:
+        """Atomically check that the slot is free and take it. Only one concurrent caller wins."""
+        return self.schedule.reserve(date, time)
+
+    @property
+    def lock(self):
+        return self.schedule.lock # Per-doctor lock guarding the schedule
+
+    def get_slots_between(self, start_date: str, start_time: str, end_date: str, end_time: str) -> List[Dict[str, str]]:
+        return self.schedule.between(start_date, start_time, end_date, end_time)
+
     def get_schedule(self) -> List[Dict[str, str]]:
-        return self.schedule # Returns the doctor's schedule.
+        return self.schedule.to_list() # Returns the doctor's schedule in chronological order.
+
+    def add_availability_rule(self, rule: AvailabilityRule, booked=()) -> bool:
+        return self.schedule.add_rule(rule, booked)  # False if the doctor already has this rule
 
     def __str__(self):
-        return f"Doctor {self.name} ({self.specialization})\nContact: {self.contact_info}\nAvailable Slots: {', '.join(self.schedule)}"
+        slots = ', '.join(f"{slot['date']} {slot['time']}" for slot in self.schedule)
+        return f"Doctor {self.name} ({self.specialization})\nContact: {self.contact_info}\nAvailable Slots: {slots}"
 
 
 class Patient(Person):
+    # __weakref__ lets patient_store.PatientStore hand out the same object for a patient while it is in use
+    __slots__ = ("card_no", "date_of_birth", "required_specialization", "_appointments", "__weakref__")
+
     #passing the person class as a parent class to the patient class.
     def __init__(self, name: str, contact_info: str, age: int, gender: str, card_no: int, date_of_birth: str,  required_specialization: str):
         super().__init__(name, contact_info, age, gender)
-        # Re-using the initialization of the parent class 
+        # Re-using the initialization of the parent class
         self.card_no = card_no
         self.date_of_birth = date_of_birth
-        self.required_specialization = required_specialization # specialization required by the patient
-        self.appointments: List[Dict[str, str]] = []  # list that stores appointments
+        self.required_specialization = sys.intern(required_specialization) # specialization required by the patient
+        self._appointments: List[Tuple[str, str]] = []  # (date, time) of each appointment
+
+    @property
+    def appointments(self) -> List[Dict[str, str]]:
+        return [{'date': date, 'time': time} for date, time in self._appointments]
 
     def add_appointment(self, appointment_date: str, appointment_time: str):
-        appointment = {
-            'date': appointment_date,
-            'time': appointment_time,
-        }
-        self.appointments.append(appointment)  # Add appointment to patient
+        # Add appointment to patient
+        self._appointments.append((sys.intern(appointment_date), sys.intern(appointment_time)))
 
     def cancel_appointment(self, appointment_date: str, appointment_time: str):
-        appointment_to_remove = next((appt for appt in self.appointments if appt['date'] == appointment_date and appt['time'] == appointment_time), None)
-        if appointment_to_remove:
-            self.appointments.remove(appointment_to_remove)  # Removes appointment from patient
+        if (appointment_date, appointment_time) in self._appointments:
+            self._appointments.remove((appointment_date, appointment_time))  # Removes appointment from patient
 
     # def view_appointments(self) -> List[Dict[str, str]]:
     #     return self.appointments  # views all scheduled appointments
 
 class Appointment:
+    __slots__ = ("_id", "patient", "doctor", "date", "time", "status")
+
     def __init__(self, patient: Patient, doctor: Doctor, date: str, time: str, status: str = "Scheduled"):
-        self.appointment_id = str(uuid.uuid4()) # Unique ID for each appointment
+        self._id = uuid.uuid4().bytes # Unique ID for each appointment, kept as 16 raw bytes
         self.patient = patient  # Composition: using Patient object
         self.doctor = doctor  # Composition: using Doctor object
-        self.time = time
-        self.status = status
-        self.date = date
+        self.time = sys.intern(time)
+        self.status = sys.intern(status)
+        self.date = sys.intern(date)
+
+    @staticmethod
+    def compact_id(appointment_id: str):
+        """Return the form an ID is stored and indexed in: 16 bytes for a uuid, otherwise the string itself."""
+        try:
+            parsed = uuid.UUID(appointment_id)
+        except (AttributeError, TypeError, ValueError):
+            return appointment_id
+        return parsed.bytes if str(parsed) == appointment_id else appointment_id
+
+    @property
+    def appointment_id(self) -> str:
+        return str(uuid.UUID(bytes=self._id)) if isinstance(self._id, bytes) else self._id
+
+    @appointment_id.setter
+    def appointment_id(self, appointment_id: str):
+        self._id = self.compact_id(appointment_id)
+
+    @property
+    def timestamp(self) -> int:
+        """When the appointment is, as an integer (see parse_timestamp), for sorting and range checks."""
+        return date_to_day(self.date) * 1440 + time_to_minutes(self.time)
 
     def cancel_appointment(self):
         if self.status == "Scheduled":
@@ -139,17 +723,24 @@ class Appointment:
 
     def reschedule_appointment(self, new_date : str, new_time: str):
         """Reschedule the appointment to new date/time."""
-        if self.status == "Scheduled":
-            # Free up original slot
-            self.doctor.add_available_slot(self.date, self.time)
-            
-            # Check new slot availability
-            if {"date": new_date, "time": new_time} in self.doctor.get_schedule():
-                self.date = new_date
-                self.time = new_time
-                self.doctor.remove_slot(new_date, new_time)
+        with self.doctor.lock:
+            if self.status == "Scheduled" and (new_date, new_time) == (self.date, self.time):
+                return True  # Already there; its own slot is taken, so it can't be reserved again
+            # Take the new slot first, so when it isn't free nothing has changed
+            if self.status == "Scheduled" and self.doctor.reserve_slot(new_date, new_time):
+                # Free up original slot
+                self.doctor.add_available_slot(self.date, self.time)
+                self.patient.cancel_appointment(self.date, self.time)
+                self.patient.add_appointment(new_date, new_time)
+                self.date = sys.intern(new_date)
+                self.time = sys.intern(new_time)
                 return True
         return False
+    def summary(self) -> str:
+        """The appointment on one line, as listings show it."""
+        return (f"{self.date} {self.time} | Dr. {self.doctor.name} | Patient: {self.patient.name} | "
+                f"{self.status} [ID: {self.appointment_id}]")
+
     def __str__(self):
         return f"""
                 Appointment ID: {self.appointment_id}
@@ -159,25 +750,660 @@ class Appointment:
                 Time: {self.time}
                 Status: {self.status}
                """
+class Transaction:
+    """
+    Changes staged by AppointmentScheduler.transaction(). Every step that changes memory
+    registers how to undo it, and the journal records are held back until the commit.
+    """
+    __slots__ = ("records", "_undo")
+
+    def __init__(self):
+        self.records: List[Dict] = []
+        self._undo = []
+
+    def on_rollback(self, undo):
+        self._undo.append(undo)
+
+    def rollback(self):
+        # Undo in reverse order, so each step sees the state it left behind
+        while self._undo:
+            self._undo.pop()()
+
+
+class Waitlist:
+    """
+    Patients waiting for a slot, with one heap per specialization ordered by priority (1 is the most
+    urgent), then by the order they joined in. An entry is a plain record: patient_id, specialization,
+    priority, sequence (join order), since (when they joined), and the date and time the patient asked
+    for (None for any). Leaving only forgets the entry and
+    the heap drops it lazily once it reaches the top, so joining, leaving and taking the next patient
+    are all O(log n).
+    """
+    DEFAULT_PRIORITY = 3
+
+    def __init__(self):
+        self.heaps: Dict[str, List[Tuple[int, int, str]]] = {}  # specialization -> heap of (priority, sequence, patient_id)
+        self.entries: Dict[str, Dict] = {}  # patient_id -> entry
+        self.counts: Dict[str, int] = {}    # specialization -> patients waiting
+        self._sequence = 0                  # Latest sequence handed out; persisted with the entries
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def __contains__(self, patient_id) -> bool:
+        return patient_id in self.entries
+
+    def __iter__(self) -> Iterator[Dict]:
+        """Every entry, each specialization in queue order."""
+        return iter(sorted(self.entries.values(),
+                           key=lambda entry: (entry["specialization"], entry["priority"], entry["sequence"])))
+
+    def get(self, patient_id: str) -> Optional[Dict]:
+        return self.entries.get(patient_id)
+
+    def waiting(self, specialization: str) -> int:
+        return self.counts.get(specialization, 0)
+
+    def add(self, entry: Dict) -> Dict:
+        """Queue an entry. One without a sequence goes to the back; one with a sequence keeps its place (loaded or restored)."""
+        with self._lock:
+            if entry.get("sequence") is None:
+                self._sequence += 1
+                entry = dict(entry, sequence=self._sequence)
+            else:
+                self._sequence = max(self._sequence, entry["sequence"])
+            self._forget(entry["patient_id"])
+            self.entries[entry["patient_id"]] = entry
+            self.counts[entry["specialization"]] = self.counts.get(entry["specialization"], 0) + 1
+            heappush(self.heaps.setdefault(entry["specialization"], []),
+                     (entry["priority"], entry["sequence"], entry["patient_id"]))
+        return entry
+
+    def remove(self, patient_id: str) -> Optional[Dict]:
+        """Take a patient off the waitlist. Returns their entry, or None if they were not waiting."""
+        with self._lock:
+            return self._forget(patient_id)
+
+    def _forget(self, patient_id: str) -> Optional[Dict]:
+        entry = self.entries.pop(patient_id, None)
+        if entry is not None:
+            self.counts[entry["specialization"]] -= 1
+        return entry
+
+    def pop(self, specialization: str, eligible) -> Optional[Dict]:
+        """
+        Take the first entry of the specialization that eligible(entry) accepts. Entries it refuses
+        keep their place; entries that left (or joined again) since they were pushed are discarded.
+        """
+        with self._lock:
+            heap = self.heaps.get(specialization, [])
+            refused, found = [], None
+            while heap:
+                priority, sequence, patient_id = heappop(heap)
+                entry = self.entries.get(patient_id)
+                if entry is None or (entry["specialization"], entry["priority"], entry["sequence"]) \
+                        != (specialization, priority, sequence):
+                    continue  # Stale
+                if eligible(entry):
+                    found = self._forget(patient_id)
+                    break
+                refused.append((priority, sequence, patient_id))
+            for item in refused:
+                heappush(heap, item)
+            return found
+
+
+class AppointmentList:
+    """
+    Stands in for the AppointmentScheduler.appointments list, in the order the appointments were added.
+    It is a dict used as an ordered set, so remove() doesn't have to scan every appointment.
+    """
+    __slots__ = ("_appointments",)
+
+    def __init__(self, appointments: Iterable[Appointment] = ()):
+        self._appointments: Dict[Appointment, None] = dict.fromkeys(appointments)
+
+    def __len__(self) -> int:
+        return len(self._appointments)
+
+    def __iter__(self) -> Iterator[Appointment]:
+        return iter(self._appointments)
+
+    def __contains__(self, appointment) -> bool:
+        return appointment in self._appointments
+
+    def append(self, appointment: Appointment):
+        self._appointments[appointment] = None
+
+    def remove(self, appointment: Appointment):
+        del self._appointments[appointment]
+
+
 class AppointmentScheduler:
     def __init__(self):
-        self.appointments: List[Appointment] = []  # List to store all scheduled appointments
+        self.appointments = AppointmentList()  # Every scheduled appointment, in the order they were added
         self.doctors: List[Doctor] = []       # List to store available doctors
         self.patients: List[Patient]= []      # List to store registered patients
 
+        # Hash indexes so lookups don't have to scan the lists above
+        self.appointments_by_id: Dict[object, Appointment] = {}         # Appointment.compact_id(id) -> Appointment
+        self.appointments_by_patient: Dict[str, List[Appointment]] = {}  # patient_id -> appointments
+        self.appointments_by_doctor: Dict[str, List[Appointment]] = {}   # doctor_id -> appointments
+        self.appointments_by_day: Dict[int, List[Appointment]] = {}      # date_to_day(date) -> appointments
+        self.patients_by_id: Dict[str, Patient] = {}                    # patient_id -> Patient
+        self.patients_by_card_no: Dict[str, Patient] = {}               # card_no -> Patient
+        # required specialization -> patients (None with a lazy patient collection, which would have to parse them all)
+        self.patients_by_specialization: Optional[Dict[str, List[Patient]]] = {}
+        self.doctors_by_id: Dict[str, Doctor] = {}                      # doctor_id -> Doctor
+        self.doctors_by_specialization: Dict[str, List[Doctor]] = {}    # specialization -> doctors
+        # (kind, order) -> (registrations seen, sort keys, records) for the listings sorted by name
+        self._sorted_listings: Dict[Tuple[str, str], Tuple[int, list, list]] = {}
+        # "patients"/"doctors" -> SearchIndex, built by the first search and then kept up to date
+        self._search_indexes: Dict[str, SearchIndex] = {}
+
+        # Optional write-ahead journal; every mutation is appended to it when set
+        self.journal = None
+        # Optional storage backend: finds the patients other processes registered, and may load
+        # appointments and list open slots on demand instead of holding them all in memory
+        self.storage = None
+        # Guards patient registration (the card_no uniqueness check). Bookings never take it;
+        # they only lock the doctor whose slot they reserve.
+        self._registry_lock = threading.Lock()
+        # The transaction each thread is in, if any (see transaction())
+        self._local = threading.local()
+        # Patients waiting for a slot to be released (see join_waitlist)
+        self.waitlist = Waitlist()
+        # Book waiting patients into released slots. Off while replaying a journal, whose records
+        # already include the bookings made that way
+        self.backfill = True
+
+    @property
+    def appointments(self) -> AppointmentList:
+        self._load_appointments()  # Every appointment, with a backend that loads them on demand
+        return self._appointments
+
+    @appointments.setter
+    def appointments(self, appointments: Iterable[Appointment]):
+        # Loaders assign plain lists
+        self._appointments = appointments if isinstance(appointments, AppointmentList) else AppointmentList(appointments)
+
+    def _load_appointments(self, **filters):
+        """Have the storage backend add the stored appointments matching the filters (see StorageBackend.load_appointments)."""
+        if self.storage is not None:
+            self.storage.load_appointments(self, **filters)
+
+    def _record(self, op: str, **fields):
+        if self.journal is not None:
+            transaction = getattr(self._local, "transaction", None)
+            if transaction is not None:
+                transaction.records.append({"op": op, **fields})
+            else:
+                self.journal.append(op, **fields)
+
+    @contextmanager
+    def transaction(self, journal=None):
+        """
+        Make several changes all or nothing. If the block raises, including when its records
+        can't be written, every change made in it is undone. Its journal records are written
+        together when it ends, with one write and one fsync, instead of one per change;
+        to `journal` if given (e.g. straight to the storage backend), otherwise to self.journal.
+        A transaction started inside another (on the same thread) joins the outer one.
+        """
+        if getattr(self._local, "transaction", None) is not None:
+            yield self._local.transaction
+            return
+        transaction = self._local.transaction = Transaction()
+        journal = journal if journal is not None else self.journal
+        try:
+            yield transaction
+            if transaction.records and journal is not None:
+                journal.append_many(transaction.records)
+        except BaseException:
+            transaction.rollback()
+            raise
+        finally:
+            self._local.transaction = None
+
+    def rebuild_indexes(self):
+        """
+        Rebuild every index from the lists.
+        Call this after assigning the lists directly (e.g. when loading from JSON).
+        """
+        # The index lists are new objects but never garbage; with many records loaded the cyclic
+        # collector would otherwise rescan all of them over and over while they are created
+        collecting = gc.isenabled()
+        gc.disable()
+        try:
+            self._rebuild_indexes()
+        finally:
+            if collecting:
+                gc.enable()
+
+    def _rebuild_indexes(self):
+        self.appointments_by_id = {}
+        self.appointments_by_patient = {}
+        self.appointments_by_doctor = {}
+        self.appointments_by_day = {}
+        self.patients_by_id = {}
+        self.patients_by_card_no = {}
+        self.patients_by_specialization = {}
+        self.doctors_by_id = {}
+        self.doctors_by_specialization = {}
+        self._sorted_listings = {}
+        self._search_indexes = {}
+        for doctor in self.doctors:
+            self._index_doctor(doctor)
+        # A lazy patient collection (patient_store.LazyPatients) brings its own indexes;
+        # building dicts here would parse every patient
+        indexes = getattr(self.patients, "indexes", None)
+        if indexes is not None:
+            self.patients_by_id, self.patients_by_card_no = indexes()
+            self.patients_by_specialization = None
+        else:
+            for patient in self.patients:
+                self._index_patient(patient)
+        for appointment in self._appointments:
+            self._index_appointment(appointment)
+
+    def _index_patient(self, patient: Patient):
+        self.patients_by_id[patient.person_id] = patient
+        # Keep the first patient seen for a card number if older data has duplicates
+        self.patients_by_card_no.setdefault(str(patient.card_no).strip(), patient)
+        if self.patients_by_specialization is not None:
+            self.patients_by_specialization.setdefault(patient.required_specialization, []).append(patient)
+        search_index = self._search_indexes.get("patients")
+        if search_index is not None:
+            search_index.add(patient.person_id, patient)
+
+    def _index_doctor(self, doctor: Doctor):
+        self.doctors_by_id[doctor.person_id] = doctor
+        self.doctors_by_specialization.setdefault(doctor.specialization, []).append(doctor)
+        search_index = self._search_indexes.get("doctors")
+        if search_index is not None:
+            search_index.add(doctor.person_id, doctor)
+
+    def _index_appointment(self, appointment: Appointment):
+        self.appointments_by_id[appointment._id] = appointment
+        self.appointments_by_patient.setdefault(appointment.patient.person_id, []).append(appointment)
+        self.appointments_by_doctor.setdefault(appointment.doctor.person_id, []).append(appointment)
+        self.appointments_by_day.setdefault(date_to_day(appointment.date), []).append(appointment)
+
+    def _unindex_appointment(self, appointment: Appointment):
+        self.appointments_by_id.pop(appointment._id, None)
+        for index, key in ((self.appointments_by_patient, appointment.patient.person_id),
+                           (self.appointments_by_doctor, appointment.doctor.person_id)):
+            indexed = index.get(key)
+            if indexed and appointment in indexed:
+                indexed.remove(appointment)
+        self._unindex_day(appointment, appointment.date)
+
+    def _unindex_day(self, appointment: Appointment, date: str):
+        day = date_to_day(date)
+        indexed = self.appointments_by_day.get(day)
+        if indexed and appointment in indexed:
+            indexed.remove(appointment)
+            if not indexed:
+                del self.appointments_by_day[day]
+
+    def _move_appointment(self, appointment: Appointment, new_date: str, new_time: str) -> bool:
+        """Appointment.reschedule_appointment, keeping the day index in step."""
+        old_date = appointment.date
+        if not appointment.reschedule_appointment(new_date, new_time):
+            return False
+        self._unindex_day(appointment, old_date)
+        self.appointments_by_day.setdefault(date_to_day(appointment.date), []).append(appointment)
+        return True
+
+    def _remove_appointment(self, appointment: Appointment):
+        self._appointments.remove(appointment)
+        self._unindex_appointment(appointment)
+
+    def _remove_patient(self, patient: Patient):
+        """Undo add_patient. A patient store can't forget anyone: there the patient stays in patients.jsonl."""
+        if getattr(self.patients, "indexes", None) is not None:
+            return
+        self.patients.remove(patient)  # A scan, but only ever run to roll a registration back
+        self.patients_by_id.pop(patient.person_id, None)
+        card = str(patient.card_no).strip()
+        if self.patients_by_card_no.get(card) is patient:
+            del self.patients_by_card_no[card]
+        indexed = (self.patients_by_specialization or {}).get(patient.required_specialization)
+        if indexed and patient in indexed:
+            indexed.remove(patient)
+        # The search index keeps the ID, but no longer finds a patient for it
+        self._sorted_listings = {key: value for key, value in self._sorted_listings.items() if key[0] != "patients"}
+
+    def _remove_doctor(self, doctor: Doctor):
+        """Undo add_doctor."""
+        self.doctors.remove(doctor)
+        self.doctors_by_id.pop(doctor.person_id, None)
+        indexed = self.doctors_by_specialization.get(doctor.specialization)
+        if indexed and doctor in indexed:
+            indexed.remove(doctor)
+        self._sorted_listings = {key: value for key, value in self._sorted_listings.items() if key[0] != "doctors"}
+
     def add_doctor(self, doctor : Doctor):
-        self.doctors.append(doctor)  # Add a doctor to the scheduler
+        with self.transaction() as transaction:
+            self.doctors.append(doctor)  # Add a doctor to the scheduler
+            self._index_doctor(doctor)
+            transaction.on_rollback(lambda: self._remove_doctor(doctor))
+            self._record("add_doctor", doctor=DataManager.doctor_to_dict(doctor))
+
+    def registration(self):
+        """
+        Hold the storage backend's registration lock, with the patients other processes registered
+        merged in, so get_patient_by_card_no() sees every card until the block ends. Callers that
+        register patients inside a transaction of their own must hold it around the transaction,
+        since the records are only written when the transaction ends (see bulk.import_records).
+        Without a storage backend there are no other processes to wait for.
+        """
+        return self.storage.registration(self) if self.storage is not None else nullcontext()
 
     def add_patient(self, patient: Patient):
-        self.patients.append(patient)  # Add a patient to the scheduler
+        with self.registration(), self._registry_lock, self.transaction() as transaction:
+            if self.get_patient_by_card_no(patient.card_no):
+                raise ValueError(f"Card number {patient.card_no} already exists.")
+            self.patients.append(patient)  # Add a patient to the scheduler
+            self._index_patient(patient)
+            transaction.on_rollback(lambda: self._remove_patient(patient))
+            self._record("add_patient", patient=DataManager.patient_to_dict(patient))
+
+    def merge_patients(self, patients: List[Patient]) -> int:
+        """
+        Add patients that are not registered yet (e.g. ones another process wrote to disk).
+        They are already persisted, so nothing is journaled. Returns how many were added.
+        """
+        added = 0
+        for patient in patients:
+            if patient.person_id not in self.patients_by_id:
+                self.patients.append(patient)
+                self._index_patient(patient)
+                added += 1
+        return added
+
+    def drop_appointments(self, appointment_ids) -> int:
+        """
+        Remove appointments from memory without cancelling them, e.g. once they are archived.
+        They are already persisted where they belong, so nothing is journaled. Returns how many were removed.
+        """
+        removed = 0
+        for appointment_id in set(map(Appointment.compact_id, appointment_ids)):
+            appointment = self.appointments_by_id.get(appointment_id)
+            if appointment is not None:
+                self._remove_appointment(appointment)
+                appointment.patient.cancel_appointment(appointment.date, appointment.time)
+                removed += 1
+        return removed
+
+    def add_doctor_slot(self, doctor: Doctor, date: str, time: str):
+        date, time = canonical_slot(date, time)  # Raises ValueError for an invalid date or time
+        with self.transaction() as transaction:
+            if not doctor.schedule.add(date, time):  # Publish a new availability slot
+                return  # Already open: nothing to record, and no new slot to hand out
+            transaction.on_rollback(lambda: doctor.remove_slot(date, time))
+            self._record("add_slot", doctor_id=doctor.person_id, date=date, time=time)
+            self._backfill(doctor, date, time)  # Goes to the first patient waiting for one, if any
+
+    def add_availability_rule(self, doctor: Doctor, rule: AvailabilityRule) -> bool:
+        """Publish recurring availability for a doctor. Slots already booked with them stay taken."""
+        self._load_appointments(doctor_id=doctor.person_id)
+        booked = [(appointment.date, appointment.time)
+                  for appointment in self.appointments_by_doctor.get(doctor.person_id, [])]
+        # The doctor stays locked, so undoing the rule can't also undo a booking made meanwhile
+        with doctor.lock, self.transaction() as transaction:
+            before = doctor.schedule.packed()
+            added = doctor.add_availability_rule(rule, booked)
+            if added:
+                transaction.on_rollback(lambda: doctor.schedule.restore(before))
+                self._record("add_rule", doctor_id=doctor.person_id, rule=rule.to_dict())
+                # The soonest of the new slots go to the patients waiting for the specialization
+                waiting = self.waitlist.waiting(doctor.specialization)
+                if waiting and self.backfill:
+                    today = datetime.now().date().isoformat()
+                    # Taken up front: booking changes the schedule being iterated. A few spare slots
+                    # make up for waiting patients who already have an appointment at that time
+                    for slot_date, _, slot_time in list(islice(doctor.schedule.iter_from(today), 2 * waiting)):
+                        if not self.waitlist.waiting(doctor.specialization):
+                            break
+                        self._backfill(doctor, slot_date, slot_time)
+        return added
+
+    # --------------------------
+    # Waitlist: patients no slot could be found for, booked as soon as one is released
+    # --------------------------
+    def join_waitlist(self, patient: Patient, priority: int = Waitlist.DEFAULT_PRIORITY,
+                      date: Optional[str] = None, time: Optional[str] = None) -> Dict:
+        """
+        Put a patient on the waitlist of their required specialization. The next slot of that
+        specialization to be released (cancelled, rescheduled away or newly added) is booked for the
+        waiting patient with the lowest priority number, the longest waiting first among equals.
+        With a date (and time), only a released slot on that date (at that time) is booked for them.
+        Joining again changes the priority and the slot asked for. Returns the waitlist entry.
+        """
+        if date is not None:
+            date = canonical_date(date)
+        if time is not None:
+            time = canonical_time(time)
+        existing = self.waitlist.get(patient.person_id)
+        entry = {
+            "patient_id": patient.person_id,
+            "specialization": patient.required_specialization,
+            "priority": int(priority),
+            "sequence": existing["sequence"] if existing else None,
+            "since": existing["since"] if existing else datetime.now().isoformat(timespec="seconds"),
+            "date": date,
+            "time": time,
+        }
+        with self.transaction() as transaction:
+            entry = self.waitlist.add(entry)
+            transaction.on_rollback(lambda: self.waitlist.add(existing) if existing else
+                                    self.waitlist.remove(patient.person_id))
+            self._record("wait", entry=entry)
+        return entry
+
+    def leave_waitlist(self, patient_id: str) -> bool:
+        """Take a patient off the waitlist. Returns False if they were not on it."""
+        with self.transaction() as transaction:
+            entry = self.waitlist.remove(patient_id)
+            if entry is None:
+                return False
+            transaction.on_rollback(lambda: self.waitlist.add(entry))
+            self._record("unwait", patient_id=patient_id)
+        return True
+
+    def get_waitlist_entry(self, patient_id: str) -> Optional[Dict]:
+        return self.waitlist.get(patient_id)
+
+    def _backfill(self, doctor: Doctor, date: str, time: str) -> Optional[Appointment]:
+        """
+        Book a released slot for the first eligible patient waiting for the doctor's specialization:
+        one who is still registered, asked for this slot (or any), and has nothing else booked at
+        that time. Slots already in the past are left alone. Joins the caller's transaction, so it is undone with the release.
+        """
+        if not self.backfill or not self.waitlist.waiting(doctor.specialization) \
+                or date_to_day(date) < datetime.now().toordinal():
+            return None
+
+        def eligible(entry):
+            if entry.get("date") not in (None, date) or entry.get("time") not in (None, time):
+                return False
+            self._load_appointments(patient_id=entry["patient_id"])
+            # Checked through the scheduler's index: the loaders don't fill Patient._appointments
+            return self.get_patient(entry["patient_id"]) is not None and not any(
+                appointment.date == date and appointment.time == time and appointment.status == "Scheduled"
+                for appointment in self.appointments_by_patient.get(entry["patient_id"], ()))
+
+        entry = self.waitlist.pop(doctor.specialization, eligible)
+        if entry is None:
+            return None
+        with self.transaction() as transaction:
+            appointment = self.book_appointment(self.get_patient(entry["patient_id"]), doctor, date, time)
+            if appointment is None:
+                self.waitlist.add(entry)  # Someone took the slot first; the patient keeps their place
+                return None
+            transaction.on_rollback(lambda: self.waitlist.add(entry))
+            self._record("unwait", patient_id=entry["patient_id"])
+        return appointment
+
+    def add_appointment(self, appointment: Appointment):
+        self._appointments.append(appointment)  # Add an already booked appointment to the scheduler
+        self._index_appointment(appointment)
+
+    def book_appointment(self, patient: Patient, doctor: Doctor, date: str, time: str) -> Optional[Appointment]:
+        """
+        Book the given doctor's slot for the patient and take it off the doctor's schedule.
+        Returns None if the slot is not free (e.g. another thread reserved it first).
+        Raises ValueError if the date or time is invalid.
+        """
+        date, time = canonical_slot(date, time)
+        with self.transaction() as transaction:
+            if not doctor.reserve_slot(date, time):  # Atomic check-and-reserve; no double booking
+                return None
+            transaction.on_rollback(lambda: doctor.add_available_slot(date, time))
+            appointment = Appointment(patient, doctor, date, time)
+            self.add_appointment(appointment)
+            transaction.on_rollback(lambda: self._remove_appointment(appointment))
+            patient.add_appointment(date, time)  # Add to patient's appointments
+            transaction.on_rollback(lambda: patient.cancel_appointment(date, time))
+            self._record("book", appointment=DataManager.appointment_to_dict(appointment))
+            # A waiting patient who books the specialization some other way stops waiting
+            waiting = self.waitlist.get(patient.person_id)
+            if waiting is not None and waiting["specialization"] == doctor.specialization:
+                self.leave_waitlist(patient.person_id)
+        return appointment
+
+    def get_doctor(self, doctor_id: str) -> Optional[Doctor]:
+        return self.doctors_by_id.get(doctor_id)
+
+    def get_patient(self, patient_id: str) -> Optional[Patient]:
+        return self.patients_by_id.get(patient_id)
+
+    def get_patient_by_card_no(self, card_no) -> Optional[Patient]:
+        return self.patients_by_card_no.get(str(card_no).strip())
+
+    def search_patients(self, query: str, limit: int = 10) -> List[Patient]:
+        """
+        Patients whose name, contact info or card number match the query, best match first.
+        Words match exactly, by prefix, by the last digits of a number, or despite a typo ("jonh").
+        """
+        return self._search_index("patients").search(query, limit)
+
+    def search_doctors(self, query: str, limit: int = 10) -> List[Doctor]:
+        """Doctors whose name, contact info or specialization match the query, best match first."""
+        return self._search_index("doctors").search(query, limit)
+
+    def _search_index(self, kind: str) -> SearchIndex:
+        search_index = self._search_indexes.get(kind)
+        if search_index is None:
+            # Built on first use rather than at load, which stays as fast as before for sessions that never search.
+            # Like rebuild_indexes(), keep the cyclic collector from rescanning the new lists while they are built
+            collecting = gc.isenabled()
+            gc.disable()
+            try:
+                with self._registry_lock:
+                    if kind == "patients":
+                        search_index = SearchIndex(
+                            lambda patient: (patient.name, patient.contact_info, patient.card_no), self.get_patient)
+                        search_index.add_many((patient.person_id, patient) for patient in self.patients)
+                    else:
+                        search_index = SearchIndex(
+                            lambda doctor: (doctor.name, doctor.contact_info, doctor.specialization), self.get_doctor)
+                        search_index.add_many((doctor.person_id, doctor) for doctor in self.doctors)
+                    self._search_indexes[kind] = search_index
+            finally:
+                if collecting:
+                    gc.enable()
+        return search_index
+
+    def get_appointment(self, appointment_id: str) -> Optional[Appointment]:
+        appointment = self.appointments_by_id.get(Appointment.compact_id(appointment_id))
+        if appointment is None and self.storage is not None:
+            self._load_appointments(appointment_id=appointment_id)
+            appointment = self.appointments_by_id.get(Appointment.compact_id(appointment_id))
+        return appointment
+
+    def get_patient_appointments(self, patient_id: str) -> List[Appointment]:
+        """Return the appointments booked for the given patient, soonest first."""
+        self._load_appointments(patient_id=patient_id)
+        return sorted(self.appointments_by_patient.get(patient_id, []), key=lambda appointment: appointment.timestamp)
     
     def find_doctors_by_specialization(self, specialization: str) -> List[Doctor]:
         """Return doctors with the given specialization."""
-        return [doctor for doctor in self.doctors if doctor.specialization == specialization]
+        return list(self.doctors_by_specialization.get(specialization, []))
+
+    def find_next_available(self, specialization: str, after_date: str = "", after_time: str = "",
+                            until_date: str = "", limit: Optional[int] = 1) -> List[Tuple[Doctor, Dict[str, str]]]:
+        """
+        Return the `limit` soonest open (doctor, slot) pairs for a specialization, starting at
+        (after_date, after_time) and, if until_date is given, ending on that date.
+        Pass limit=None to get every open slot in order.
+        Each doctor's SlotSchedule is already sorted, so this bisects into every schedule
+        and lazily heap-merges them, instead of collecting and sorting every slot. The slots of
+        doctors whose schedules are still only in the storage backend are read from it a date
+        at a time, when it can list them (see _stored_slots).
+        """
+        after_date = canonical_date(after_date) if after_date else ""
+        after_time = canonical_time(after_time) if after_time else ""
+        until_day = parse_date(until_date) if until_date else None
+        doctors = self.find_doctors_by_specialization(specialization)
+        def tagged(index, doctor):
+            # Tag each key with the doctor's position so merge never has to compare Doctor objects
+            for key in doctor.schedule.iter_from(after_date, after_time):
+                yield key, index
+
+        stored = {}  # doctor_id -> position, for the doctors the storage backend lists the slots of
+        if self.storage is not None and hasattr(self.storage, "find_open_slots"):
+            stored = {doctor.person_id: index for index, doctor in enumerate(doctors)
+                      if getattr(doctor.schedule, "stored", False)}
+        streams = [tagged(index, doctor) for index, doctor in enumerate(doctors) if doctor.person_id not in stored]
+        if stored:
+            streams.append(self._stored_slots(specialization, after_date, after_time,
+                                              day_to_date(until_day) if until_day is not None else "", stored))
+        results = []
+        for (slot_date, _, slot_time), index in islice(merge(*streams), limit):
+            if until_day is not None and date_to_day(slot_date) > until_day:
+                break
+            results.append((doctors[index], {"date": slot_date, "time": slot_time}))
+        return results
+
+    def _stored_slots(self, specialization: str, after_date: str, after_time: str, until_date: str,
+                      positions: Dict[str, int]):
+        """
+        find_next_available's tagged keys for the doctors in `positions` (doctor_id -> position),
+        from the storage backend: the first date with an open slot, then that date's slots, and so on.
+        """
+        low_key = SlotSchedule._sort_key(after_date, after_time) if after_date else None
+        date = after_date
+        while True:
+            date = self.storage.next_open_date(specialization, date)
+            if date is None or (until_date and date > until_date):
+                return
+            # Doctors loaded since find_next_available started are listed from the database all the same
+            keys = sorted(((slot_date, time_to_minutes(slot_time), slot_time), positions[doctor_id])
+                          for doctor_id, slot_date, slot_time in self.storage.find_open_slots(specialization, date)
+                          if doctor_id in positions)
+            for key, index in keys:
+                if low_key is None or key >= low_key:
+                    yield key, index
+            date += "\0"  # Every later date sorts after this, the date itself before it
+
+    def find_open_slots(self, specialization: str, date: str) -> List[Tuple[Doctor, Dict[str, str]]]:
+        """Return (doctor, slot) for every open slot of the specialization on the given date, in time order."""
+        return self.find_next_available(specialization, date, "", date, limit=None)
 
-    def schedule_appointment(self, patient, date: str, time: str):
+    def next_available_slot(self, specialization: str, after_date: str = "", after_time: str = "",
+                            until_date: str = "") -> Optional[Tuple[Doctor, Dict[str, str]]]:
+        """Return the single soonest open (doctor, slot) pair for a specialization, or None."""
+        found = self.find_next_available(specialization, after_date, after_time, until_date, limit=1)
+        return found[0] if found else None
+
+    def schedule_appointment(self, patient, date: str, time: str,
+                             waitlist_priority: Optional[int] = None):
         """
     Schedule an appointment for a patient with a doctor matching their required specialization.
+    If no doctor is free then and waitlist_priority is given, the patient joins the waitlist with
+    that priority for this date and time, and is booked if such a slot is released.
     """
         
         # Find doctors matching the patient's required specialization
@@ -185,106 +1411,613 @@ class AppointmentScheduler:
 
         if not matching_doctors:
             print(f"No {patient.required_specialization} available at this time.")
+            self._waitlist_unscheduled(patient, waitlist_priority, date, time)
             return None
         
         # Find the first available doctor
         for doctor in matching_doctors:
-            if {"date" : date, "time": time} in doctor.get_schedule():
-                new_appointment = Appointment(patient, doctor, date, time)
-                self.appointments.append(new_appointment)  # Add appointment to the list
-                patient.add_appointment( date, time)  # Add to patient's appointments
-                doctor.remove_slot(date, time) #Mark slot as booked 
+            new_appointment = self.book_appointment(patient, doctor, date, time)
+            if new_appointment:
                 print(f"Assigned Dr. {doctor.name} ({doctor.specialization}) to patient {patient.name}.")
                 return new_appointment
-            else:
-                print(f"No doctors available for {patient.required_specialization} at {date} {time}.")
-                return None
+
+        print(f"No doctors available for {patient.required_specialization} at {date} {time}.")
+        self._waitlist_unscheduled(patient, waitlist_priority, date, time)
+        return None
+
+    def _waitlist_unscheduled(self, patient, priority: Optional[int], date: str, time: str):
+        if priority is not None:
+            entry = self.join_waitlist(patient, priority, date, time)
+            print(f"{patient.name} is on the {patient.required_specialization} waitlist and will be booked "
+                  f"if a slot opens on {entry['date']} at {entry['time']}.")
             
+    def schedule_batch(self, patients: List[Patient],
+                       windows: Optional[Dict[str, List[Tuple[str, str]]]] = None):
+        """
+        Assign many patients to open slots at once.
+        `windows` optionally maps a patient_id to the (start_date, end_date) ranges, inclusive,
+        the patient is willing to attend. Patients without windows accept any slot.
+        For each specialization this computes a maximum matching of patients to slots,
+        preferring earlier slots, then books every match in one pass.
+        Returns (appointments, unassigned_patients).
+        """
+        windows = windows or {}
+        by_specialization: Dict[str, List[Patient]] = {}
+        for patient in patients:
+            by_specialization.setdefault(patient.required_specialization, []).append(patient)
+
+        matches = []  # (patient, doctor, date, time)
+        unassigned = []
+        for specialization, group in by_specialization.items():
+            # All open slots of the specialization in chronological order
+            slots = [(slot, doctor) for doctor, slot in
+                     self.find_next_available(specialization, limit=None)]
+            slot_days = [date_to_day(slot["date"]) for slot, _ in slots]
+            intervals = []
+            for patient in group:
+                ranges = [(parse_date(start), parse_date(end)) for start, end in windows.get(patient.person_id, [])]
+                intervals.append([(bisect_left(slot_days, start), bisect_right(slot_days, end))
+                                  for start, end in ranges or [(0, sys.maxsize)]])
+            assigned = self._match_slots(len(slots), intervals)
+            for index, patient in enumerate(group):
+                slot_index = assigned.get(index)
+                if slot_index is None:
+                    unassigned.append(patient)
+                else:
+                    slot, doctor = slots[slot_index]
+                    matches.append((patient, doctor, slot["date"], slot["time"]))
+
+        # Commit every booking in a single pass, and a single journal write
+        appointments = []
+        with self.transaction():
+            for patient, doctor, date, time in matches:
+                appointment = self.book_appointment(patient, doctor, date, time)
+                if appointment:
+                    appointments.append(appointment)
+                else:
+                    unassigned.append(patient)  # Slot was taken concurrently
+        print(f"Batch scheduled {len(appointments)} patient(s); {len(unassigned)} left unassigned.")
+        return appointments, unassigned
+
+    def _match_slots(self, slot_count: int, intervals: List[List[Tuple[int, int]]]) -> Dict[int, int]:
+        """
+        Maximum matching of patients to slot indexes. intervals[p] lists the [lo, hi) slot
+        ranges patient p accepts. Returns {patient index: slot index}.
+
+        Patients are taken in order of their latest acceptable slot and given the earliest free
+        slot they accept (a "next free slot" union-find makes that lookup near O(1)). When every
+        patient accepts one contiguous range this greedy is already a maximum matching. Patients
+        with several ranges can break that, so unmatched ones then get augmenting-path passes.
+        """
+        next_free = list(range(slot_count + 1))  # next_free[i] leads to the first free slot >= i
+
+        def find_free(i):
+            root = i
+            while next_free[root] != root:
+                root = next_free[root]
+            while next_free[i] != root:  # Path compression
+                next_free[i], i = root, next_free[i]
+            return root
+
+        slot_owner: Dict[int, int] = {}
+        assigned: Dict[int, int] = {}
+        order = sorted(range(len(intervals)), key=lambda p: max((hi for _, hi in intervals[p]), default=0))
+        for patient in order:
+            for lo, hi in intervals[patient]:
+                slot = find_free(lo)
+                if slot < hi:
+                    assigned[patient] = slot
+                    slot_owner[slot] = patient
+                    next_free[slot] = slot + 1
+                    break
+
+        if all(len(ranges) <= 1 for ranges in intervals):
+            return assigned
+
+        # Augmenting paths (Kuhn's algorithm, iterative) for the patients still unmatched.
+        # A failed search leaves the matching unchanged, so the slots it visited can't lead
+        # to a free slot later either; they are only forgotten after a successful augment.
+        visited = set()
+        for start in order:
+            if start in assigned:
+                continue
+            parent = {}  # slot -> patient that reached it
+            stack = [(start, iter(s for lo, hi in intervals[start] for s in range(lo, hi)))]
+            found = None
+            while stack and found is None:
+                patient, candidates = stack[-1]
+                for slot in candidates:
+                    if slot in visited:
+                        continue
+                    visited.add(slot)
+                    parent[slot] = patient
+                    owner = slot_owner.get(slot)
+                    if owner is None:
+                        found = slot
+                    else:
+                        stack.append((owner, iter(s for lo, hi in intervals[owner] for s in range(lo, hi))))
+                    break
+                else:
+                    stack.pop()
+            if found is None:
+                continue
+            visited = set()
+            # Flip the matches along the path back to the starting patient
+            slot = found
+            while slot is not None:
+                patient = parent[slot]
+                previous = assigned.get(patient)
+                assigned[patient] = slot
+                slot_owner[slot] = patient
+                slot = previous if patient != start else None
+        return assigned
+
     def reschedule_appointment(self, appointment_id, new_date, new_time):
+        new_date, new_time = canonical_slot(new_date, new_time)  # Raises ValueError if invalid
         # Find the appointment
-        appointment = next((a for a in self.appointments 
-                        if a.appointment_id == appointment_id), None)
+        appointment = self.get_appointment(appointment_id)
         if appointment:
-            # Call the Appointment class method
-            return appointment.reschedule_appointment(new_date, new_time)
+            # The doctor stays locked until the change is written, so a rollback can take the old slot back
+            with appointment.doctor.lock, self.transaction() as transaction:
+                old_date, old_time = appointment.date, appointment.time
+                # Call the Appointment class method
+                rescheduled = self._move_appointment(appointment, new_date, new_time)
+                if rescheduled and (new_date, new_time) != (old_date, old_time):
+                    transaction.on_rollback(lambda: self._move_appointment(appointment, old_date, old_time))
+                    self._record("reschedule", appointment_id=appointment_id, date=new_date, time=new_time)
+                    self._backfill(appointment.doctor, old_date, old_time)  # The old slot is free again
+            return rescheduled
         return False, "Appointment not found."
     
     def cancel_appointment(self, appointment_id):
-        appointment_to_cancel = next((appt for appt in self.appointments if appt.appointment_id == appointment_id), None)
+        appointment_to_cancel = self.get_appointment(appointment_id)
         if appointment_to_cancel:
-            appointment_to_cancel.cancel_appointment()
-            self.appointments.remove(appointment_to_cancel)
+            doctor, patient = appointment_to_cancel.doctor, appointment_to_cancel.patient
+            date, time, status = appointment_to_cancel.date, appointment_to_cancel.time, appointment_to_cancel.status
+            with doctor.lock, self.transaction() as transaction:
+                # Another thread may have cancelled it while we waited for the lock
+                if self.get_appointment(appointment_id) is not appointment_to_cancel:
+                    print(f"No appointment found with ID {appointment_id}.")
+                    return
+                appointment_to_cancel.cancel_appointment()
+                self._remove_appointment(appointment_to_cancel)
+                patient.cancel_appointment(date, time)
+                if status == "Scheduled":
+                    doctor.add_available_slot(date, time)  # The slot is open to other patients again
+
+                def restore():
+                    appointment_to_cancel.status = status
+                    self.add_appointment(appointment_to_cancel)
+                    patient.add_appointment(date, time)
+                    if status == "Scheduled":
+                        doctor.remove_slot(date, time)
+                transaction.on_rollback(restore)
+                self._record("cancel", appointment_id=appointment_id)
+                # The freed slot goes straight to the first patient waiting for the specialization
+                backfilled = self._backfill(doctor, date, time) if status == "Scheduled" else None
             print(f"Appointment {appointment_id} has been cancelled.")  # Remove from the list
+            if backfilled is not None:
+                print(f"The slot went to {backfilled.patient.name} from the {doctor.specialization} waitlist.")
         else:
             print(f"No appointment found with ID {appointment_id}.")
 
     def view_appointments(self):
-        for appointment in self.appointments:
-            print(appointment)
+        # Written a chunk of rows at a time instead of one print per appointment
+        rows = map(Appointment.summary, self.query_appointments())
+        while True:
+            chunk = list(islice(rows, 500))
+            if not chunk:
+                break
+            sys.stdout.write("\n".join(chunk) + "\n")
+
+    # --------------------------
+    # Listings: filtered, sorted generators served from the indexes, and cursor-based pages of them
+    # --------------------------
+    @staticmethod
+    def appointment_cursor(appointment: Appointment) -> Tuple[int, str]:
+        """Where an appointment sits in date order (ties broken by ID); a page resumes after it."""
+        return appointment.timestamp, appointment.appointment_id
+
+    def query_appointments(self, start_date: str = "", end_date: str = "", status: Optional[str] = None,
+                           doctor_id: Optional[str] = None, patient_id: Optional[str] = None,
+                           specialization: Optional[str] = None, descending: bool = False,
+                           after=None) -> Iterator[Appointment]:
+        """
+        Yield the appointments matching every given filter in date order (newest first if
+        descending), starting after the cursor `after` (see appointment_cursor). Dates are
+        inclusive. A patient, doctor or specialization filter starts from that index; otherwise
+        only the days in range of the day index are visited. Raises ValueError for an invalid date.
+        """
+        start_day = parse_date(start_date) if start_date else None
+        end_day = parse_date(end_date) if end_date else None
+        after = tuple(after) if after is not None else None
+        self._load_appointments(patient_id=patient_id, doctor_id=doctor_id, specialization=specialization,
+                                start_date=day_to_date(start_day) if start_day is not None else "",
+                                end_date=day_to_date(end_day) if end_day is not None else "")
+        cursor = self.appointment_cursor
+        if patient_id is not None or doctor_id is not None or specialization is not None:
+            if patient_id is not None:
+                candidates = self.appointments_by_patient.get(patient_id, [])
+            elif doctor_id is not None:
+                candidates = self.appointments_by_doctor.get(doctor_id, [])
+            else:
+                candidates = [appointment for doctor in self.doctors_by_specialization.get(specialization, [])
+                              for appointment in self.appointments_by_doctor.get(doctor.person_id, [])]
+            ordered = sorted(candidates, key=cursor, reverse=descending)
+        else:
+            days = sorted(self.appointments_by_day)
+            low = bisect_left(days, start_day) if start_day is not None else 0
+            high = bisect_right(days, end_day) if end_day is not None else len(days)
+            # Skip straight to the cursor's day
+            if after is not None and not descending:
+                low = max(low, bisect_left(days, after[0] // 1440))
+            elif after is not None:
+                high = min(high, bisect_right(days, after[0] // 1440))
+            days = days[low:high]
+            if descending:
+                days.reverse()
+            ordered = (appointment for day in days
+                       for appointment in sorted(self.appointments_by_day.get(day, []), key=cursor, reverse=descending))
+        for appointment in ordered:
+            key = cursor(appointment)
+            if after is not None and (key <= after if not descending else key >= after):
+                continue
+            day = key[0] // 1440
+            if (start_day is not None and day < start_day) or (end_day is not None and day > end_day):
+                continue
+            if status is not None and appointment.status != status:
+                continue
+            if doctor_id is not None and appointment.doctor.person_id != doctor_id:
+                continue
+            if specialization is not None and appointment.doctor.specialization != specialization:
+                continue
+            yield appointment
+
+    def _sorted_listing(self, kind: str, order: str, records, key):
+        """records sorted by key, kept until a registration changes how many there are."""
+        cached = self._sorted_listings.get((kind, order))
+        if cached is None or cached[0] != len(records):
+            ordered = sorted(records, key=key)
+            cached = self._sorted_listings[(kind, order)] = (len(records), [key(record) for record in ordered], ordered)
+        return cached[1], cached[2]
+
+    def _people(self, kind: str, records, order: str, after, keep) -> Iterator[Tuple[object, object]]:
+        """
+        (cursor, record) pairs for query_patients and query_doctors. In "registered" order the cursor
+        is the record's position in `records`, which only ever grows at the end; by "name" it is
+        (name, id). Both resume in O(1) or O(log n) instead of skipping records one by one.
+        """
+        if order == "registered":
+            start = after + 1 if after is not None else 0
+            selected = records[start:] if isinstance(records, list) else islice(records, start, None)
+            for position, record in enumerate(selected, start):
+                if keep(record):
+                    yield position, record
+            return
+        if order != "name":
+            raise ValueError(f"Unknown order '{order}'. Use 'registered' or 'name'.")
+        keys, ordered = self._sorted_listing(kind, order, records,
+                                             lambda record: (record.name.casefold(), record.person_id))
+        start = bisect_right(keys, tuple(after)) if after is not None else 0
+        for position in range(start, len(ordered)):
+            if keep(ordered[position]):
+                yield keys[position], ordered[position]
+
+    def _patients(self, specialization: Optional[str], order: str, after):
+        if specialization is not None and self.patients_by_specialization is not None:
+            return self._people(f"patients:{specialization}", self.patients_by_specialization.get(specialization, []),
+                                order, after, lambda patient: True)
+        keep = (lambda patient: True) if specialization is None else \
+            (lambda patient: patient.required_specialization == specialization)
+        return self._people("patients", self.patients, order, after, keep)
+
+    def _doctors(self, specialization: Optional[str], order: str, after):
+        if specialization is not None:
+            return self._people(f"doctors:{specialization}", self.doctors_by_specialization.get(specialization, []),
+                                order, after, lambda doctor: True)
+        return self._people("doctors", self.doctors, order, after, lambda doctor: True)
+
+    def query_patients(self, specialization: Optional[str] = None, order: str = "registered",
+                       after=None) -> Iterator[Patient]:
+        """
+        Yield patients, optionally only those needing a specialization, in registration order or by
+        "name", starting after the cursor `after` from page_patients. The specialization index is used
+        unless the patients are lazy (patient_store.py), which are then filtered as they are read.
+        """
+        return (patient for _, patient in self._patients(specialization, order, after))
+
+    def query_doctors(self, specialization: Optional[str] = None, order: str = "registered",
+                      after=None) -> Iterator[Doctor]:
+        """Yield doctors, optionally of one specialization, in registration order or by "name"."""
+        return (doctor for _, doctor in self._doctors(specialization, order, after))
+
+    @staticmethod
+    def _page(pairs, limit: int):
+        """Take `limit` (cursor, record) pairs; returns (records, cursor of the last one, or None if nothing follows)."""
+        page = list(islice(pairs, limit + 1))
+        records = [record for _, record in page[:limit]]
+        return records, (page[limit - 1][0] if len(page) > limit else None)
+
+    def page_appointments(self, limit: int = 20, cursor=None, **filters) -> Tuple[List[Appointment], Optional[Tuple]]:
+        """
+        One page of query_appointments(**filters), and the cursor to pass for the next page
+        (None after the last one).
+        """
+        appointments = self.query_appointments(after=cursor, **filters)
+        return self._page(((self.appointment_cursor(appointment), appointment) for appointment in appointments), limit)
+
+    def page_patients(self, limit: int = 20, cursor=None, specialization: Optional[str] = None,
+                      order: str = "registered") -> Tuple[List[Patient], Optional[object]]:
+        return self._page(self._patients(specialization, order, cursor), limit)
+
+    def page_doctors(self, limit: int = 20, cursor=None, specialization: Optional[str] = None,
+                     order: str = "registered") -> Tuple[List[Doctor], Optional[object]]:
+        return self._page(self._doctors(specialization, order, cursor), limit)
+
+class StaleDataError(Exception):
+    """Raised when saving a data file that another process has rewritten since we loaded it."""
+
+
+class DataLock:
+    """
+    Advisory fcntl lock on hospital.lock, shared by every process using the data directory.
+    Readers take it shared, writers exclusive. Nested use within a process is a no-op,
+    so a writer can call the loaders while it holds the lock.
+    On platforms without fcntl only threads of this process are serialised.
+    """
+    path = 'hospital.lock'
+    _guard = threading.RLock()  # Serialises the threads of this process
+    _depth = 0
+    _file = None
+
+    def __init__(self, exclusive: bool = False):
+        self.exclusive = exclusive
+        self.outermost = False  # Whether entering took the lock, rather than nesting in a hold of it
+
+    def __enter__(self):
+        lock = type(self)
+        lock._guard.acquire()
+        self.outermost = lock._depth == 0
+        if self.outermost:
+            lock._file = open(self.path, 'a')
+            if fcntl is not None:
+                fcntl.flock(lock._file.fileno(), fcntl.LOCK_EX if self.exclusive else fcntl.LOCK_SH)
+        lock._depth += 1
+        return self
+
+    def __exit__(self, *exc_info):
+        lock = type(self)
+        lock._depth -= 1
+        if lock._depth == 0:
+            if fcntl is not None:
+                fcntl.flock(lock._file.fileno(), fcntl.LOCK_UN)
+            lock._file.close()
+            lock._file = None
+        lock._guard.release()
+        return False
+
+
+class RegistrationLock(DataLock):
+    """
+    Exclusive lock held across every process while a patient's card number is checked and their
+    registration written, so two processes can't both register the same card. A lock of its own
+    rather than DataLock, which the journal takes to write the registration. Storage backends
+    keep its file next to their data (see StorageBackend.registration).
+    """
+    path = 'registration.lock'
+    _guard = threading.RLock()
+    _depth = 0
+    _file = None
+
+    def __init__(self, path: Optional[str] = None):
+        super().__init__(exclusive=True)
+        if path is not None:
+            self.path = path
+
 
 class DataManager:
+    # Orphaned records seen by the last load_appointments_from_json call
+    orphaned_appointments = {"patient": 0, "doctor": 0}
+    # Generation of each data file when this process last read or wrote it
+    loaded_versions: Dict[str, int] = {}
+
+    # --------------------------
+    # Record <-> object conversion (shared by the JSON files and the journal)
+    # --------------------------
+    def patient_to_dict(patient) -> Dict:
+        return {
+            "name": patient.name,
+            "contact_info": patient.contact_info,
+            "age": patient.age,
+            "gender": patient.gender,
+            "card_no": patient.card_no,
+            "date_of_birth": patient.date_of_birth,
+            "Specialization of Doctor Needed": patient.required_specialization,
+            "patient_id": patient.person_id
+        }
+
+    def patient_from_dict(patient_data) -> Patient:
+        patient = Patient(
+            name=patient_data['name'],
+            contact_info=patient_data['contact_info'],
+            age=patient_data['age'],
+            gender=patient_data['gender'],
+            card_no=patient_data['card_no'],
+            date_of_birth=canonical_date(patient_data['date_of_birth']),
+            required_specialization=patient_data['Specialization of Doctor Needed']
+        )
+        patient.person_id = patient_data['patient_id']
+        return patient
+
+    def doctor_to_dict(doctor) -> Dict:
+        # "schedule" lists single slots; recurring availability is written as its rules, plus
+        # the slots of those rules that are booked, instead of one entry per slot
+        doctor_data = {
+            "name": doctor.name,
+            "contact_info": doctor.contact_info,
+            "age": doctor.age,
+            "gender": doctor.gender,
+            "specialization": doctor.specialization,
+            "schedule": doctor.schedule.single_slots(),
+            "doctor_id": doctor.person_id
+        }
+        if doctor.schedule.rules:
+            doctor_data["availability_rules"] = [rule.to_dict() for rule in doctor.schedule.rules]
+            doctor_data["unavailable"] = doctor.schedule.unavailable_slots()
+        return doctor_data
+
+    def doctor_from_dict(doctor_data) -> Doctor:
+        doctor = Doctor(
+            name=doctor_data['name'],
+            contact_info=doctor_data['contact_info'],
+            age=doctor_data['age'],
+            gender=doctor_data['gender'],
+            specialization=doctor_data['specialization']
+        )
+        doctor.person_id = doctor_data['doctor_id']
+        # One bad slot doesn't reject the doctor: it is dropped (and reported) on its own
+        slots, rejected = DataManager.ingest_slots(doctor_data['schedule'])
+        unavailable, _ = DataManager.ingest_slots(doctor_data.get('unavailable', []))
+        if rejected:
+            print(f"Rejected {rejected} slot(s) of Dr. {doctor.name} with an invalid date or time.")
+        doctor.schedule = SlotSchedule(
+            slots,
+            [AvailabilityRule.from_dict(rule) for rule in doctor_data.get('availability_rules', [])],
+            unavailable
+        )
+        return doctor
+
+    def ingest_slots(slots) -> Tuple[List[Dict[str, str]], int]:
+        """Return the slots with canonical dates and times, and how many were dropped as invalid."""
+        valid = []
+        for slot in slots:
+            try:
+                date, time = canonical_slot(slot['date'], slot['time'])
+            except ValueError:
+                continue
+            valid.append({"date": date, "time": time})
+        return valid, len(slots) - len(valid)
+
+    def appointment_to_dict(appointment) -> Dict:
+        return {
+            "appointment_id": appointment.appointment_id,
+            "patient_id": appointment.patient.person_id,
+            "doctor_id": appointment.doctor.person_id,
+            "date": appointment.date,
+            "time": appointment.time,
+            "status": appointment.status
+        }
+
+    def appointment_from_dict(appointment_data, patient, doctor) -> Appointment:
+        date, time = canonical_slot(appointment_data['date'], appointment_data['time'])
+        appointment = Appointment(
+            patient=patient,
+            doctor=doctor,
+            date=date,
+            time=time,
+            status=appointment_data['status']
+        )
+        appointment.appointment_id = appointment_data['appointment_id']
+        return appointment
+
+    def ingest(records, convert, source: str) -> List:
+        """
+        Convert records with convert (e.g. patient_from_dict), skipping and reporting any
+        that it rejects with ValueError because of an invalid date or time.
+        """
+        converted = []
+        for record in records:
+            try:
+                converted.append(convert(record))
+            except ValueError as error:
+                print(f"Rejected a record in {source}: {error}")
+        return converted
+
+    # --------------------------
+    # Bulk import and export (CSV or JSON Lines, see bulk.py)
+    # --------------------------
+    def import_records(scheduler, path: str, kind: str, fmt: Optional[str] = None, **options) -> Dict[str, int]:
+        """
+        Stream "patients", "doctors" or "slots" from a CSV or JSON Lines file into the scheduler, validated,
+        deduplicated and committed in batches. Options: workers, batch_size, chunk_rows.
+        Returns how many rows were imported, skipped as duplicates and rejected.
+        """
+        import bulk  # bulk.py imports this module
+        return bulk.import_records(scheduler, path, kind, fmt, **options)
+
+    def export_records(scheduler, path: str, kind: str, fmt: Optional[str] = None) -> int:
+        """Stream the scheduler's "patients", "doctors" or "slots" to a CSV or JSON Lines file. Returns the row count."""
+        import bulk
+        return bulk.export_records(scheduler, path, kind, fmt)
+
+    def read_version(path: str) -> int:
+        """Return the generation number stamped next to a data file (0 if it was never stamped)."""
+        try:
+            with open(f"{path}.version", 'r') as f:
+                return int(f.read().strip() or 0)
+        except (FileNotFoundError, ValueError):
+            return 0
+
+    def read_json(path: str):
+        """Read a data file under a shared lock and remember which generation we saw."""
+        with DataLock():
+            DataManager.loaded_versions[path] = DataManager.read_version(path)
+            with open(path, 'r') as f:
+                return json.load(f)
+
+    def write_json(path: str, data, force: bool = False):
+        """
+        Write data to a JSON file atomically: dump to a temp file, fsync it,
+        then swap it in with os.replace so a crash never leaves a half-written file.
+        Holds the exclusive lock and bumps the file's generation. If another process
+        wrote a newer generation since we loaded it, raises StaleDataError instead of
+        clobbering it (unless force=True, for callers that already merged).
+        """
+        with DataLock(exclusive=True):
+            current = DataManager.read_version(path)
+            seen = DataManager.loaded_versions.get(path, current)
+            if current != seen and not force:
+                raise StaleDataError(f"{path} was changed by another process (generation {current}, "
+                                     f"we loaded {seen}). Reload before saving.")
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump(data, f, indent=4)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, path)
+            with open(f"{path}.version", 'w') as f:
+                f.write(str(current + 1))
+            DataManager.loaded_versions[path] = current + 1
+
+    # --------------------------
+    # Patients
+    # --------------------------
     def load_patients_from_json():
         try:
-             with open('patients.json', 'r') as f:
-                patients_data = json.load(f)
-                patients = []
-                for patient_data in patients_data:
-                    patient = Patient(
-                        name=patient_data['name'],
-                        contact_info=patient_data['contact_info'],
-                        age=patient_data['age'],
-                        gender=patient_data['gender'],
-                        card_no=patient_data['card_no'],
-                        date_of_birth=patient_data['date_of_birth'],
-                        required_specialization=patient_data['Specialization of Doctor Needed']
-                    )
-                    patient.person_id = patient_data['patient_id']
-                    patients.append(patient)
-                return patients
+             with DataLock():
+                patients_data = DataManager.read_json('patients.json')
+                return DataManager.ingest(patients_data, DataManager.patient_from_dict, 'patients.json')
         except FileNotFoundError:
             print("Patient database not found. Starting with an empty list.")
             return []
         except json.JSONDecodeError:
             print("Patient database is corrupted. Starting with an empty list.")
             return []
-    def save_patients_to_json(patients):
-        patients_data = []
-        for patient in patients:
-            patient_data = {
-                "name": patient.name,
-                "contact_info": patient.contact_info,
-                "age": patient.age,
-                "gender": patient.gender,
-                "card_no": patient.card_no,
-                "date_of_birth": patient.date_of_birth,
-                "Specialization of Doctor Needed": patient.required_specialization,
-                "patient_id": patient.person_id
-            }
-            patients_data.append(patient_data)
-        
-        with open('patients.json', 'w') as f:
-            json.dump(patients_data, f, indent=4)
+    def save_patients_to_json(patients, force: bool = False):
+        patients_data = [DataManager.patient_to_dict(patient) for patient in patients]
+        DataManager.write_json('patients.json', patients_data, force)
 
+    # --------------------------
+    # Doctors
+    # --------------------------
     def load_doctors_from_json():
         """
         Load doctor data from doctors.json and return a list of Doctor objects.
         """
         try:
-            with open('doctors.json', 'r') as f:
-                doctors_data = json.load(f)
-                doctors = []
-                for doctor_data in doctors_data:
-                    doctor = Doctor(
-                        name=doctor_data['name'],
-                        contact_info=doctor_data['contact_info'],
-                        age=doctor_data['age'],
-                        gender=doctor_data['gender'],
-                        specialization=doctor_data['specialization']
-                    )
-                    doctor.person_id = doctor_data['doctor_id']
-                    doctor.schedule = doctor_data['schedule']
-                    doctors.append(doctor)
-                return doctors
+            with DataLock():
+                doctors_data = DataManager.read_json('doctors.json')
+                return DataManager.ingest(doctors_data, DataManager.doctor_from_dict, 'doctors.json')
         except FileNotFoundError:
             print("Doctor database not found. Starting with an empty list.")
             return []
@@ -292,50 +2025,56 @@ class DataManager:
             print("Doctor database is corrupted. Starting with an empty list.")
             return []
 
-    def save_doctors_to_json(doctors):
+    def save_doctors_to_json(doctors, force: bool = False):
         """
         Save a list of Doctor objects to doctors.json.
         """
-        doctors_data = []
-        for doctor in doctors:
-            doctor_data = {
-                "name": doctor.name,
-                "contact_info": doctor.contact_info,
-                "age": doctor.age,
-                "gender": doctor.gender,
-                "specialization": doctor.specialization,
-                "schedule": doctor.schedule,
-                "doctor_id": doctor.person_id
-            }
-            doctors_data.append(doctor_data)
-        
-        with open('doctors.json', 'w') as f:
-            json.dump(doctors_data, f, indent=4)
-        
+        doctors_data = [DataManager.doctor_to_dict(doctor) for doctor in doctors]
+        DataManager.write_json('doctors.json', doctors_data, force)
+
+    # --------------------------
+    # Appointments
+    # --------------------------
     def load_appointments_from_json(patients, doctors):
         """
         Load appointment data from appointments.json and return a list of Appointment objects.
+        Patients and doctors are resolved through id maps built once (a hash join),
+        and appointments pointing at an unknown patient or doctor are counted and reported.
         """
         try:
-            with open('appointments.json', 'r') as f:
-                appointments_data = json.load(f)
+            with DataLock():
+                appointments_data = DataManager.read_json('appointments.json')
                 appointments = []
+                # Build the id -> object maps once instead of scanning per appointment;
+                # a lazy patient collection looks patients up in its own index instead
+                if hasattr(patients, "indexes"):
+                    patients_by_id = patients.indexes()[0]
+                else:
+                    patients_by_id = {p.person_id: p for p in patients}
+                doctors_by_id = {d.person_id: d for d in doctors}
+                orphaned = {"patient": 0, "doctor": 0}
+                rejected = 0
                 for appointment_data in appointments_data:
-                    patient = next((p for p in patients 
-                                   if p.person_id == appointment_data['patient_id']), None)
-                    doctor = next((d for d in doctors 
-                                  if d.person_id == appointment_data['doctor_id']), None)
+                    patient = patients_by_id.get(appointment_data['patient_id'])
+                    doctor = doctors_by_id.get(appointment_data['doctor_id'])
+
+                    if not patient:
+                        orphaned["patient"] += 1
+                    if not doctor:
+                        orphaned["doctor"] += 1
                     
                     if patient and doctor:
-                        appointment = Appointment(
-                            patient=patient,
-                            doctor=doctor,
-                            date=appointment_data['date'],
-                            time=appointment_data['time'],
-                            status=appointment_data['status']
-                        )
-                        appointment.appointment_id = appointment_data['appointment_id']
-                        appointments.append(appointment)
+                        try:
+                            appointments.append(DataManager.appointment_from_dict(appointment_data, patient, doctor))
+                        except ValueError as error:
+                            print(f"Rejected a record in appointments.json: {error}")
+                            rejected += 1
+                DataManager.orphaned_appointments = orphaned
+                skipped = len(appointments_data) - len(appointments) - rejected
+                if skipped:
+                    print(f"Skipped {skipped} orphaned appointment(s): "
+                          f"{orphaned['patient']} with unknown patient_id, "
+                          f"{orphaned['doctor']} with unknown doctor_id.")
                 return appointments
         except FileNotFoundError:
             print("Appointment database not found. Starting with an empty list.")
@@ -344,24 +2083,93 @@ class DataManager:
             print("Appointment database is corrupted. Starting with an empty list.")
             return []
     
-    def save_appointments_to_json(appointments):
+    def save_appointments_to_json(appointments, force: bool = False):
         """
         Save a list of Appointment objects to appointments.json.
         """
-        appointments_data = []
-        for appointment in appointments:
-            appointment_data = {
-                "appointment_id": appointment.appointment_id,
-                "patient_id": appointment.patient.person_id,
-                "doctor_id": appointment.doctor.person_id,
-                "date": appointment.date,
-                "time": appointment.time,
-                "status": appointment.status
+        appointments_data = [DataManager.appointment_to_dict(appointment) for appointment in appointments]
+        DataManager.write_json('appointments.json', appointments_data, force)
+
+    # --------------------------
+    # Waitlist
+    # --------------------------
+    def waitlist_entry_from_dict(entry_data) -> Dict:
+        """A waitlist entry with its fields checked; raises ValueError if one is invalid."""
+        try:
+            return {
+                "patient_id": str(entry_data["patient_id"]),
+                "specialization": sys.intern(str(entry_data["specialization"])),
+                "priority": int(entry_data["priority"]),
+                "sequence": int(entry_data["sequence"]),
+                "since": str(entry_data.get("since", "")),
+                "date": str(entry_data["date"]) if entry_data.get("date") else None,
+                "time": str(entry_data["time"]) if entry_data.get("time") else None,
             }
-            appointments_data.append(appointment_data)
-        
-        with open('appointments.json', 'w') as f:
-            json.dump(appointments_data, f, indent=4)
+        except (KeyError, TypeError, ValueError) as error:
+            raise ValueError(f"Invalid waitlist entry {entry_data!r}: {error}") from None
+
+    def load_waitlist_from_json() -> Waitlist:
+        """Load waitlist.json into a Waitlist, every patient keeping their place in the queue."""
+        waitlist = Waitlist()
+        try:
+            entries = DataManager.read_json('waitlist.json')
+        except FileNotFoundError:
+            return waitlist  # Nobody has had to wait yet
+        except json.JSONDecodeError:
+            print("Waitlist database is corrupted. Starting with an empty waitlist.")
+            return waitlist
+        for entry in DataManager.ingest(entries, DataManager.waitlist_entry_from_dict, 'waitlist.json'):
+            waitlist.add(entry)
+        return waitlist
+
+    def save_waitlist_to_json(waitlist, force: bool = False):
+        DataManager.write_json('waitlist.json', list(waitlist), force)
+
+    # --------------------------
+    # Binary snapshot (fast startup; the JSON files stay the interchange format)
+    # --------------------------
+    def json_stamps() -> Dict[str, Optional[List[int]]]:
+        """[generation, size, mtime] of each JSON data file, used to tell whether a snapshot still matches them."""
+        stamps = {}
+        for path in ('patients.json', 'doctors.json', 'appointments.json'):
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                stamps[path] = None
+                continue
+            stamps[path] = [DataManager.read_version(path), stat.st_size, stat.st_mtime_ns]
+        return stamps
+
+    def save_snapshot(patients, doctors, appointments, path: str = 'hospital.snapshot'):
+        """
+        Write patients, doctors and appointments to the binary snapshot. They must match the JSON
+        files as they are on disk now: the snapshot records the files' stamps and is only used
+        while those are unchanged.
+        """
+        from snapshot import write_snapshot  # snapshot.py imports this module
+        with DataLock(exclusive=True):
+            write_snapshot(path, patients, doctors, appointments, DataManager.json_stamps())
+
+    def load_snapshot(path: str = 'hospital.snapshot'):
+        """
+        Return (patients, doctors, appointments) from the binary snapshot, or None when it is
+        missing, damaged or older than the JSON files, in which case the caller loads the JSON files.
+        """
+        from snapshot import read_snapshot, SnapshotError
+        with DataLock():
+            stamps = DataManager.json_stamps()
+            try:
+                loaded = read_snapshot(path, stamps)
+            except FileNotFoundError:
+                return None
+            except SnapshotError as error:
+                print(f"Not using the binary snapshot: {error} Loading the JSON files instead.")
+                return None
+            for json_path, stamp in stamps.items():
+                if stamp is not None:
+                    DataManager.loaded_versions[json_path] = stamp[0]
+            DataManager.orphaned_appointments = {"patient": 0, "doctor": 0}
+            return loaded
 # # Testing the whole class
 # # ----------------------------
 # # Step 1: Create Doctors
@@ -0,0 +1,373 @@
+"""
+    Opt-in instrumentation for the Hospital Appointment System.
+
+    enable() wraps the hot methods of AppointmentScheduler, DataManager and
+    HospitalCLI so every call is counted and timed, JSON reads and writes are
+    counted in bytes per file, and index lookups (get_patient, get_doctor, ...)
+    are counted as hits or misses. Journal appends are counted in records and
+    bytes and every fsync is timed, and the binary snapshot's saves and loads
+    are timed and counted in bytes. disable() puts the original methods back,
+    so when metrics are off there is no wrapper and no overhead at all.
+
+    get_metrics() returns everything as a dict, and write_prometheus(path)
+    writes it in the Prometheus text format for a node-exporter textfile
+    collector. profile_action() runs cProfile around a single CLI action.
+
+    Usage: python HospitalCLI.py --metrics metrics.prom [--profile book_appointment]
+"""
+import cProfile
+import functools
+import inspect
+import math
+import os
+import pstats
+import threading
+import time
+
+from journal import Journal
+from main import AppointmentScheduler, DataManager
+
+# Methods timed on each class. CLI actions include the time spent waiting for input().
+SCHEDULER_OPERATIONS = [
+    "add_patient", "add_doctor", "add_doctor_slot", "merge_patients", "rebuild_indexes",
+    "book_appointment", "schedule_appointment", "schedule_batch", "cancel_appointment",
+    "reschedule_appointment", "find_doctors_by_specialization", "find_open_slots",
+    "find_next_available", "get_patient_appointments",
+]
+DATA_MANAGER_OPERATIONS = [
+    "load_patients_from_json", "save_patients_to_json", "load_doctors_from_json",
+    "save_doctors_to_json", "load_appointments_from_json", "save_appointments_to_json",
+]
+# DataManager methods reading or writing the binary snapshot, whose `path` argument names the file
+SNAPSHOT_OPERATIONS = {"save_snapshot": "written", "load_snapshot": "read"}
+CLI_OPERATIONS = [
+    "add_patient", "add_doctor", "add_doctor_slot", "list_patients", "list_doctors",
+    "view_appointments", "view_my_appointments", "book_appointment", "cancel_appointment",
+    "reschedule_appointment", "find_patient", "load_data", "save_data",
+]
+# Lookup method -> the index it reads; a None result counts as a miss
+SCHEDULER_LOOKUPS = {
+    "get_patient": "patients_by_id",
+    "get_patient_by_card_no": "patients_by_card_no",
+    "get_doctor": "doctors_by_id",
+    "get_appointment": "appointments_by_id",
+}
+
+
+class LatencyHistogram:
+    """
+    Latency histogram with log-spaced buckets (each 2^(1/8), about 9%, wider than the last)
+    from 1 microsecond to about 18 minutes. Memory is constant however many calls it sees,
+    and percentiles are accurate to one bucket.
+    """
+    __slots__ = ("counts", "count", "total", "max")
+
+    BASE = 1e-6
+    GROWTH = 2 ** 0.125
+    BUCKETS = 8 * 30
+
+    def __init__(self):
+        self.counts = [0] * self.BUCKETS
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds: float):
+        if seconds <= self.BASE:
+            index = 0
+        else:
+            index = min(self.BUCKETS - 1, int(math.log(seconds / self.BASE, self.GROWTH)) + 1)
+        self.counts[index] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def percentile(self, fraction: float) -> float:
+        """Upper bound of the bucket holding the given fraction (0.5 for p50) of the calls."""
+        if not self.count:
+            return 0.0
+        rank = max(1, math.ceil(fraction * self.count))
+        seen = 0
+        for index, bucket_count in enumerate(self.counts):
+            seen += bucket_count
+            if seen >= rank:
+                return min(self.max, self.BASE * self.GROWTH ** index)
+        return self.max
+
+
+class Metrics:
+    """The counters and histograms that the instrumented methods update."""
+
+    def __init__(self):
+        self._lock = threading.Lock()  # Operations may run on several threads (bookings, the service)
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.latencies = {}  # operation -> LatencyHistogram
+            self.errors = {}     # operation -> calls that raised
+            self.files = {}      # path -> {"bytes_read", "bytes_written", "reads", "writes"}
+            self.lookups = {}    # index -> {"hits", "misses"}
+            self.journal = {"appends": 0, "records": 0, "bytes": 0}
+
+    def observe(self, operation: str, seconds: float, failed: bool = False):
+        with self._lock:
+            histogram = self.latencies.get(operation)
+            if histogram is None:
+                histogram = self.latencies[operation] = LatencyHistogram()
+            histogram.observe(seconds)
+            if failed:
+                self.errors[operation] = self.errors.get(operation, 0) + 1
+
+    def count_file(self, path: str, read: int = 0, written: int = 0):
+        with self._lock:
+            stats = self.files.setdefault(path, {"bytes_read": 0, "bytes_written": 0, "reads": 0, "writes": 0})
+            if read:
+                stats["bytes_read"] += read
+                stats["reads"] += 1
+            if written:
+                stats["bytes_written"] += written
+                stats["writes"] += 1
+
+    def count_lookup(self, index: str, hit: bool):
+        with self._lock:
+            stats = self.lookups.setdefault(index, {"hits": 0, "misses": 0})
+            stats["hits" if hit else "misses"] += 1
+
+    def count_journal(self, path: str, records: int, written: int):
+        self.count_file(path, written=written)
+        with self._lock:
+            self.journal["appends"] += 1
+            self.journal["records"] += records
+            self.journal["bytes"] += written
+
+    def snapshot(self):
+        with self._lock:
+            operations = {}
+            for operation, histogram in sorted(self.latencies.items()):
+                operations[operation] = {
+                    "calls": histogram.count,
+                    "errors": self.errors.get(operation, 0),
+                    "total_s": histogram.total,
+                    "mean_s": histogram.total / histogram.count,
+                    "p50_s": histogram.percentile(0.50),
+                    "p95_s": histogram.percentile(0.95),
+                    "p99_s": histogram.percentile(0.99),
+                    "max_s": histogram.max,
+                }
+            return {
+                "enabled": bool(_originals),
+                "operations": operations,
+                "files": {path: dict(stats) for path, stats in sorted(self.files.items())},
+                "indexes": {index: dict(stats) for index, stats in sorted(self.lookups.items())},
+                "journal": dict(self.journal),
+            }
+
+
+METRICS = Metrics()
+_originals = {}  # (class, method name) -> the method enable() replaced
+
+
+def _timed(operation: str, method):
+    @functools.wraps(method)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        failed = True
+        try:
+            result = method(*args, **kwargs)
+            failed = False
+            return result
+        finally:
+            METRICS.observe(operation, time.perf_counter() - start, failed)
+    return wrapper
+
+
+def _counted_lookup(index: str, method):
+    @functools.wraps(method)
+    def wrapper(*args, **kwargs):
+        result = method(*args, **kwargs)
+        METRICS.count_lookup(index, result is not None)
+        return result
+    return wrapper
+
+
+def _file_io(direction: str, method):
+    # read_json(path) / write_json(path, data, ...): the file's size is what was read or written
+    @functools.wraps(method)
+    def wrapper(path, *args, **kwargs):
+        result = method(path, *args, **kwargs)
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            size = 0
+        METRICS.count_file(path, **{direction: size})
+        return result
+    return wrapper
+
+
+def _journal_write(method):
+    # Journal._write(batch) writes [(ticket, data, record count)] and returns the error if it failed.
+    # json.dumps escapes anything outside ASCII, so the data is as many bytes as characters.
+    @functools.wraps(method)
+    def wrapper(journal, batch):
+        error = method(journal, batch)
+        if error is None:
+            METRICS.count_journal(journal.path, sum(count for _, _, count in batch),
+                                  sum(len(data) for _, data, _ in batch))
+        return error
+    return wrapper
+
+
+def _snapshot_io(direction: str, method):
+    # save_snapshot(..., path) / load_snapshot(path): the snapshot's size is what was written or read.
+    # A load that returns None fell back to the JSON files without using the snapshot.
+    signature = inspect.signature(method)
+
+    @functools.wraps(method)
+    def wrapper(*args, **kwargs):
+        result = method(*args, **kwargs)
+        if direction == "written" or result is not None:
+            arguments = signature.bind(*args, **kwargs)
+            arguments.apply_defaults()
+            path = arguments.arguments["path"]
+            try:
+                size = os.path.getsize(path)
+            except OSError:
+                size = 0
+            METRICS.count_file(path, **{direction: size})
+        return result
+    return wrapper
+
+
+def _wrap(cls, name: str, wrapper):
+    if (cls, name) not in _originals:
+        _originals[(cls, name)] = cls.__dict__[name]
+        setattr(cls, name, wrapper(cls.__dict__[name]))
+
+
+def enable(cli_class=None):
+    """
+    Start recording metrics. Safe to call more than once.
+    Pass the HospitalCLI class when running HospitalCLI.py as a script, where it lives in __main__.
+    """
+    if cli_class is None:
+        from HospitalCLI import HospitalCLI as cli_class  # Imported here because HospitalCLI imports this module
+    for name in SCHEDULER_OPERATIONS:
+        _wrap(AppointmentScheduler, name, functools.partial(_timed, f"AppointmentScheduler.{name}"))
+    for name, index in SCHEDULER_LOOKUPS.items():
+        _wrap(AppointmentScheduler, name, functools.partial(_counted_lookup, index))
+    for name in DATA_MANAGER_OPERATIONS:
+        _wrap(DataManager, name, functools.partial(_timed, f"DataManager.{name}"))
+    _wrap(DataManager, "read_json", functools.partial(_file_io, "read"))
+    _wrap(DataManager, "write_json", functools.partial(_file_io, "written"))
+    for name, direction in SNAPSHOT_OPERATIONS.items():
+        _wrap(DataManager, name, lambda method, name=name, direction=direction:
+              _timed(f"DataManager.{name}", _snapshot_io(direction, method)))
+    _wrap(Journal, "_write", _journal_write)
+    _wrap(Journal, "_fsync", functools.partial(_timed, "Journal.fsync"))
+    for name in CLI_OPERATIONS:
+        _wrap(cli_class, name, functools.partial(_timed, f"HospitalCLI.{name}"))
+
+
+def disable():
+    """Stop recording and restore the original methods. Recorded metrics are kept until reset()."""
+    for (cls, name), method in _originals.items():
+        setattr(cls, name, method)
+    _originals.clear()
+
+
+def reset():
+    METRICS.reset()
+
+
+def get_metrics():
+    """
+    Return every metric recorded so far:
+    {"enabled": ..., "operations": {name: {"calls", "errors", "total_s", "mean_s", "p50_s", "p95_s", "p99_s", "max_s"}},
+     "files": {path: {"bytes_read", "bytes_written", "reads", "writes"}},
+     "indexes": {name: {"hits", "misses"}},
+     "journal": {"appends", "records", "bytes"}}
+    Journal fsyncs are timed as the "Journal.fsync" operation.
+    """
+    return METRICS.snapshot()
+
+
+def _label(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def to_prometheus(metrics=None) -> str:
+    """Render get_metrics() in the Prometheus text exposition format."""
+    metrics = metrics or get_metrics()
+    lines = [
+        "# HELP hospital_operation_duration_seconds Time spent per call of each operation.",
+        "# TYPE hospital_operation_duration_seconds summary",
+    ]
+    for operation, stats in metrics["operations"].items():
+        labels = f'operation="{_label(operation)}"'
+        for quantile in ("0.5", "0.95", "0.99"):
+            key = {"0.5": "p50_s", "0.95": "p95_s", "0.99": "p99_s"}[quantile]
+            lines.append(f'hospital_operation_duration_seconds{{{labels},quantile="{quantile}"}} {stats[key]:.9f}')
+        lines.append(f"hospital_operation_duration_seconds_sum{{{labels}}} {stats['total_s']:.9f}")
+        lines.append(f"hospital_operation_duration_seconds_count{{{labels}}} {stats['calls']}")
+    lines += [
+        "# HELP hospital_operation_errors_total Calls of each operation that raised an exception.",
+        "# TYPE hospital_operation_errors_total counter",
+    ]
+    for operation, stats in metrics["operations"].items():
+        lines.append(f'hospital_operation_errors_total{{operation="{_label(operation)}"}} {stats["errors"]}')
+    for direction in ("read", "written"):
+        lines += [
+            f"# HELP hospital_file_bytes_{direction}_total Bytes of each data file {direction}.",
+            f"# TYPE hospital_file_bytes_{direction}_total counter",
+        ]
+        for path, stats in metrics["files"].items():
+            lines.append(f'hospital_file_bytes_{direction}_total{{file="{_label(path)}"}} {stats[f"bytes_{direction}"]}')
+    for name, description in (("appends", "Writes to the journal (one per group commit)."),
+                              ("records", "Records appended to the journal."),
+                              ("bytes", "Bytes appended to the journal.")):
+        lines += [
+            f"# HELP hospital_journal_{name}_total {description}",
+            f"# TYPE hospital_journal_{name}_total counter",
+            f"hospital_journal_{name}_total {metrics['journal'][name]}",
+        ]
+    lines += [
+        "# HELP hospital_index_lookups_total Index lookups, by whether the key was found.",
+        "# TYPE hospital_index_lookups_total counter",
+    ]
+    for index, stats in metrics["indexes"].items():
+        lines.append(f'hospital_index_lookups_total{{index="{_label(index)}",result="hit"}} {stats["hits"]}')
+        lines.append(f'hospital_index_lookups_total{{index="{_label(index)}",result="miss"}} {stats["misses"]}')
+    return "\n".join(lines) + "\n"
+
+
+def write_prometheus(path: str):
+    """Write the metrics to a Prometheus text file; the file is swapped in whole so scrapers never see half of it."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        f.write(to_prometheus())
+    os.replace(tmp_path, path)
+
+
+def profile_action(target, name: str, output: str = None, limit: int = 25):
+    """
+    Run cProfile around the next call of target.<name> (e.g. a HospitalCLI action such as
+    "book_appointment") only. The 25 most expensive functions are printed afterwards, and
+    the raw stats are saved to `output` (for snakeviz, pstats, ...) when it is given.
+    """
+    method = getattr(target, name)
+
+    @functools.wraps(method)
+    def profiled(*args, **kwargs):
+        del target.__dict__[name]  # Only this one call is profiled
+        profiler = cProfile.Profile()
+        try:
+            return profiler.runcall(method, *args, **kwargs)
+        finally:
+            if output:
+                profiler.dump_stats(output)
+            print(f"\n--- Profile of {name} ---")
+            pstats.Stats(profiler).sort_stats("cumulative").print_stats(limit)
+
+    setattr(target, name, profiled)
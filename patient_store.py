@@ -0,0 +1,486 @@
+"""
+    JSON Lines patient store for the Hospital Appointment System.
+
+    patients.json has to be parsed whole, and a Patient built for every record,
+    before the first lookup can run. The patient store keeps the registry in
+    patients.jsonl instead, one record per line exactly as
+    DataManager.patient_to_dict writes it, and only parses the patients that
+    are actually used:
+
+      - patients.jsonl.idx, a sidecar index, maps the hash of every patient_id
+        and card number to the byte offset of its line. Both tables are sorted,
+        so a lookup is a binary search straight in the memory-mapped index.
+      - patients.jsonl is memory-mapped as well, and a line is only parsed into
+        a Patient when that patient is looked up.
+      - The most recently used patients stay in an LRU cache, and a patient
+        still referenced elsewhere (by an appointment, the CLI, ...) is always
+        returned as the same object.
+
+    Memory and startup time therefore stay flat however many patients there
+    are. New patients are appended to patients.jsonl; lines the index doesn't
+    cover yet are found by scanning the end of the file, and write_index() (run
+    by compaction) folds them into the index.
+
+    Index layout (native byte order, which the header records; the index is
+    rebuilt rather than read on a machine with the other one):
+        header: magic b"HOSPPIDX" | format version (u32) | byte order (b"<" or b">", padded to u32)
+                | bytes of patients.jsonl indexed (u64) | patient_id entries (u64) | card number entries (u64)
+        the patient_id table, then the card number table, each the sorted blake2b-64
+        hashes of the keys (u64) followed by the offsets of their lines (u64).
+        A matching hash is confirmed against the record itself, so collisions are harmless.
+
+    Usage: python patient_store.py [--export]
+        Converts patients.json into the store (startup does this too) and indexes it;
+        --export writes the store back to patients.json.
+"""
+import argparse
+import hashlib
+import json
+import mmap
+import os
+import shutil
+import struct
+import sys
+import tempfile
+import threading
+import weakref
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict
+from collections.abc import MutableMapping
+from heapq import merge
+from typing import Optional
+
+from main import DataLock, DataManager, Patient
+
+MAGIC = b"HOSPPIDX"
+FORMAT_VERSION = 1
+HEADER = struct.Struct("=8sI4sQQQ")
+BYTEORDER = b"<" if sys.byteorder == "little" else b">"
+IDS, CARDS = 0, 1  # The index's two tables
+REINDEX_AFTER = 1000  # Unindexed lines found at startup before the index is rewritten
+CHUNK = 65536  # Index entries read or written at a time
+
+
+def key_hash(key: str) -> int:
+    return int.from_bytes(hashlib.blake2b(key.encode('utf-8'), digest_size=8).digest(), 'little')
+
+
+def card_key(card_no) -> str:
+    """Card numbers are matched the way AppointmentScheduler indexes them."""
+    return str(card_no).strip()
+
+
+class PatientStore:
+    def __init__(self, path: str = 'patients.jsonl', cache_size: int = 1024):
+        self.path = path
+        self.index_path = f"{path}.idx"
+        self.cache_size = cache_size  # Patients kept parsed after their last use
+        self._lock = threading.RLock()
+        self._cache = OrderedDict()                 # patient_id -> Patient, least recently used first
+        self._live = weakref.WeakValueDictionary()  # patient_id -> every parsed Patient still in use
+        self._data = None          # mmap of patients.jsonl (None while it is empty)
+        self._size = 0             # Bytes of patients.jsonl scanned, always up to the end of a line
+        self._tables = None        # (hashes, offsets) u64 views of each table of the mapped index
+        self._index_stat = None    # (inode, mtime) of the index file last looked at
+        self._covered = 0          # Bytes of patients.jsonl the index covers
+        self._counts = (0, 0)      # Entries in the index's two tables
+        self._recent_ids = {}      # patient_id -> offset, for the lines after the indexed part
+        self._recent_cards = {}    # card number -> offset of its first line after the indexed part
+
+    # --------------------------
+    # Opening and indexing
+    # --------------------------
+    def open(self, json_path: str = 'patients.json') -> "PatientStore":
+        """Open the store, first converting json_path into it if there is no store yet."""
+        with self._lock, DataLock():
+            if not os.path.exists(self.path):
+                self._import_json(json_path)
+            self.refresh()
+            if len(self._recent_ids) > REINDEX_AFTER:
+                self.write_index()
+        return self
+
+    def _import_json(self, json_path: str):
+        try:
+            records = DataManager.read_json(json_path)
+        except FileNotFoundError:
+            records = []
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as f:
+            for record in records:
+                f.write(json.dumps(record, separators=(',', ':')) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        try:
+            os.link(tmp_path, self.path)  # Unlike os.replace, never clobbers a store another process just created
+        except FileExistsError:
+            pass
+        finally:
+            os.remove(tmp_path)
+
+    def refresh(self):
+        """Pick up a newer index and the lines appended since we last looked (by any process)."""
+        with self._lock:
+            try:
+                stat = os.stat(self.index_path)
+                if (stat.st_ino, stat.st_mtime_ns) != self._index_stat:
+                    self._load_index()
+            except FileNotFoundError:
+                pass
+            # Mapped after the index is checked, so the mapping always covers what the index points at
+            size = os.path.getsize(self.path)
+            if size > (len(self._data) if self._data is not None else 0):
+                with open(self.path, 'rb') as f:
+                    # The old mapping isn't closed: a listing may still be reading it
+                    self._data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            if size > self._size:
+                self._scan(size)
+
+    def _load_index(self):
+        with open(self.index_path, 'rb') as f:
+            stat = os.fstat(f.fileno())
+            self._index_stat = (stat.st_ino, stat.st_mtime_ns)
+            try:
+                index = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                index = b""  # Empty file
+        if len(index) >= HEADER.size:
+            magic, version, byteorder, covered, id_count, card_count = HEADER.unpack_from(index)
+            if (magic == MAGIC and version == FORMAT_VERSION and byteorder.rstrip(b"\0") == BYTEORDER
+                    and len(index) == HEADER.size + (id_count + card_count) * 16
+                    and covered <= os.path.getsize(self.path)):
+                # The old index's views are simply dropped, not released: a lookup may still be using them
+                entries = memoryview(index)[HEADER.size:].cast('Q')
+                self._tables = (
+                    (entries[:id_count], entries[id_count:2 * id_count]),
+                    (entries[2 * id_count:2 * id_count + card_count], entries[2 * id_count + card_count:]),
+                )
+                self._covered, self._counts = covered, (id_count, card_count)
+                # Lines the new index covers no longer need entries of their own
+                self._recent_ids = {key: offset for key, offset in self._recent_ids.items() if offset >= covered}
+                self._recent_cards = {key: offset for key, offset in self._recent_cards.items() if offset >= covered}
+                self._size = max(self._size, covered)
+                return
+        print(f"Not using the patient index {self.index_path}: it is damaged or out of date. "
+              "Scanning patients.jsonl instead.")
+
+    def _scan(self, end: int):
+        """Note the patient_id and card number of every complete line from self._size to end."""
+        data, position = self._data, self._size
+        while position < end:
+            newline = data.find(b"\n", position, end)
+            if newline < 0:
+                break  # A line still being written, or cut short by a crash
+            line = data[position:newline]
+            if line.strip():
+                try:
+                    record = json.loads(line)
+                    patient_id, card = record['patient_id'], card_key(record['card_no'])
+                except (ValueError, KeyError, TypeError):
+                    print(f"Skipping the damaged patient record at byte {position} of {self.path}.")
+                else:
+                    self._recent_ids.setdefault(patient_id, position)
+                    self._recent_cards.setdefault(card, position)
+            position = newline + 1
+        self._size = position
+
+    def write_index(self):
+        """Write a new index covering every line of patients.jsonl, so no process has to scan any of it."""
+        with self._lock, DataLock():
+            self.refresh()
+            # The index must never point at lines that aren't safely on disk yet
+            with open(self.path, 'rb') as f:
+                os.fsync(f.fileno())
+            tables = [
+                merge(self._entries(IDS), sorted((key_hash(key), offset) for key, offset in self._recent_ids.items())),
+                merge(self._entries(CARDS), sorted((key_hash(key), offset) for key, offset in self._recent_cards.items())),
+            ]
+            tmp_path = f"{self.index_path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(b"\0" * HEADER.size)  # Filled in once the tables are written
+                counts = [self._write_entries(f, table) for table in tables]
+                f.seek(0)
+                f.write(HEADER.pack(MAGIC, FORMAT_VERSION, BYTEORDER, self._size, *counts))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.index_path)
+            self._load_index()
+
+    def _entries(self, table: int):
+        """The (hash, offset) entries of one of the index's tables, in order."""
+        if self._tables is None:
+            return
+        hashes, offsets = self._tables[table]
+        for start in range(0, len(hashes), CHUNK):
+            yield from zip(hashes[start:start + CHUNK].tolist(), offsets[start:start + CHUNK].tolist())
+
+    @staticmethod
+    def _write_entries(f, entries) -> int:
+        """Write a table (all hashes, then all offsets); the offsets go through a temp file to keep memory flat."""
+        count = 0
+        with tempfile.TemporaryFile() as offsets:
+            hashes_chunk, offsets_chunk = array('Q'), array('Q')
+            for hashed, offset in entries:
+                hashes_chunk.append(hashed)
+                offsets_chunk.append(offset)
+                count += 1
+                if len(hashes_chunk) >= CHUNK:
+                    hashes_chunk.tofile(f)
+                    offsets_chunk.tofile(offsets)
+                    del hashes_chunk[:], offsets_chunk[:]
+            hashes_chunk.tofile(f)
+            offsets_chunk.tofile(offsets)
+            offsets.seek(0)
+            shutil.copyfileobj(offsets, f)
+        return count
+
+    def close(self):
+        with self._lock:
+            if self._data is not None:
+                self._data.close()
+            # The index's mapping is closed once the views on it are gone
+            self._data = self._tables = self._index_stat = None
+            self._size = self._covered = 0
+            self._counts = (0, 0)
+            self._recent_ids, self._recent_cards = {}, {}
+            self._cache.clear()
+
+    # --------------------------
+    # Lookups
+    # --------------------------
+    def _search(self, table: int, key: str):
+        """Offsets of the lines whose key hashes like `key` in one of the index's tables, in file order."""
+        if self._tables is None:
+            return
+        hashes, offsets = self._tables[table]
+        target = key_hash(key)
+        position = bisect_left(hashes, target)
+        while position < len(hashes) and hashes[position] == target:
+            yield offsets[position]
+            position += 1
+
+    def _read(self, offset: int):
+        data = self._data
+        return json.loads(str(data[offset:data.find(b"\n", offset)], 'utf-8'))
+
+    def _find(self, patient_id: str):
+        """The record of a patient_id, or None."""
+        for offset in self._search(IDS, patient_id):
+            record = self._read(offset)
+            if record.get('patient_id') == patient_id:
+                return record
+        offset = self._recent_ids.get(patient_id)
+        return None if offset is None else self._read(offset)
+
+    def _find_card(self, card: str):
+        """The record of the first patient registered with a card number, or None."""
+        for offset in self._search(CARDS, card):
+            record = self._read(offset)
+            if card_key(record.get('card_no')) == card:
+                return record
+        offset = self._recent_cards.get(card)
+        return None if offset is None else self._read(offset)
+
+    def _patient(self, record) -> Patient:
+        """The Patient for a record: the one already in use, or a newly parsed one."""
+        patient = self._live.get(record['patient_id'])
+        if patient is None:
+            patient = DataManager.patient_from_dict(record)
+            self._live[patient.person_id] = patient
+        return patient
+
+    def _touch(self, patient: Patient):
+        self._cache[patient.person_id] = patient
+        self._cache.move_to_end(patient.person_id)
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    def get(self, patient_id: str) -> Optional[Patient]:
+        with self._lock:
+            patient = self._live.get(patient_id)
+            if patient is None:
+                record = self._find(patient_id)
+                if record is None:
+                    self.refresh()  # Another process may have registered them since
+                    record = self._find(patient_id)
+                    if record is None:
+                        return None
+                patient = self._patient(record)
+            self._touch(patient)
+            return patient
+
+    def get_by_card_no(self, card_no) -> Optional[Patient]:
+        card = card_key(card_no)
+        with self._lock:
+            record = self._find_card(card)
+            if record is None:
+                self.refresh()
+                record = self._find_card(card)
+                if record is None:
+                    return None
+            patient = self._patient(record)
+            self._touch(patient)
+            return patient
+
+    def contains(self, patient_id: str) -> bool:
+        with self._lock:
+            if patient_id in self._live or self._find(patient_id) is not None:
+                return True
+            self.refresh()
+            return self._find(patient_id) is not None
+
+    def add(self, patient: Patient) -> bool:
+        """
+        Append a new patient; returns False if their patient_id is already stored.
+        The line isn't fsynced: the journal record of the registration is, and
+        write_index() syncs the file before compaction empties the journal.
+        """
+        line = json.dumps(DataManager.patient_to_dict(patient), separators=(',', ':')) + "\n"
+        with self._lock, DataLock():
+            if self.contains(patient.person_id):
+                return False
+            with open(self.path, 'a+b') as f:
+                f.seek(0, os.SEEK_END)
+                if f.tell():
+                    f.seek(-1, os.SEEK_END)
+                    if f.read(1) != b"\n":
+                        line = "\n" + line  # Never run on from a line cut short by a crash
+                f.write(line.encode('utf-8'))
+            self._live[patient.person_id] = patient
+            self.refresh()
+            self._touch(patient)
+            return True
+
+    def __len__(self) -> int:
+        with self._lock:
+            self.refresh()
+            return self._counts[IDS] + len(self._recent_ids)
+
+    def __iter__(self):
+        """Every patient in file order, parsed one at a time."""
+        with self._lock:
+            self.refresh()
+            data, end = self._data, self._size
+        position = 0
+        while position < end:
+            newline = data.find(b"\n", position, end)
+            line = data[position:newline]
+            position = newline + 1
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue  # Blank or damaged; reported when the line was scanned
+            with self._lock:
+                patient = self._patient(record)
+            yield patient
+
+    def patients(self) -> "LazyPatients":
+        return LazyPatients(self)
+
+
+class PatientsById(MutableMapping):
+    """patient_id -> Patient view of a PatientStore, in place of AppointmentScheduler.patients_by_id."""
+
+    def __init__(self, store: PatientStore):
+        self.store = store
+
+    def __getitem__(self, patient_id):
+        patient = self.store.get(patient_id)
+        if patient is None:
+            raise KeyError(patient_id)
+        return patient
+
+    def get(self, patient_id, default=None):
+        patient = self.store.get(patient_id)
+        return default if patient is None else patient
+
+    def __contains__(self, patient_id):
+        return self.store.contains(patient_id)
+
+    def __setitem__(self, patient_id, patient):
+        self.store.add(patient)  # A no-op for a patient that is already stored
+
+    def __delitem__(self, patient_id):
+        raise TypeError("Patients can't be removed from the patient store.")
+
+    def __iter__(self):
+        return (patient.person_id for patient in self.store)
+
+    def __len__(self):
+        return len(self.store)
+
+
+class PatientsByCardNo(MutableMapping):
+    """card number -> Patient view of a PatientStore, in place of AppointmentScheduler.patients_by_card_no."""
+
+    def __init__(self, store: PatientStore):
+        self.store = store
+
+    def __getitem__(self, card_no):
+        patient = self.store.get_by_card_no(card_no)
+        if patient is None:
+            raise KeyError(card_no)
+        return patient
+
+    def get(self, card_no, default=None):
+        patient = self.store.get_by_card_no(card_no)
+        return default if patient is None else patient
+
+    def __contains__(self, card_no):
+        return self.store.get_by_card_no(card_no) is not None
+
+    def __setitem__(self, card_no, patient):
+        self.store.add(patient)
+
+    def __delitem__(self, card_no):
+        raise TypeError("Patients can't be removed from the patient store.")
+
+    def __iter__(self):
+        # Like the dict it replaces, the first patient registered with a card number owns it
+        return iter(dict.fromkeys(card_key(patient.card_no) for patient in self.store))
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+
+class LazyPatients:
+    """
+    Stands in for the AppointmentScheduler.patients list: iterating parses one patient at a time,
+    append() adds to the store, and indexes() provides patients_by_id and patients_by_card_no.
+    """
+
+    def __init__(self, store: PatientStore):
+        self.store = store
+
+    def __iter__(self):
+        return iter(self.store)
+
+    def __len__(self):
+        return len(self.store)
+
+    def append(self, patient: Patient):
+        self.store.add(patient)
+
+    def indexes(self):
+        return PatientsById(self.store), PatientsByCardNo(self.store)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Convert patients.json into the JSON Lines patient store and index it.")
+    parser.add_argument("--export", action="store_true", help="write the store back to patients.json instead")
+    args = parser.parse_args(argv)
+    store = PatientStore().open()
+    try:
+        if args.export:
+            DataManager.save_patients_to_json(store, force=True)
+            print(f"Exported {len(store)} patients to patients.json.")
+        else:
+            store.write_index()
+            print(f"Indexed {len(store)} patients in {store.path}.")
+    finally:
+        store.close()
+
+
+if __name__ == "__main__":
+    main()
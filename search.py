@@ -0,0 +1,219 @@
+"""
+    Fuzzy search over patients and doctors for the Hospital Appointment System.
+
+    A SearchIndex maps each word of a record's fields (name, contact info,
+    card number, ...) to the IDs of the records containing it. Queries match
+    a word exactly, by prefix ("ada" finds "Adaeze"), for digits also by
+    suffix (the last digits of a phone number), and for alphabetic words
+    despite a typo or two ("jonh" finds "John"). Results are ranked: exact
+    matches first, then shorter completions, then closer misspellings.
+
+    Prefix search bisects a sorted list of the distinct words, and typo search
+    only compares words sharing trigrams with the query, so a query costs
+    time in proportion to the words and records it matches rather than to the
+    number of records indexed.
+"""
+import re
+from bisect import bisect_left, insort
+from collections import Counter
+from heapq import nlargest
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+WORD = re.compile(r"\w+")
+NOT_DIGITS = re.compile(r"\D+")
+PHONE_PUNCTUATION = re.compile(r"[\s()+.\-/]+")
+
+EXACT = 3.0   # Score of a query word matching a whole word
+PREFIX = 2.0  # Plus up to 1 for how much of the word the query covers
+TYPO = 1.0    # Plus up to 1 for how few edits the query is away
+
+
+def words(text) -> Set[str]:
+    """The searchable words of a field: its casefolded words, plus its digits run together for phone numbers."""
+    text = str(text).casefold()
+    found = WORD.findall(text)
+    if len(found) > 1:
+        digits = NOT_DIGITS.sub("", text)
+        if len(digits) >= 3:
+            found.append(digits)  # "+44 (20) 7946-0018" is also found as 442079460018
+    return set(found)
+
+
+def query_words(query: str) -> List[str]:
+    """Split a query like words() does; a query of digits and phone punctuation is one number."""
+    query = query.strip().casefold()
+    number = PHONE_PUNCTUATION.sub("", query)
+    if number.isdigit():
+        return [number]
+    return list(dict.fromkeys(WORD.findall(query)))
+
+
+def trigrams(word: str) -> Set[str]:
+    padded = f"${word}$"
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def edit_distance(a: str, b: str, limit: int) -> int:
+    """
+    Number of insertions, deletions, substitutions and swaps of neighbouring letters that turn a into b,
+    or limit + 1 as soon as it is certain to be more than limit.
+    """
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    before, previous = None, list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (a[i - 1] != b[j - 1]))
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], before[j - 2] + 1)
+        if min(current) > limit:
+            return limit + 1
+        before, previous = previous, current
+    return previous[-1]
+
+
+class SearchIndex:
+    MAX_EXPANSIONS = 1000  # Most index words one query word may expand to by prefix, suffix or typo
+    INSORT_LIMIT = 64      # Words added since the last search that are inserted one by one rather than re-sorted
+
+    def __init__(self, fields: Callable[[object], Iterable], lookup: Callable[[str], Optional[object]]):
+        self.fields = fields  # record -> the values to index, e.g. (name, contact_info, card_no)
+        self.lookup = lookup  # ID -> record, e.g. AppointmentScheduler.get_patient
+        self.postings: Dict[str, List[str]] = {}  # word -> IDs of the records containing it, in the order added
+        self.sorted_words: List[str] = []         # Every word, sorted, for prefix search
+        self.reversed_numbers: List[str] = []     # Every all-digit word reversed, sorted, for suffix search
+        self.trigrams: Dict[str, List[str]] = {}  # trigram -> alphabetic words containing it, for typo search
+        self._new_words: List[str] = []           # Words not in the sorted lists yet
+
+    def __len__(self) -> int:
+        return len(self.postings)
+
+    def add(self, key: str, record):
+        """Index a record under its ID."""
+        for value in self.fields(record):
+            if value is None:
+                continue
+            for word in words(value):
+                keys = self.postings.get(word)
+                if keys is None:
+                    self.postings[word] = [key]
+                    self._new_words.append(word)
+                    if word.isalpha() and len(word) > 1:
+                        for gram in trigrams(word):
+                            self.trigrams.setdefault(gram, []).append(word)
+                elif keys[-1] != key:  # A word repeated in one record is indexed once
+                    keys.append(key)
+
+    def add_many(self, records: Iterable[Tuple[str, object]]):
+        """Index many (ID, record) pairs; the sorted lists are built once, on the next search."""
+        for key, record in records:
+            self.add(key, record)
+
+    def _sort_new_words(self):
+        new_words, self._new_words = self._new_words, []
+        numbers = [word[::-1] for word in new_words if word.isdigit()]
+        if len(new_words) <= self.INSORT_LIMIT:
+            for word in new_words:
+                insort(self.sorted_words, word)
+            for number in numbers:
+                insort(self.reversed_numbers, number)
+        else:
+            self.sorted_words.extend(new_words)
+            self.sorted_words.sort()
+            self.reversed_numbers.extend(numbers)
+            self.reversed_numbers.sort()
+
+    def search(self, query: str, limit: int = 10) -> List[object]:
+        """
+        Records matching every word of the query, best match first. A record's score is the sum,
+        over the query words, of its best matching word's score (exact > prefix or suffix > typo).
+        """
+        if self._new_words:
+            self._sort_new_words()
+        expansions = [self._expand(term) for term in query_words(query)]
+        if not expansions or not all(expansions):
+            return []
+        if len(expansions) == 1:
+            keys = self._ranked(expansions[0], limit)
+        else:
+            keys = self._intersect(expansions, limit)
+        return [record for record in map(self.lookup, keys) if record is not None]
+
+    def _expand(self, term: str) -> Dict[str, float]:
+        """Index words the query word matches -> score."""
+        found = {}
+        if term in self.postings:
+            found[term] = EXACT
+        for word in self._prefixed(self.sorted_words, term):
+            found.setdefault(word, PREFIX + len(term) / len(word))
+        if term.isdigit():
+            for number in self._prefixed(self.reversed_numbers, term[::-1]):
+                word = number[::-1]
+                found.setdefault(word, PREFIX + len(term) / len(word))
+        elif term.isalpha() and len(term) >= 3:
+            for word, distance in self._misspelled(term):
+                found.setdefault(word, TYPO + 1 - distance / len(term))
+        return found
+
+    def _prefixed(self, ordered: List[str], prefix: str) -> Iterator[str]:
+        position = bisect_left(ordered, prefix)
+        for word in ordered[position:position + self.MAX_EXPANSIONS]:
+            if not word.startswith(prefix):
+                break
+            yield word
+
+    def _misspelled(self, term: str) -> List[Tuple[str, int]]:
+        """Alphabetic index words one typo (two for words over 7 letters) away from term, closest first."""
+        limit = 1 if len(term) <= 7 else 2
+        grams = trigrams(term)
+        shared = Counter()
+        for gram in grams:
+            shared.update(self.trigrams.get(gram, ()))
+        close = []
+        for word, count in shared.items():
+            # A word has as many trigrams as letters, and each edit changes at most 3 of them
+            if count >= max(len(term), len(word)) - 3 * limit and abs(len(word) - len(term)) <= limit \
+                    and word != term:
+                distance = edit_distance(term, word, limit)
+                if distance <= limit:
+                    close.append((distance, word))
+        close.sort()
+        return [(word, distance) for distance, word in close[:self.MAX_EXPANSIONS]]
+
+    def _ranked(self, expansion: Dict[str, float], limit: int) -> List[str]:
+        """IDs for a one-word query: walk the matched words best first and stop once there are enough."""
+        keys, seen = [], set()
+        for word in sorted(expansion, key=lambda word: (-expansion[word], word)):
+            for key in self.postings[word]:
+                if key not in seen:
+                    seen.add(key)
+                    keys.append(key)
+                    if len(keys) == limit:
+                        return keys
+        return keys
+
+    def _intersect(self, expansions: List[Dict[str, float]], limit: int) -> List[str]:
+        """
+        IDs for a query of several words: the records the rarest query word matches, narrowed down by
+        each other query word in turn (set lookups, no set built of their matches), ranked by summed score.
+        """
+        expansions = sorted(expansions, key=lambda expansion: sum(len(self.postings[word]) for word in expansion))
+        candidates = set().union(*(self.postings[word] for word in expansions[0]))
+        scores = {}
+        # The rarest word is scored last, once the others have narrowed its matches down
+        for expansion in expansions[1:] + expansions[:1]:
+            best = self._best_scores(expansion, candidates)
+            scores = {key: scores.get(key, 0.0) + score for key, score in best.items()}
+            candidates = set(best)
+            if not candidates:
+                return []
+        return nlargest(limit, scores, key=scores.get)
+
+    def _best_scores(self, expansion: Dict[str, float], candidates: Set[str]) -> Dict[str, float]:
+        """candidate ID -> score of the best word of the expansion it contains, for those containing one."""
+        best = {}
+        for word in sorted(expansion, key=expansion.get, reverse=True):
+            for key in candidates.intersection(self.postings[word]):
+                best.setdefault(key, expansion[word])
+        return best
@@ -0,0 +1,497 @@
+"""
+    asyncio network service for the Hospital Appointment System.
+
+    One process owns the AppointmentScheduler and serves many clients at once
+    over line-delimited JSON-RPC on TCP. Each request is one JSON line
+    {"id": 1, "method": "book", "params": {...}} and gets back one line
+    {"id": 1, "result": ...} or {"id": 1, "error": "..."}.
+
+    Scheduler operations are in-memory and run on the event loop. Their
+    changes are collected by a BatchWriter and written to the storage backend
+    in batches on a worker thread (group commit), so the loop never waits on
+    disk and a write request is only answered once its change is durable.
+    Registering a patient runs on a worker thread instead, since it holds the
+    registration lock shared with other processes until its record is written.
+
+    Run the server with:  python service.py [--db hospital.db] [--port 8765] [--metrics metrics.prom]
+    and the CLI as a thin client with:  python HospitalCLI.py --connect localhost:8765
+"""
+import asyncio
+import json
+import signal
+import socket
+import sys
+from typing import Dict, List, Optional, Tuple
+
+from main import AppointmentScheduler, AvailabilityRule, DataManager, Doctor, Patient, Appointment, Waitlist
+from storage import StorageBackend, JSONStorage, SQLiteStorage
+import metrics
+
+
+class BatchWriter:
+    """
+    Collects the scheduler's change records and flushes them to the storage
+    backend in batches, off the event loop. If a flush fails, the in-memory
+    changes it held are undone, so the scheduler never serves what isn't on disk.
+    """
+
+    def __init__(self, storage: StorageBackend, max_delay: float = 0.002):
+        self.storage = storage
+        self.max_delay = max_delay  # How long a flush waits for more changes to join its batch
+        self._pending = []
+        self._transactions = []  # Committed in memory, not yet on disk; rolled back if the flush fails
+        self._waiters = []
+        self._wake = asyncio.Event()
+
+    def append(self, op: str, **fields):
+        """Called by the scheduler for every change (see AppointmentScheduler._record)."""
+        record = {"op": op}
+        record.update(fields)
+        self._pending.append(record)
+        self._wake.set()
+
+    def append_many(self, records):
+        """Called when a scheduler transaction commits; its records join the same batch."""
+        self._pending.extend(records)
+        self._wake.set()
+
+    def track(self, transaction):
+        """Keep a committed scheduler transaction until its records are on disk, to undo it if they can't be written."""
+        self._transactions.append(transaction)
+
+    async def commit(self):
+        """Wait until every change appended so far is on disk."""
+        if not self._pending:
+            return
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        self._wake.set()
+        await waiter
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await self._wake.wait()
+            self._wake.clear()
+            await asyncio.sleep(self.max_delay)  # Let concurrent requests join this batch
+            batch, self._pending = self._pending, []
+            transactions, self._transactions = self._transactions, []
+            waiters, self._waiters = self._waiters, []
+            try:
+                if batch:
+                    await loop.run_in_executor(None, self.storage.append_many, batch)
+            except Exception as error:
+                # Changes made while the batch was being written may build on it, so they are undone
+                # too, newest first, and their requests fail with the same error
+                transactions += self._transactions
+                waiters += self._waiters
+                self._pending, self._transactions, self._waiters = [], [], []
+                for transaction in reversed(transactions):
+                    transaction.rollback()
+                for waiter in waiters:
+                    if not waiter.done():
+                        waiter.set_exception(error)
+            else:
+                for waiter in waiters:
+                    if not waiter.done():
+                        waiter.set_result(len(batch))
+
+    def flush(self):
+        """Write whatever is still pending (used on shutdown)."""
+        batch, self._pending = self._pending, []
+        if batch:
+            self.storage.append_many(batch)
+
+
+class SchedulerService:
+    """Exposes AppointmentScheduler operations as JSON-RPC methods named rpc_<method>."""
+
+    # Methods that change data; their reply waits for the batch holding the change to be written
+    WRITE_METHODS = {"register_doctor", "add_slot", "add_rule", "book", "cancel", "reschedule",
+                     "join_waitlist", "leave_waitlist"}
+
+    def __init__(self, scheduler: AppointmentScheduler, storage: StorageBackend):
+        self.scheduler = scheduler
+        self.storage = storage
+        self.writer = BatchWriter(storage)
+
+    async def start(self, host: str = "127.0.0.1", port: int = 8765):
+        self.storage.load(self.scheduler)
+        # Route the scheduler's change records through the batch writer instead of writing them inline
+        self.scheduler.journal = self.writer
+        self._flusher = asyncio.create_task(self.writer.run())
+        self.server = await asyncio.start_server(self.handle_client, host, port)
+        print(f"Hospital service listening on {host}:{port}")
+        return self.server
+
+    async def stop(self):
+        self.server.close()
+        await self.server.wait_closed()
+        self._flusher.cancel()
+        self.writer.flush()
+        self.storage.save(self.scheduler)
+        self.storage.close()
+
+    async def handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                response = await self.handle_request(line)
+                writer.write(json.dumps(response).encode() + b"\n")
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def handle_request(self, line: bytes) -> Dict:
+        request_id = None
+        try:
+            request = json.loads(line)
+            request_id = request.get("id")
+            method = getattr(self, "rpc_" + request["method"], None)
+            if method is None:
+                return {"id": request_id, "error": f"Unknown method '{request['method']}'."}
+            if request["method"] in self.WRITE_METHODS:
+                # One transaction per request, kept by the writer until the batch holding it is written
+                with self.scheduler.transaction() as transaction:
+                    result = method(**request.get("params", {}))
+                self.writer.track(transaction)
+                await self.writer.commit()
+            else:
+                result = method(**request.get("params", {}))
+                if asyncio.iscoroutine(result):
+                    result = await result
+            return {"id": request_id, "result": result}
+        except Exception as error:
+            return {"id": request_id, "error": str(error)}
+
+    # --------------------------
+    # RPC methods
+    # --------------------------
+    def _appointment_entry(self, appointment: Appointment) -> Dict:
+        return {
+            "appointment": DataManager.appointment_to_dict(appointment),
+            "patient": DataManager.patient_to_dict(appointment.patient),
+            "doctor": DataManager.doctor_to_dict(appointment.doctor),
+        }
+
+    async def rpc_register_patient(self, patient: Dict) -> str:
+        new_patient = DataManager.patient_from_dict(patient)
+        await asyncio.get_running_loop().run_in_executor(None, self._register_patient, new_patient)
+        return new_patient.person_id
+
+    def _register_patient(self, patient: Patient):
+        # On a worker thread: taking the registration lock and catching up on other processes'
+        # patients touch the disk. The record is written straight to the storage backend, not
+        # through the batch writer, so the lock is held until it is durable and no other process
+        # can register the same card in between. If the write fails, the registration is undone.
+        with self.scheduler.registration(), self.scheduler.transaction(journal=self.storage):
+            self.scheduler.add_patient(patient)
+
+    def rpc_register_doctor(self, doctor: Dict) -> str:
+        new_doctor = DataManager.doctor_from_dict(doctor)
+        self.scheduler.add_doctor(new_doctor)
+        return new_doctor.person_id
+
+    def rpc_add_slot(self, doctor_id: str, date: str, time: str) -> bool:
+        doctor = self.scheduler.get_doctor(doctor_id)
+        if not doctor:
+            raise ValueError("Doctor not found!")
+        self.scheduler.add_doctor_slot(doctor, date, time)
+        return True
+
+    def rpc_add_rule(self, doctor_id: str, rule: Dict) -> bool:
+        doctor = self.scheduler.get_doctor(doctor_id)
+        if not doctor:
+            raise ValueError("Doctor not found!")
+        return self.scheduler.add_availability_rule(doctor, AvailabilityRule.from_dict(rule))
+
+    def rpc_get_patient(self, patient_id: str = None, card_no=None) -> Optional[Dict]:
+        if patient_id is not None:
+            patient = self.scheduler.get_patient(patient_id)
+        else:
+            patient = self.scheduler.get_patient_by_card_no(card_no)
+        return DataManager.patient_to_dict(patient) if patient else None
+
+    def rpc_get_doctor(self, doctor_id: str) -> Optional[Dict]:
+        doctor = self.scheduler.get_doctor(doctor_id)
+        return DataManager.doctor_to_dict(doctor) if doctor else None
+
+    def rpc_list_patients(self) -> List[Dict]:
+        return [DataManager.patient_to_dict(patient) for patient in self.scheduler.patients]
+
+    def rpc_list_doctors(self) -> List[Dict]:
+        return [DataManager.doctor_to_dict(doctor) for doctor in self.scheduler.doctors]
+
+    def rpc_search_patients(self, query: str, limit: int = 10) -> List[Dict]:
+        return [DataManager.patient_to_dict(patient) for patient in self.scheduler.search_patients(query, limit)]
+
+    def rpc_search_doctors(self, query: str, limit: int = 10) -> List[Dict]:
+        return [DataManager.doctor_to_dict(doctor) for doctor in self.scheduler.search_doctors(query, limit)]
+
+    def rpc_page_patients(self, limit: int = 20, cursor=None, specialization: str = None,
+                          order: str = "registered") -> Dict:
+        patients, cursor = self.scheduler.page_patients(limit, cursor, specialization, order)
+        return {"items": [DataManager.patient_to_dict(patient) for patient in patients], "cursor": cursor}
+
+    def rpc_page_doctors(self, limit: int = 20, cursor=None, specialization: str = None,
+                         order: str = "registered") -> Dict:
+        doctors, cursor = self.scheduler.page_doctors(limit, cursor, specialization, order)
+        return {"items": [DataManager.doctor_to_dict(doctor) for doctor in doctors], "cursor": cursor}
+
+    def rpc_page_appointments(self, limit: int = 20, cursor=None, **filters) -> Dict:
+        appointments, cursor = self.scheduler.page_appointments(limit, cursor, **filters)
+        return {"items": [self._appointment_entry(appointment) for appointment in appointments], "cursor": cursor}
+
+    def rpc_list_appointments(self, patient_id: str = None) -> List[Dict]:
+        if patient_id is not None:
+            appointments = self.scheduler.get_patient_appointments(patient_id)
+        else:
+            appointments = self.scheduler.appointments
+        return [self._appointment_entry(appointment) for appointment in appointments]
+
+    def rpc_book(self, patient_id: str, doctor_id: str, date: str, time: str) -> Optional[Dict]:
+        patient = self.scheduler.get_patient(patient_id)
+        doctor = self.scheduler.get_doctor(doctor_id)
+        if not patient or not doctor:
+            raise ValueError("Patient or doctor not found!")
+        appointment = self.scheduler.book_appointment(patient, doctor, date, time)
+        return self._appointment_entry(appointment) if appointment else None
+
+    def rpc_cancel(self, appointment_id: str) -> bool:
+        found = self.scheduler.get_appointment(appointment_id) is not None
+        self.scheduler.cancel_appointment(appointment_id)
+        return found
+
+    def rpc_reschedule(self, appointment_id: str, date: str, time: str) -> bool:
+        return self.scheduler.reschedule_appointment(appointment_id, date, time) is True
+
+    def rpc_join_waitlist(self, patient_id: str, priority: int = Waitlist.DEFAULT_PRIORITY) -> Dict:
+        patient = self.scheduler.get_patient(patient_id)
+        if patient is None:
+            raise ValueError(f"No patient found with ID {patient_id}")
+        return self.scheduler.join_waitlist(patient, priority)
+
+    def rpc_leave_waitlist(self, patient_id: str) -> bool:
+        return self.scheduler.leave_waitlist(patient_id)
+
+    def rpc_get_waitlist_entry(self, patient_id: str) -> Optional[Dict]:
+        return self.scheduler.get_waitlist_entry(patient_id)
+
+    def rpc_next_available(self, specialization: str, after_date: str = "", after_time: str = "",
+                           until_date: str = "", limit: int = 1) -> List[Dict]:
+        return [
+            {"doctor": DataManager.doctor_to_dict(doctor), "date": slot["date"], "time": slot["time"]}
+            for doctor, slot in self.scheduler.find_next_available(
+                specialization, after_date, after_time, until_date, limit)
+        ]
+
+    def rpc_get_metrics(self) -> Dict:
+        """Metrics recorded since the service started (empty unless it runs with --metrics)."""
+        return metrics.get_metrics()
+
+
+# --------------------------
+# Thin client side
+# --------------------------
+class ServiceClient:
+    """Blocking JSON-RPC client for SchedulerService."""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 8765):
+        self.sock = socket.create_connection((host, port))
+        self.file = self.sock.makefile('rwb')
+        self.next_id = 0
+
+    def call(self, method: str, **params):
+        self.next_id += 1
+        request = {"id": self.next_id, "method": method, "params": params}
+        self.file.write(json.dumps(request).encode() + b"\n")
+        self.file.flush()
+        response = json.loads(self.file.readline())
+        if "error" in response:
+            raise ValueError(response["error"])
+        return response["result"]
+
+    def close(self):
+        self.file.close()
+        self.sock.close()
+
+
+class RemoteScheduler:
+    """
+    Stands in for AppointmentScheduler inside HospitalCLI, forwarding every
+    operation to a SchedulerService. Objects it returns are local copies.
+    """
+
+    def __init__(self, client: ServiceClient):
+        self.client = client
+
+    def _appointment(self, entry: Dict) -> Appointment:
+        patient = DataManager.patient_from_dict(entry["patient"])
+        doctor = DataManager.doctor_from_dict(entry["doctor"])
+        return DataManager.appointment_from_dict(entry["appointment"], patient, doctor)
+
+    @property
+    def patients(self) -> List[Patient]:
+        return [DataManager.patient_from_dict(data) for data in self.client.call("list_patients")]
+
+    @property
+    def doctors(self) -> List[Doctor]:
+        return [DataManager.doctor_from_dict(data) for data in self.client.call("list_doctors")]
+
+    @property
+    def appointments(self) -> List[Appointment]:
+        return [self._appointment(entry) for entry in self.client.call("list_appointments")]
+
+    def add_patient(self, patient: Patient):
+        self.client.call("register_patient", patient=DataManager.patient_to_dict(patient))
+
+    def add_doctor(self, doctor: Doctor):
+        self.client.call("register_doctor", doctor=DataManager.doctor_to_dict(doctor))
+
+    def add_doctor_slot(self, doctor: Doctor, date: str, time: str):
+        self.client.call("add_slot", doctor_id=doctor.person_id, date=date, time=time)
+
+    def add_availability_rule(self, doctor: Doctor, rule: AvailabilityRule) -> bool:
+        return self.client.call("add_rule", doctor_id=doctor.person_id, rule=rule.to_dict())
+
+    def merge_patients(self, patients: List[Patient]) -> int:
+        return 0  # The service owns the patient registry
+
+    def get_patient(self, patient_id: str) -> Optional[Patient]:
+        data = self.client.call("get_patient", patient_id=patient_id)
+        return DataManager.patient_from_dict(data) if data else None
+
+    def get_patient_by_card_no(self, card_no) -> Optional[Patient]:
+        data = self.client.call("get_patient", card_no=card_no)
+        return DataManager.patient_from_dict(data) if data else None
+
+    def get_doctor(self, doctor_id: str) -> Optional[Doctor]:
+        data = self.client.call("get_doctor", doctor_id=doctor_id)
+        return DataManager.doctor_from_dict(data) if data else None
+
+    def search_patients(self, query: str, limit: int = 10) -> List[Patient]:
+        return [DataManager.patient_from_dict(data) for data in
+                self.client.call("search_patients", query=query, limit=limit)]
+
+    def search_doctors(self, query: str, limit: int = 10) -> List[Doctor]:
+        return [DataManager.doctor_from_dict(data) for data in
+                self.client.call("search_doctors", query=query, limit=limit)]
+
+    def get_patient_appointments(self, patient_id: str) -> List[Appointment]:
+        return [self._appointment(entry) for entry in
+                self.client.call("list_appointments", patient_id=patient_id)]
+
+    def page_patients(self, limit: int = 20, cursor=None, specialization: str = None,
+                      order: str = "registered") -> Tuple[List[Patient], Optional[object]]:
+        page = self.client.call("page_patients", limit=limit, cursor=cursor,
+                                specialization=specialization, order=order)
+        return [DataManager.patient_from_dict(data) for data in page["items"]], page["cursor"]
+
+    def page_doctors(self, limit: int = 20, cursor=None, specialization: str = None,
+                     order: str = "registered") -> Tuple[List[Doctor], Optional[object]]:
+        page = self.client.call("page_doctors", limit=limit, cursor=cursor,
+                                specialization=specialization, order=order)
+        return [DataManager.doctor_from_dict(data) for data in page["items"]], page["cursor"]
+
+    def page_appointments(self, limit: int = 20, cursor=None, **filters) -> Tuple[List[Appointment], Optional[object]]:
+        page = self.client.call("page_appointments", limit=limit, cursor=cursor, **filters)
+        return [self._appointment(entry) for entry in page["items"]], page["cursor"]
+
+    def find_next_available(self, specialization: str, after_date: str = "", after_time: str = "",
+                            until_date: str = "", limit: int = 1) -> List[Tuple[Doctor, Dict[str, str]]]:
+        return [
+            (DataManager.doctor_from_dict(entry["doctor"]), {"date": entry["date"], "time": entry["time"]})
+            for entry in self.client.call("next_available", specialization=specialization,
+                                          after_date=after_date, after_time=after_time,
+                                          until_date=until_date, limit=limit)
+        ]
+
+    def book_appointment(self, patient: Patient, doctor: Doctor, date: str, time: str) -> Optional[Appointment]:
+        entry = self.client.call("book", patient_id=patient.person_id, doctor_id=doctor.person_id,
+                                 date=date, time=time)
+        return self._appointment(entry) if entry else None
+
+    def cancel_appointment(self, appointment_id: str):
+        if self.client.call("cancel", appointment_id=appointment_id):
+            print(f"Appointment {appointment_id} has been cancelled.")
+        else:
+            print(f"No appointment found with ID {appointment_id}.")
+
+    def reschedule_appointment(self, appointment_id: str, new_date: str, new_time: str) -> bool:
+        return self.client.call("reschedule", appointment_id=appointment_id, date=new_date, time=new_time)
+
+    def join_waitlist(self, patient: Patient, priority: int = Waitlist.DEFAULT_PRIORITY) -> Dict:
+        return self.client.call("join_waitlist", patient_id=patient.person_id, priority=priority)
+
+    def leave_waitlist(self, patient_id: str) -> bool:
+        return self.client.call("leave_waitlist", patient_id=patient_id)
+
+    def get_waitlist_entry(self, patient_id: str) -> Optional[Dict]:
+        return self.client.call("get_waitlist_entry", patient_id=patient_id)
+
+    def view_appointments(self):
+        cursor = None
+        while True:
+            appointments, cursor = self.page_appointments(500, cursor)
+            if appointments:
+                sys.stdout.write("\n".join(appointment.summary() for appointment in appointments) + "\n")
+            if cursor is None:
+                break
+
+
+class RemoteStorage(StorageBackend):
+    """Storage for a thin client: the service loads and persists everything."""
+
+    def __init__(self, client: ServiceClient):
+        self.client = client
+
+    def load(self, scheduler):
+        pass
+
+    def append(self, op: str, **fields):
+        pass
+
+    def save(self, scheduler):
+        pass
+
+    def close(self):
+        self.client.close()
+
+
+async def serve(storage: StorageBackend, host: str, port: int):
+    service = SchedulerService(AppointmentScheduler(), storage)
+    server = await service.start(host, port)
+    # Shut down cleanly (flush, snapshot, close) on Ctrl+C or `kill`
+    loop = asyncio.get_running_loop()
+    main_task = asyncio.current_task()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, main_task.cancel)
+        except NotImplementedError:
+            pass  # Not supported on Windows; Ctrl+C still raises KeyboardInterrupt there
+    try:
+        async with server:
+            await server.serve_forever()
+    except asyncio.CancelledError:
+        pass
+    finally:
+        await service.stop()
+
+
+if __name__ == "__main__":
+    # Usage: python service.py [--db hospital.db] [--host 127.0.0.1] [--port 8765] [--metrics metrics.prom]
+    args = dict(zip(sys.argv[1::2], sys.argv[2::2]))
+    storage = SQLiteStorage(args["--db"]) if "--db" in args else JSONStorage()
+    if "--metrics" in args:
+        metrics.enable()
+    try:
+        asyncio.run(serve(storage, args.get("--host", "127.0.0.1"), int(args.get("--port", 8765))))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if "--metrics" in args:
+            metrics.write_prometheus(args["--metrics"])
@@ -0,0 +1,282 @@
+"""
+    Binary snapshot format for the Hospital Appointment System.
+
+    The JSON files are the interchange format, but parsing them and building
+    every object is what makes startup slow. After each compaction
+    DataManager.save_snapshot() also writes hospital.snapshot, and startup
+    loads from it whenever it still matches the JSON files.
+
+    Layout:
+        header: magic b"HOSPSNAP" | format version (u32) | directory offset (u64)
+                | directory length (u32) | directory crc32 (u32), little-endian
+        column data, each column 8-byte aligned and covered by its own crc32
+        directory: JSON with the JSON files' stamps, row counts and each column's
+                   encoding, position, length and crc32
+
+    The data is column-oriented: every attribute of every table (patients.name,
+    doctors.specialization, appointments.patient, ...) is stored on its own as
+        int  - an int64 array
+        str  - character offsets (u64) followed by the UTF-8 text of all values
+        cat  - u32 codes into a small str column of distinct values (dates, specializations, ...)
+        json - a str column of JSON-encoded values, for columns of mixed types
+        b16  - 16 raw bytes per row (appointment ids)
+    Doctors' slots (and recurring availability rules) are stored exactly as
+    SlotSchedule packs them in memory, and
+    appointments point at patients and doctors by row number. The file is mapped
+    with mmap, and each column is decoded with a few bulk array operations
+    straight into the entity objects' slots, without any per-record parsing.
+"""
+import gc
+import json
+import mmap
+import os
+import struct
+import sys
+import zlib
+from array import array
+from collections import deque
+from datetime import datetime
+from itertools import repeat
+
+from main import Appointment, AvailabilityRule, Doctor, Patient, SlotSchedule
+
+MAGIC = b"HOSPSNAP"
+FORMAT_VERSION = 2  # 2: values are canonical (ingest validates dates and times)
+HEADER = struct.Struct("<8sIQII")
+CATEGORY_RATIO = 4  # Dictionary-encode a string column when it has at most 1 distinct value per 4 rows
+
+
+class SnapshotError(Exception):
+    """The snapshot can't be used: damaged, written by another format version, or older than the JSON files."""
+
+
+# --------------------------
+# Writing
+# --------------------------
+def _pad(data: bytes) -> bytes:
+    return data + b"\0" * (-len(data) % 8)
+
+
+def _pack_strings(values) -> bytes:
+    offsets = array('Q', [0])
+    total = 0
+    for value in values:
+        total += len(value)
+        offsets.append(total)
+    return offsets.tobytes() + "".join(values).encode('utf-8')
+
+
+def _encode_column(values):
+    """Pick the most compact encoding for a column. Returns (kind, data, extra directory fields)."""
+    if all(type(value) is bytes and len(value) == 16 for value in values):
+        return "b16", b"".join(values), {}
+    if all(type(value) is int for value in values):
+        try:
+            return "int", array('q', values).tobytes(), {}
+        except OverflowError:
+            pass  # Too big for int64; stored as JSON below
+    if all(type(value) is str for value in values):
+        categories = list(dict.fromkeys(values))
+        if len(categories) * CATEGORY_RATIO <= len(values):
+            index = {category: code for code, category in enumerate(categories)}
+            codes = array('I', [index[value] for value in values])
+            return "cat", _pad(codes.tobytes()) + _pack_strings(categories), {"categories": len(categories)}
+        return "str", _pack_strings(values), {}
+    return "json", _pack_strings([json.dumps(value) for value in values]), {}
+
+
+def write_snapshot(path: str, patients, doctors, appointments, stamps):
+    """Write the snapshot atomically (temp file, fsync, os.replace), like DataManager.write_json."""
+    patient_rows = {id(patient): row for row, patient in enumerate(patients)}
+    doctor_rows = {id(doctor): row for row, doctor in enumerate(doctors)}
+    # Appointments whose patient or doctor isn't saved can't be loaded back, as in the JSON files
+    appointments = [appointment for appointment in appointments
+                    if id(appointment.patient) in patient_rows and id(appointment.doctor) in doctor_rows]
+
+    slot_offsets, slot_codes, slot_extras = [0], array('q'), []
+    for doctor in doctors:
+        codes, times, irregular, rules, taken = doctor.schedule.packed()
+        slot_codes.extend(codes)
+        slot_offsets.append(len(slot_codes))
+        slot_extras.append({"times": sorted(times.items()), "irregular": irregular,
+                            "rules": [rule.to_dict() for rule in rules], "taken": taken}
+                           if times or irregular or rules else None)
+
+    columns = {}
+    for attribute in ("name", "contact_info", "age", "gender", "person_id",
+                      "card_no", "date_of_birth", "required_specialization"):
+        columns[f"patients.{attribute}"] = [getattr(patient, attribute) for patient in patients]
+    for attribute in ("name", "contact_info", "age", "gender", "person_id", "specialization"):
+        columns[f"doctors.{attribute}"] = [getattr(doctor, attribute) for doctor in doctors]
+    columns["doctors.slot_offsets"] = slot_offsets
+    columns["doctors.slot_extras"] = slot_extras
+    ids = [appointment._id for appointment in appointments]
+    if all(type(compact_id) is bytes for compact_id in ids):
+        columns["appointments._id"] = ids
+    else:
+        columns["appointments.appointment_id"] = [appointment.appointment_id for appointment in appointments]
+    columns["appointments.patient"] = [patient_rows[id(appointment.patient)] for appointment in appointments]
+    columns["appointments.doctor"] = [doctor_rows[id(appointment.doctor)] for appointment in appointments]
+    for attribute in ("date", "time", "status"):
+        columns[f"appointments.{attribute}"] = [getattr(appointment, attribute) for appointment in appointments]
+
+    directory = {
+        "byteorder": sys.byteorder,
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "stamps": stamps,
+        "counts": {"patients": len(patients), "doctors": len(doctors), "appointments": len(appointments)},
+        "columns": {},
+    }
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(_pad(b"\0" * HEADER.size))  # Filled in once the directory's position is known
+        blobs = [("slots.codes", ("int", slot_codes.tobytes(), {}), len(slot_codes))]
+        blobs += [(name, _encode_column(values), len(values)) for name, values in columns.items()]
+        for name, (kind, data, extra), count in blobs:
+            directory["columns"][name] = dict(extra, kind=kind, count=count, offset=f.tell(),
+                                              length=len(data), crc32=zlib.crc32(data))
+            f.write(_pad(data))
+        encoded = json.dumps(directory).encode('utf-8')
+        directory_offset = f.tell()
+        f.write(encoded)
+        f.seek(0)
+        f.write(HEADER.pack(MAGIC, FORMAT_VERSION, directory_offset, len(encoded), zlib.crc32(encoded)))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+# --------------------------
+# Reading
+# --------------------------
+class _Columns:
+    """Decodes columns out of the mapped file on demand, checking each one's crc32."""
+
+    def __init__(self, buffer, directory):
+        self.buffer = buffer
+        self.entries = directory["columns"]
+        self.swap = directory["byteorder"] != sys.byteorder
+
+    def __contains__(self, name):
+        return name in self.entries
+
+    def _array(self, typecode, data):
+        values = array(typecode)
+        values.frombytes(data)
+        if self.swap:
+            values.byteswap()
+        return values
+
+    def _strings(self, data, count):
+        split = (count + 1) * 8
+        view = memoryview(data)
+        offsets = self._array('Q', view[:split])
+        text = str(view[split:], 'utf-8')
+        return list(map(text.__getitem__, map(slice, offsets[:-1], offsets[1:])))
+
+    def get(self, name):
+        try:
+            entry = self.entries[name]
+        except KeyError:
+            raise SnapshotError(f"column {name} is missing.")
+        data = self.buffer[entry["offset"]:entry["offset"] + entry["length"]]
+        if len(data) != entry["length"] or zlib.crc32(data) != entry["crc32"]:
+            raise SnapshotError(f"column {name} is damaged (checksum mismatch).")
+        kind, count = entry["kind"], entry["count"]
+        if kind == "int":
+            return self._array('q', data)
+        if kind == "b16":
+            return [data[start:start + 16] for start in range(0, 16 * count, 16)]
+        if kind == "str":
+            return self._strings(data, count)
+        if kind == "json":
+            return list(map(json.loads, self._strings(data, count)))
+        if kind == "cat":
+            split = count * 4 + (-count * 4 % 8)
+            categories = [sys.intern(category) for category in self._strings(data[split:], entry["categories"])]
+            return list(map(categories.__getitem__, self._array('I', data[:count * 4])))
+        raise SnapshotError(f"column {name} has an unknown encoding '{kind}'.")
+
+
+def _build(cls, count: int, attributes):
+    """Create `count` objects without running __init__ and fill their slots column by column."""
+    objects = list(map(cls.__new__, repeat(cls, count)))
+    for attribute, values in attributes.items():
+        deque(map(setattr, objects, repeat(attribute), values), maxlen=0)
+    return objects
+
+
+def read_snapshot(path: str, expected_stamps):
+    """
+    Return (patients, doctors, appointments) from the snapshot at path.
+    Raises FileNotFoundError if there is none, and SnapshotError if it can't be used,
+    including when its stamps don't match expected_stamps (the JSON files changed since).
+    """
+    with open(path, 'rb') as f:
+        try:
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            raise SnapshotError("the file is empty.")
+    try:
+        if len(buffer) < HEADER.size:
+            raise SnapshotError("the file is truncated.")
+        magic, version, offset, length, crc = HEADER.unpack_from(buffer)
+        if magic != MAGIC:
+            raise SnapshotError("the file is not a snapshot.")
+        if version != FORMAT_VERSION:
+            raise SnapshotError(f"it uses format version {version}, not {FORMAT_VERSION}.")
+        encoded = buffer[offset:offset + length]
+        if len(encoded) != length or zlib.crc32(encoded) != crc:
+            raise SnapshotError("its directory is damaged (checksum mismatch).")
+        directory = json.loads(encoded)
+        if directory["stamps"] != expected_stamps:
+            raise SnapshotError("the JSON files changed since it was written.")
+        # Creating this many objects would set off the cyclic garbage collector again and again,
+        # although none of them is garbage; pausing it roughly halves the load time
+        collecting = gc.isenabled()
+        gc.disable()
+        try:
+            return _materialize(_Columns(buffer, directory), directory["counts"])
+        finally:
+            if collecting:
+                gc.enable()
+    finally:
+        buffer.close()
+
+
+def _materialize(columns, counts):
+    person = ("name", "contact_info", "age", "gender", "person_id")
+    patients = _build(Patient, counts["patients"], {
+        **{attribute: columns.get(f"patients.{attribute}") for attribute in person},
+        **{attribute: columns.get(f"patients.{attribute}")
+           for attribute in ("card_no", "date_of_birth", "required_specialization")},
+        "_appointments": [[] for _ in range(counts["patients"])],
+    })
+
+    slot_codes = columns.get("slots.codes")
+    offsets = columns.get("doctors.slot_offsets")
+    schedules = []
+    for row, extras in enumerate(columns.get("doctors.slot_extras")):
+        codes = slot_codes[offsets[row]:offsets[row + 1]]
+        if extras is None:
+            schedules.append(SlotSchedule.from_packed(codes))
+        else:
+            rules = [AvailabilityRule.from_dict(rule) for rule in extras.get("rules", [])]
+            schedules.append(SlotSchedule.from_packed(codes, dict(extras["times"]), extras["irregular"],
+                                                      rules, extras.get("taken")))
+    doctors = _build(Doctor, counts["doctors"], {
+        **{attribute: columns.get(f"doctors.{attribute}") for attribute in person},
+        "specialization": columns.get("doctors.specialization"),
+        "schedule": schedules,
+    })
+
+    id_attribute = "_id" if "appointments._id" in columns else "appointment_id"
+    appointments = _build(Appointment, counts["appointments"], {
+        id_attribute: columns.get(f"appointments.{id_attribute}"),
+        "patient": map(patients.__getitem__, columns.get("appointments.patient")),
+        "doctor": map(doctors.__getitem__, columns.get("appointments.doctor")),
+        "date": columns.get("appointments.date"),
+        "time": columns.get("appointments.time"),
+        "status": columns.get("appointments.status"),
+    })
+    return patients, doctors, appointments
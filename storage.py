@@ -0,0 +1,640 @@
+"""
+    Storage backends for the Hospital Appointment System.
+
+    A backend loads the scheduler's data at startup and receives every change
+    the scheduler makes through append(op, **fields) (the same records the
+    journal writes), and can move past appointments into the archive
+    (archive.py). Two backends are available:
+      - JSONStorage: the original JSON files plus the write-ahead journal.
+      - SQLiteStorage: a single SQLite database (stdlib sqlite3) with indexes.
+        Doctors' schedules and appointments stay in the database until they are
+        used, and open-slot queries are answered by it in the meantime.
+"""
+import json
+import os
+import sqlite3
+import sys
+import threading
+from contextlib import contextmanager
+from typing import List, Optional, Tuple
+
+from archive import AppointmentArchive, cutoff_day, is_archivable
+from main import (AppointmentScheduler, AvailabilityRule, DataManager, DataLock, Patient, RegistrationLock,
+                  SlotSchedule, Waitlist, time_to_minutes)
+from journal import Journal
+from patient_store import PatientStore
+
+
+class StorageBackend:
+    """Interface shared by every storage backend."""
+
+    # File locked while patients are registered, by every process using the same data; None if not shared
+    registration_lock_path: Optional[str] = None
+
+    def load(self, scheduler: AppointmentScheduler):
+        """Fill the scheduler with the stored data and start recording its changes."""
+        raise NotImplementedError
+
+    def append(self, op: str, **fields):
+        """Persist a single change made through the scheduler."""
+        raise NotImplementedError
+
+    def append_many(self, records):
+        """Persist several {"op": ..., **fields} records; backends override this to write them at once."""
+        for record in records:
+            fields = dict(record)
+            self.append(fields.pop("op"), **fields)
+
+    def save(self, scheduler: AppointmentScheduler):
+        """Make sure everything the scheduler holds is on disk."""
+        raise NotImplementedError
+
+    def find_patient(self, scheduler: AppointmentScheduler, patient_id: Optional[str] = None,
+                     card_no=None) -> Optional[Patient]:
+        """
+        Look up a patient by ID or card number that the scheduler doesn't hold, e.g. because another
+        process registered them since we loaded, and add them to the scheduler. None if not stored.
+        """
+        return None
+
+    def catch_up(self, scheduler: AppointmentScheduler) -> int:
+        """Add the patients other processes registered since the scheduler loaded. Returns how many."""
+        return 0
+
+    def load_appointments(self, scheduler: AppointmentScheduler, appointment_id: Optional[str] = None,
+                          patient_id: Optional[str] = None, doctor_id: Optional[str] = None,
+                          specialization: Optional[str] = None, start_date: str = "", end_date: str = ""):
+        """
+        Make sure the stored appointments matching every given filter are in the scheduler, for a
+        backend that loads them on demand; with no filter, that is all of them. Dates are inclusive.
+        """
+
+    @contextmanager
+    def registration(self, scheduler: AppointmentScheduler):
+        """
+        Hold the registration lock and catch up once, when the lock is first taken. While it is held no
+        other process can register anyone, so the scheduler's card index is complete until it is released.
+        """
+        if self.registration_lock_path is None:
+            yield
+            return
+        lock = RegistrationLock(self.registration_lock_path)
+        with lock:
+            if lock.outermost:
+                self.catch_up(scheduler)
+            yield
+
+    def archive(self, scheduler: AppointmentScheduler, before: str,
+                archive: Optional[AppointmentArchive] = None) -> int:
+        """
+        Move the stored appointments dated before `before` (YYYY-MM-DD) into the archive and drop
+        them from the scheduler. Returns how many were archived.
+        """
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class JSONStorage(StorageBackend):
+    """
+    patients.json, doctors.json and appointments.json as the snapshot, plus the journal.
+    Compaction also writes hospital.snapshot, a binary copy of the JSON files that loads much faster.
+    With lazy_patients the patients live in patients.jsonl instead (see patient_store.py) and are
+    only parsed when used; the snapshot, which holds every patient, is then neither read nor written.
+    """
+
+    def __init__(self, journal_path: str = 'journal.jsonl', compact_every: int = 500, lazy_patients: bool = False):
+        self.patient_store = PatientStore() if lazy_patients else None
+        self.journal = Journal(journal_path, compact_every, self.patient_store)
+        self.registration_lock_path = os.path.join(os.path.dirname(journal_path), 'registration.lock')
+
+    def load(self, scheduler: AppointmentScheduler):
+        # Hold the shared lock so no other process compacts between reading the snapshot and the journal
+        with DataLock():
+            # The binary snapshot is much faster to load, and is used whenever it matches the JSON files
+            snapshot = DataManager.load_snapshot() if self.patient_store is None else None
+            if snapshot is not None:
+                scheduler.patients, scheduler.doctors, scheduler.appointments = snapshot
+            else:
+                if self.patient_store is not None:
+                    scheduler.patients = self.patient_store.open().patients()
+                else:
+                    scheduler.patients = DataManager.load_patients_from_json()
+                scheduler.doctors = DataManager.load_doctors_from_json()
+                scheduler.appointments = DataManager.load_appointments_from_json(
+                    scheduler.patients, scheduler.doctors
+                )
+            scheduler.waitlist = DataManager.load_waitlist_from_json()
+            # Build the lookup indexes for the freshly loaded lists
+            scheduler.rebuild_indexes()
+            # Re-apply changes made since the last snapshot, then keep journaling
+            self.journal.replay(scheduler)
+        self.journal.attach(scheduler)
+        scheduler.storage = self
+
+    def find_patient(self, scheduler: AppointmentScheduler, patient_id: Optional[str] = None,
+                     card_no=None) -> Optional[Patient]:
+        self.catch_up(scheduler)
+        if patient_id is not None:
+            return scheduler.get_patient(patient_id)
+        return scheduler.get_patient_by_card_no(card_no)
+
+    def catch_up(self, scheduler: AppointmentScheduler) -> int:
+        # Other processes' registrations are in the journal, or in the snapshot once compacted
+        # (the patient store finds the patients appended to patients.jsonl by itself)
+        return self.journal.catch_up(scheduler)
+
+    def append(self, op: str, **fields):
+        self.journal.append(op, **fields)
+
+    def append_many(self, records):
+        self.journal.append_many(records)
+
+    def save(self, scheduler: AppointmentScheduler):
+        # Compaction writes the snapshot and empties the journal
+        self.journal.compact()
+
+    def archive(self, scheduler: AppointmentScheduler, before: str,
+                archive: Optional[AppointmentArchive] = None) -> int:
+        # Compaction rebuilds the data from disk, so other processes' appointments are archived too
+        archived = self.journal.compact(archive or AppointmentArchive(), before)
+        scheduler.drop_appointments(archived)
+        return len(archived)
+
+    def close(self):
+        self.journal.close()
+        if self.patient_store is not None:
+            self.patient_store.close()
+
+
+class StoredSchedule(SlotSchedule):
+    """
+    A doctor's schedule that is still in the database. The first read or change of it loads the
+    doctor's slots, and adds their appointments to the scheduler, so a doctor's schedule and
+    appointments are either both in memory or both only in the database. Until then SQLiteStorage
+    lists its open slots, unless the doctor has recurring rules, which only a SlotSchedule expands.
+    """
+    __slots__ = ("_load", "_ruled")
+
+    def __init__(self, load, ruled: bool = False):
+        self.lock = threading.RLock()
+        self._load = load  # Returns the loaded SlotSchedule; None once it has run
+        self._ruled = ruled
+
+    def __getattr__(self, name):
+        # Only called for the attributes SlotSchedule.__init__ would have set, while they are unset
+        if name not in SlotSchedule.__slots__:
+            raise AttributeError(name)
+        self.load()
+        return object.__getattribute__(self, name)
+
+    @property
+    def stored(self) -> bool:
+        """Whether the database can still list this schedule's open slots instead of memory."""
+        return self._load is not None and not self._ruled
+
+    def load(self):
+        if self._load is None:
+            return
+        with self.lock:
+            if self._load is None:  # Another thread loaded it while we waited
+                return
+            loaded = self._load()
+            for name in SlotSchedule.__slots__:
+                if name != "lock":
+                    setattr(self, name, getattr(loaded, name))
+            self._load = None
+
+
+class SQLiteStorage(StorageBackend):
+    """
+    Stores everything in one SQLite database in WAL mode.
+    Each change is written (and committed) as it happens, so save() has nothing left to do.
+    Doctors' schedules and appointments are only read when they are used (see StoredSchedule).
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS patients (
+            patient_id TEXT PRIMARY KEY,
+            name TEXT,
+            contact_info,
+            age INTEGER,
+            gender TEXT,
+            card_no,
+            date_of_birth TEXT,
+            required_specialization TEXT
+        );
+        CREATE TABLE IF NOT EXISTS doctors (
+            doctor_id TEXT PRIMARY KEY,
+            name TEXT,
+            contact_info,
+            age INTEGER,
+            gender TEXT,
+            specialization TEXT
+        );
+        CREATE TABLE IF NOT EXISTS slots (
+            doctor_id TEXT NOT NULL REFERENCES doctors(doctor_id),
+            date TEXT NOT NULL,
+            time TEXT NOT NULL,
+            PRIMARY KEY (doctor_id, date, time)
+        );
+        CREATE TABLE IF NOT EXISTS availability_rules (
+            doctor_id TEXT NOT NULL REFERENCES doctors(doctor_id),
+            rule TEXT NOT NULL,
+            PRIMARY KEY (doctor_id, rule)
+        );
+        CREATE TABLE IF NOT EXISTS unavailable_slots (
+            doctor_id TEXT NOT NULL REFERENCES doctors(doctor_id),
+            date TEXT NOT NULL,
+            time TEXT NOT NULL,
+            PRIMARY KEY (doctor_id, date, time)
+        );
+        CREATE TABLE IF NOT EXISTS appointments (
+            appointment_id TEXT PRIMARY KEY,
+            patient_id TEXT NOT NULL REFERENCES patients(patient_id),
+            doctor_id TEXT NOT NULL REFERENCES doctors(doctor_id),
+            date TEXT,
+            time TEXT,
+            status TEXT
+        );
+        CREATE TABLE IF NOT EXISTS waitlist (
+            patient_id TEXT PRIMARY KEY REFERENCES patients(patient_id),
+            specialization TEXT NOT NULL,
+            priority INTEGER NOT NULL,
+            sequence INTEGER NOT NULL,
+            since TEXT,
+            date TEXT,
+            time TEXT
+        );
+        CREATE INDEX IF NOT EXISTS idx_patients_card_no ON patients(card_no);
+        CREATE INDEX IF NOT EXISTS idx_doctors_specialization ON doctors(specialization);
+        CREATE INDEX IF NOT EXISTS idx_slots_date ON slots(date);
+        CREATE INDEX IF NOT EXISTS idx_appointments_patient ON appointments(patient_id);
+        CREATE INDEX IF NOT EXISTS idx_appointments_doctor ON appointments(doctor_id);
+        CREATE INDEX IF NOT EXISTS idx_appointments_slot ON appointments(doctor_id, date, time);
+    """
+
+    def __init__(self, path: str = 'hospital.db'):
+        self.path = path
+        # The connection is shared by every booking thread; _lock serialises its use
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        if path != ':memory:':
+            self.registration_lock_path = f"{path}-registration.lock"
+        self._patients_seen = 0  # Highest patients rowid read into the scheduler (see catch_up)
+        self._all_appointments = False  # Whether load_appointments() has already loaded every appointment
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")  # Safe with WAL, and avoids an fsync per commit
+        self.conn.executescript(self.SCHEMA)
+        # Databases from before waitlist entries recorded the slot the patient asked for
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(waitlist)")}
+        for column in ("date", "time"):
+            if column not in columns:
+                self.conn.execute(f"ALTER TABLE waitlist ADD COLUMN {column} TEXT")
+        self.conn.commit()
+
+    # --------------------------
+    # Loading
+    # --------------------------
+    def load(self, scheduler: AppointmentScheduler):
+        # Slots and appointments stay in the database until a doctor's schedule is used
+        ruled = {row[0] for row in self.conn.execute("SELECT DISTINCT doctor_id FROM availability_rules")}
+        self._all_appointments = False
+
+        # Read first: rows inserted meanwhile come after it, so catch_up() finds them
+        self._patients_seen = self.conn.execute("SELECT COALESCE(MAX(rowid), 0) FROM patients").fetchone()[0]
+        scheduler.patients = DataManager.ingest(
+            map(self._patient_record, self.conn.execute("SELECT * FROM patients")),
+            DataManager.patient_from_dict, self.path
+        )
+        scheduler.doctors = DataManager.ingest((
+            {
+                "doctor_id": row[0], "name": row[1], "contact_info": row[2], "age": row[3],
+                "gender": row[4], "specialization": row[5], "schedule": []
+            }
+            for row in self.conn.execute("SELECT * FROM doctors")
+        ), DataManager.doctor_from_dict, self.path)
+        for doctor in scheduler.doctors:
+            doctor.schedule = self._stored_schedule(scheduler, doctor.person_id, doctor.person_id in ruled)
+        scheduler.appointments = []
+        scheduler.waitlist = Waitlist()
+        for entry in DataManager.ingest((
+            {"patient_id": row[0], "specialization": row[1], "priority": row[2], "sequence": row[3], "since": row[4],
+             "date": row[5], "time": row[6]}
+            for row in self.conn.execute(
+                "SELECT patient_id, specialization, priority, sequence, since, date, time FROM waitlist")
+        ), DataManager.waitlist_entry_from_dict, self.path):
+            scheduler.waitlist.add(entry)
+        scheduler.rebuild_indexes()
+        self.attach(scheduler)
+
+    @staticmethod
+    def _patient_record(row):
+        """A patients row as the record DataManager.patient_from_dict reads."""
+        return {
+            "patient_id": row[0], "name": row[1], "contact_info": row[2], "age": row[3],
+            "gender": row[4], "card_no": row[5], "date_of_birth": row[6],
+            "Specialization of Doctor Needed": row[7]
+        }
+
+    def _stored_schedule(self, scheduler: AppointmentScheduler, doctor_id: str, ruled: bool) -> StoredSchedule:
+        return StoredSchedule(lambda: self._load_schedule(scheduler, doctor_id), ruled)
+
+    def _load_schedule(self, scheduler: AppointmentScheduler, doctor_id: str) -> SlotSchedule:
+        """Read a doctor's schedule, and add their appointments to the scheduler (see StoredSchedule)."""
+        with self._lock:
+            slots = [{"date": date, "time": time} for date, time in self.conn.execute(
+                "SELECT date, time FROM slots WHERE doctor_id = ?", (doctor_id,))]
+            rules = [json.loads(rule) for rule, in self.conn.execute(
+                "SELECT rule FROM availability_rules WHERE doctor_id = ?", (doctor_id,))]
+            unavailable = [{"date": date, "time": time} for date, time in self.conn.execute(
+                "SELECT date, time FROM unavailable_slots WHERE doctor_id = ?", (doctor_id,))]
+            appointments = self.conn.execute("SELECT * FROM appointments WHERE doctor_id = ?", (doctor_id,)).fetchall()
+        doctor = scheduler.get_doctor(doctor_id)
+        slots, rejected = DataManager.ingest_slots(slots)
+        unavailable, _ = DataManager.ingest_slots(unavailable)
+        if rejected:
+            print(f"Rejected {rejected} slot(s) of Dr. {doctor.name} with an invalid date or time.")
+        for row in appointments:
+            # Registered by another process since we loaded, if the scheduler doesn't know them yet
+            patient = scheduler.get_patient(row[1]) or self.find_patient(scheduler, patient_id=row[1])
+            if patient:
+                try:
+                    scheduler.add_appointment(DataManager.appointment_from_dict({
+                        "appointment_id": row[0], "date": row[3], "time": row[4], "status": row[5]
+                    }, patient, doctor))
+                except ValueError as error:
+                    print(f"Rejected a record in {self.path}: {error}")
+        return SlotSchedule(slots, [AvailabilityRule.from_dict(rule) for rule in rules], unavailable)
+
+    def attach(self, scheduler: AppointmentScheduler):
+        """Write every change made through the scheduler, and look up patients other processes stored."""
+        scheduler.journal = self
+        scheduler.storage = self
+
+    # --------------------------
+    # Writing
+    # --------------------------
+    def _insert_patient(self, data):
+        self.conn.execute(
+            "INSERT OR REPLACE INTO patients VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (data["patient_id"], data["name"], data["contact_info"], data["age"], data["gender"],
+             data["card_no"], data["date_of_birth"], data["Specialization of Doctor Needed"])
+        )
+
+    def _insert_doctor(self, data):
+        self.conn.execute(
+            "INSERT OR REPLACE INTO doctors VALUES (?, ?, ?, ?, ?, ?)",
+            (data["doctor_id"], data["name"], data["contact_info"], data["age"], data["gender"],
+             data["specialization"])
+        )
+        self.conn.executemany(
+            "INSERT OR IGNORE INTO slots VALUES (?, ?, ?)",
+            [(data["doctor_id"], slot["date"], slot["time"]) for slot in data["schedule"]]
+        )
+        for rule in data.get("availability_rules", []):
+            self._insert_rule(data["doctor_id"], rule)
+        self.conn.executemany(
+            "INSERT OR IGNORE INTO unavailable_slots VALUES (?, ?, ?)",
+            [(data["doctor_id"], slot["date"], slot["time"]) for slot in data.get("unavailable", [])]
+        )
+
+    def _insert_rule(self, doctor_id: str, rule):
+        self.conn.execute("INSERT OR IGNORE INTO availability_rules VALUES (?, ?)",
+                          (doctor_id, json.dumps(rule, sort_keys=True)))
+
+    def _take_slot(self, doctor_id: str, date: str, time: str):
+        """A booked slot leaves the single slots, and is remembered as taken if the doctor has rules."""
+        self.conn.execute("DELETE FROM slots WHERE doctor_id = ? AND date = ? AND time = ?",
+                          (doctor_id, date, time))
+        self.conn.execute(
+            """
+            INSERT OR IGNORE INTO unavailable_slots
+            SELECT ?, ?, ? WHERE EXISTS (SELECT 1 FROM availability_rules WHERE doctor_id = ?)
+            """,
+            (doctor_id, date, time, doctor_id)
+        )
+
+    def _free_slot(self, doctor_id: str, date: str, time: str):
+        self.conn.execute("INSERT OR IGNORE INTO slots VALUES (?, ?, ?)", (doctor_id, date, time))
+        self.conn.execute("DELETE FROM unavailable_slots WHERE doctor_id = ? AND date = ? AND time = ?",
+                          (doctor_id, date, time))
+
+    def _insert_appointment(self, data):
+        self.conn.execute(
+            "INSERT OR REPLACE INTO appointments VALUES (?, ?, ?, ?, ?, ?)",
+            (data["appointment_id"], data["patient_id"], data["doctor_id"], data["date"],
+             data["time"], data["status"])
+        )
+
+    def _insert_waitlist_entry(self, entry):
+        self.conn.execute(
+            "INSERT OR REPLACE INTO waitlist VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (entry["patient_id"], entry["specialization"], entry["priority"], entry["sequence"], entry["since"],
+             entry.get("date"), entry.get("time"))
+        )
+
+    def append(self, op: str, **fields):
+        with self._lock, self.conn:  # One transaction per change
+            self._apply(op, fields)
+
+    def append_many(self, records):
+        with self._lock, self.conn:  # One transaction for the whole batch
+            for record in records:
+                fields = dict(record)
+                self._apply(fields.pop("op"), fields)
+
+    def _apply(self, op: str, fields):
+        """Apply one change; the caller owns the transaction."""
+        if op == "add_patient":
+            self._insert_patient(fields["patient"])
+        elif op == "add_doctor":
+            self._insert_doctor(fields["doctor"])
+        elif op == "add_slot":
+            self._free_slot(fields["doctor_id"], fields["date"], fields["time"])
+        elif op == "add_rule":
+            self._insert_rule(fields["doctor_id"], fields["rule"])
+        elif op == "book":
+            data = fields["appointment"]
+            self._insert_appointment(data)
+            self._take_slot(data["doctor_id"], data["date"], data["time"])
+        elif op == "cancel":
+            row = self.conn.execute(
+                "SELECT doctor_id, date, time, status FROM appointments WHERE appointment_id = ?",
+                (fields["appointment_id"],)
+            ).fetchone()
+            if row and row[3] == "Scheduled":
+                self._free_slot(row[0], row[1], row[2])  # The slot is open to other patients again
+            # Cancelled appointments are dropped, like they are from the JSON snapshot
+            self.conn.execute("DELETE FROM appointments WHERE appointment_id = ?",
+                              (fields["appointment_id"],))
+        elif op == "reschedule":
+            row = self.conn.execute(
+                "SELECT doctor_id, date, time FROM appointments WHERE appointment_id = ?",
+                (fields["appointment_id"],)
+            ).fetchone()
+            if row:
+                doctor_id, old_date, old_time = row
+                self._free_slot(doctor_id, old_date, old_time)
+                self._take_slot(doctor_id, fields["date"], fields["time"])
+                self.conn.execute("UPDATE appointments SET date = ?, time = ? WHERE appointment_id = ?",
+                                  (fields["date"], fields["time"], fields["appointment_id"]))
+        elif op == "wait":
+            self._insert_waitlist_entry(fields["entry"])
+        elif op == "unwait":
+            self.conn.execute("DELETE FROM waitlist WHERE patient_id = ?", (fields["patient_id"],))
+        else:
+            print(f"Unknown storage operation '{op}'. Skipping it.")
+
+    def save_all(self, patients, doctors, appointments, waitlist=()):
+        """Write full lists in a single transaction (used by the migration)."""
+        with self.conn:
+            for patient in patients:
+                self._insert_patient(DataManager.patient_to_dict(patient))
+            for doctor in doctors:
+                self._insert_doctor(DataManager.doctor_to_dict(doctor))
+            for appointment in appointments:
+                self._insert_appointment(DataManager.appointment_to_dict(appointment))
+            for entry in waitlist:
+                self._insert_waitlist_entry(entry)
+
+    def save(self, scheduler: AppointmentScheduler):
+        self.conn.commit()  # Changes are already written as they happen
+
+    def archive(self, scheduler: AppointmentScheduler, before: str,
+                archive: Optional[AppointmentArchive] = None) -> int:
+        archive = archive or AppointmentArchive()
+        before_day = cutoff_day(before)
+        columns = ("appointment_id", "patient_id", "doctor_id", "date", "time", "status")
+        with self._lock, self.conn:
+            records = [dict(zip(columns, row)) for row in self.conn.execute(
+                "SELECT appointment_id, patient_id, doctor_id, date, time, status FROM appointments")
+                if is_archivable(row[3], row[5], before_day)]
+            # Stored before the rows are deleted, so a failure never loses an appointment
+            archive.store(records)
+            self.conn.executemany("DELETE FROM appointments WHERE appointment_id = ?",
+                                  [(record["appointment_id"],) for record in records])
+        scheduler.drop_appointments(record["appointment_id"] for record in records)
+        return len(records)
+
+    def close(self):
+        self.conn.close()
+
+    # --------------------------
+    # Lookups
+    # --------------------------
+    def find_patient(self, scheduler: AppointmentScheduler, patient_id: Optional[str] = None,
+                     card_no=None) -> Optional[Patient]:
+        if patient_id is not None:
+            query, params = "SELECT * FROM patients WHERE patient_id = ?", (patient_id,)
+        else:
+            card = str(card_no).strip()
+            # Card numbers are stored as they were entered, as text or as a number
+            query, params = "SELECT * FROM patients WHERE card_no IN (?, ?) LIMIT 1", (
+                card, int(card) if card.isdigit() else card)
+        with self._lock:
+            row = self.conn.execute(query, params).fetchone()
+        if row is None:
+            return None
+        patient = DataManager.patient_from_dict(self._patient_record(row))
+        scheduler.merge_patients([patient])
+        return scheduler.get_patient(patient.person_id)
+
+    def load_appointments(self, scheduler: AppointmentScheduler, appointment_id: Optional[str] = None,
+                          patient_id: Optional[str] = None, doctor_id: Optional[str] = None,
+                          specialization: Optional[str] = None, start_date: str = "", end_date: str = ""):
+        # Loads the schedules of the doctors the matching appointments are with, which brings the appointments along
+        if self._all_appointments:
+            return
+        conditions, params = [], []
+        for column, value in (("appointment_id", appointment_id), ("patient_id", patient_id),
+                              ("doctor_id", doctor_id)):
+            if value is not None:
+                conditions.append(f"{column} = ?")
+                params.append(str(value))
+        if specialization is not None:
+            conditions.append("doctor_id IN (SELECT doctor_id FROM doctors WHERE specialization = ?)")
+            params.append(specialization)
+        if start_date:
+            conditions.append("date >= ?")
+            params.append(start_date)
+        if end_date:
+            conditions.append("date <= ?")
+            params.append(end_date)
+        where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+        with self._lock:
+            doctor_ids = [row[0] for row in self.conn.execute(
+                f"SELECT DISTINCT doctor_id FROM appointments{where}", params)]
+        for doctor_id in doctor_ids:
+            doctor = scheduler.get_doctor(doctor_id)
+            if doctor is not None and isinstance(doctor.schedule, StoredSchedule):
+                doctor.schedule.load()
+        if not conditions:
+            self._all_appointments = True
+
+    def find_open_slots(self, specialization: str, date: str) -> List[Tuple[str, str, str]]:
+        """
+        Return (doctor_id, date, time) for every slot of the specialization's doctors stored as open on
+        the date, by time. Single slots only: the slots of recurring rules are never stored.
+        """
+        with self._lock:
+            # CROSS JOIN keeps this order: the specialization's doctors, then each one's (doctor_id, date) range
+            rows = self.conn.execute(
+                """
+                SELECT s.doctor_id, s.date, s.time
+                FROM doctors d CROSS JOIN slots s ON s.doctor_id = d.doctor_id AND s.date = ?
+                WHERE d.specialization = ?
+                """,
+                (date, specialization)
+            ).fetchall()
+        # Times are text ("10:00 AM" sorts before "9:00 AM"), so they are ordered as minutes here
+        return sorted(rows, key=lambda row: time_to_minutes(row[2]))
+
+    def next_open_date(self, specialization: str, date: str = "") -> Optional[str]:
+        """The first date on or after `date` with a stored open slot of the specialization, or None."""
+        with self._lock:
+            # The inner MIN is one lookup in the (doctor_id, date, time) key per doctor
+            return self.conn.execute(
+                """
+                SELECT MIN((SELECT MIN(s.date) FROM slots s WHERE s.doctor_id = d.doctor_id AND s.date >= ?))
+                FROM doctors d WHERE d.specialization = ?
+                """,
+                (date, specialization)
+            ).fetchone()[0]
+
+    def catch_up(self, scheduler: AppointmentScheduler) -> int:
+        # Every insert (or replace) gets a higher rowid than the rows already read
+        with self._lock:
+            rows = self.conn.execute("SELECT rowid, * FROM patients WHERE rowid > ? ORDER BY rowid",
+                                     (self._patients_seen,)).fetchall()
+        if not rows:
+            return 0
+        self._patients_seen = rows[-1][0]
+        return scheduler.merge_patients(DataManager.ingest(
+            (self._patient_record(row[1:]) for row in rows), DataManager.patient_from_dict, self.path))
+
+
+def migrate_json_to_sqlite(db_path: str = 'hospital.db', lazy_patients: Optional[bool] = None) -> SQLiteStorage:
+    """
+    One-shot copy of the JSON storage into a SQLite database. The data is loaded the way JSONStorage
+    loads it (binary snapshot or JSON files, then the journal replayed), so changes not compacted yet
+    are copied too. Patients come from the patient store (patients.jsonl) if there is one.
+    """
+    if lazy_patients is None:
+        lazy_patients = os.path.exists(PatientStore().path)
+    source, scheduler = JSONStorage(compact_every=0, lazy_patients=lazy_patients), AppointmentScheduler()
+    try:
+        source.load(scheduler)
+        storage = SQLiteStorage(db_path)
+        storage.save_all(scheduler.patients, scheduler.doctors, scheduler.appointments, scheduler.waitlist)
+        print(f"Migrated {len(scheduler.patients)} patients, {len(scheduler.doctors)} doctors, "
+              f"{len(scheduler.appointments)} appointments and {len(scheduler.waitlist)} waitlist entries to {db_path}.")
+    finally:
+        source.close()
+    return storage
+
+
+if __name__ == "__main__":
+    # Usage: python storage.py [hospital.db]
+    migrate_json_to_sqlite(sys.argv[1] if len(sys.argv) > 1 else 'hospital.db').close()